@@ -18,6 +18,7 @@ NRML base path
 """
 
 import os
+import hashlib
 from lxml import etree
 
 __version__ = "0.4.5"
@@ -32,7 +33,20 @@ SERIALIZE_NS_MAP = {None: NAMESPACE, 'gml': GML_NAMESPACE}
 
 _NRML_SCHEMA_FILE = 'nrml.xsd'
 
-_NRML_SCHEMA = None  # defined in assert_valid
+_NRML_SCHEMA = None  # defined in nrml_schema
+
+#: Default validation mode of the parsers, used when they are not given
+#: an explicit `validate` argument: True (always validate), False (never
+#: validate, for trusted inputs) or 'once' (validate each distinct file
+#: content once, then trust it; see :func:`check_validation`)
+VALIDATE = True
+
+#: File where the digests of the contents validated in 'once' mode are
+#: stored, to share them between processes; by default they are kept in
+#: memory only
+VALIDATED_CACHE = os.environ.get('NRML_VALIDATED_CACHE')
+
+_VALIDATED = None  # set of digests, defined in _validated_digests
 
 
 class InvalidFile(Exception):
@@ -47,6 +61,17 @@ def nrml_schema_file():
         os.path.abspath(os.path.dirname(__file__)),
         'schema', _NRML_SCHEMA_FILE)
 
+
+def nrml_schema():
+    """
+    Returns the NRML schema as a :class:`lxml.etree.XMLSchema` object;
+    the schema is parsed only once per process.
+    """
+    global _NRML_SCHEMA
+    if _NRML_SCHEMA is None:
+        _NRML_SCHEMA = etree.XMLSchema(etree.parse(nrml_schema_file()))
+    return _NRML_SCHEMA
+
 COMPATPARSER = etree.ETCompatXMLParser()
 
 
@@ -56,23 +81,96 @@ def assert_valid(source, parser=COMPATPARSER):
 
     :param source: a filename or a file-like object.
     """
-    global _NRML_SCHEMA
     if isinstance(source, basestring):
         fname = source
         if not os.path.exists(fname):
             raise IOError('[Errno 2] No such file or directory: %r' % fname)
     else:
         fname = getattr(source, 'name', '<%s>' % source.__class__.__name__)
-    if _NRML_SCHEMA is None:  # the nrml schema is parsed only once
-        _NRML_SCHEMA = etree.XMLSchema(etree.parse(nrml_schema_file()))
     try:
         parsed = etree.parse(source, parser)
-        _NRML_SCHEMA.assertValid(parsed)
+        nrml_schema().assertValid(parsed)
     except Exception as e:
         raise InvalidFile('%s:%s' % (fname, e))
     return parsed
 
 
+def _validated_digests():
+    """
+    Returns the set of the digests of the contents already validated,
+    read from :data:`VALIDATED_CACHE` the first time.
+    """
+    global _VALIDATED
+    if _VALIDATED is None:
+        _VALIDATED = set()
+        if VALIDATED_CACHE and os.path.exists(VALIDATED_CACHE):
+            with open(VALIDATED_CACHE) as cache:
+                _VALIDATED.update(line.strip() for line in cache)
+    return _VALIDATED
+
+
+def _digest(fname):
+    """
+    Returns the SHA1 hex digest of the content of a file.
+    """
+    sha1 = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def check_validation(source, validate=None):
+    """
+    Decide if a source must be validated.
+
+    :param source: a filename or a file-like object.
+    :param validate:
+        True, False or 'once'; if None, :data:`VALIDATE` is used. In 'once'
+        mode a file is validated only if its content has not been
+        validated before; file-like objects are always validated.
+    :returns:
+        a pair (validate, digest): the digest is not None only when the
+        validation must be recorded, by calling :func:`mark_validated`
+        after it succeeds.
+    """
+    if validate is None:
+        validate = VALIDATE
+    if validate != 'once':
+        return bool(validate), None
+    if not isinstance(source, basestring):
+        return True, None
+    digest = _digest(source)
+    if digest in _validated_digests():
+        return False, None
+    return True, digest
+
+
+def mark_validated(digest):
+    """
+    Record the digest of a content which has been successfully validated.
+    """
+    if digest is None or digest in _validated_digests():
+        return
+    _validated_digests().add(digest)
+    if VALIDATED_CACHE:
+        with open(VALIDATED_CACHE, 'a') as cache:
+            cache.write(digest + '\n')
+
+
+def validate_source(source, validate=None):
+    """
+    Validate a whole document upfront, according to the validation mode
+    (see :func:`check_validation`), recording it in 'once' mode.
+
+    :raises InvalidFile: if the document must be validated and is invalid
+    """
+    validate, digest = check_validation(source, validate)
+    if validate:
+        assert_valid(source)
+        mark_validated(digest)
+
+
 class NRMLFile(object):
     """
     Context-managed output object which accepts either a path or a file-like
@@ -98,8 +196,86 @@ class NRMLFile(object):
         self._file.close()
 
 
-def iterparse_tree(source, events=('start', 'end')):
-    schema = etree.XMLSchema(etree.parse(nrml_schema_file()))
+def iterparse_tree(source, events=('start', 'end'), tag=None,
+                   validate=True):
+    """
+    Returns a :func:`lxml.etree.iterparse` iterator over a NRML document.
+
+    :param source: a filename or a file-like object.
+    :param events: the events to generate.
+    :param tag:
+        a tag or a collection of tags (see :func:`qualify`); if given, only
+        the events of the elements with these tags are generated, and the
+        other elements are skipped by lxml, without Python callbacks.
+    :param validate: if True, validate the document against the schema.
+    """
+    if isinstance(tag, basestring):
+        tag = qualify(tag)
+    elif tag is not None:
+        tag = sorted(set(qualify(t) for t in tag))
+    schema = nrml_schema() if validate else None
+    return etree.iterparse(source, events=events, tag=tag, schema=schema)
+
+
+def qualify(tag):
+    """
+    Convert a tag into Clark notation. The tag can have a prefix of
+    :data:`PARSE_NS_MAP`; tags without prefix are in the NRML namespace.
 
-    tree = etree.iterparse(source, events=events, schema=schema)
-    return tree
+    >>> qualify('site')
+    '{http://openquake.org/xmlns/nrml/0.4}site'
+    >>> qualify('gml:pos')
+    '{http://www.opengis.net/gml}pos'
+    >>> qualify('{http://www.opengis.net/gml}pos')
+    '{http://www.opengis.net/gml}pos'
+    """
+    if tag.startswith('{'):
+        return tag
+    prefix, _, name = tag.rpartition(':')
+    return '{%s}%s' % (PARSE_NS_MAP[prefix or 'nrml'], name)
+
+
+def iterelements(source, tags, validate=None):
+    """
+    Parse a NRML document incrementally, yielding the elements with the
+    given tags as soon as they are complete, i.e. at their `end` event.
+    The other elements are filtered out by lxml, without Python callbacks.
+    When the next element is requested, the previous one is cleared and
+    its preceding siblings (already processed elements, comments) are
+    deleted, so the memory occupation does not grow with the size of the
+    document. The caller must extract what it needs from an element
+    before asking for the next one.
+
+    :param source: a filename or a file-like object.
+    :param tags: a collection of tags, see :func:`qualify`.
+    :param validate:
+        True, False or 'once', see :func:`check_validation`; if None,
+        :data:`VALIDATE` is used.
+    """
+    validate, digest = check_validation(source, validate)
+    for _, element in iterparse_tree(source, ('end',), tags, validate):
+        yield element
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+    mark_validated(digest)
+
+
+def iterhandle(source, handlers, validate=None):
+    """
+    Streaming engine shared by the parsers: call the handler associated to
+    the tag of each element in `handlers`, at the end event of the element,
+    and yield the results which are not None. See :func:`iterelements`.
+
+    :param source: a filename or a file-like object.
+    :param handlers: a dictionary tag -> callable(element).
+    :param validate: the validation mode, see :func:`iterelements`.
+    """
+    handlers = dict((qualify(tag), handler)
+                    for tag, handler in handlers.iteritems())
+    for element in iterelements(source, handlers, validate):
+        result = handlers[element.tag](element)
+        if result is not None:
+            yield result
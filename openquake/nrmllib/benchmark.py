@@ -0,0 +1,194 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Synthetic NRML documents of any size and measures of the memory
+occupation, used by the tests and by the benchmark scripts in `tools/`.
+"""
+
+import os
+import sys
+import resource
+
+
+def rss():
+    """
+    Return the resident memory of the current process in bytes, read from
+    /proc/self/statm; where it is not available, the peak resident memory
+    given by getrusage is returned instead.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except EnvironmentError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on Mac OS X
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def deep_getsizeof(obj, seen=None):
+    """
+    Return the approximate size in bytes of an object, including the
+    objects it references (lists, dictionaries, instance attributes and
+    slots). Each object is counted only once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_getsizeof(key, seen) + deep_getsizeof(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_getsizeof(item, seen)
+    elif hasattr(obj, '__dict__'):
+        size += deep_getsizeof(obj.__dict__, seen)
+    elif hasattr(obj, '__slots__') and hasattr(obj, '__getstate__'):
+        for value in obj.__getstate__().itervalues():
+            size += deep_getsizeof(value, seen)
+    return size
+
+
+_POINT_SOURCE = '''\
+        <pointSource id="%(id)d" name="point %(id)d" tectonicRegion="%(trt)s">
+            <pointGeometry>
+                <gml:Point>
+                    <gml:pos>%(lon).4f %(lat).4f</gml:pos>
+                </gml:Point>
+                <upperSeismoDepth>0.0</upperSeismoDepth>
+                <lowerSeismoDepth>10.0</lowerSeismoDepth>
+            </pointGeometry>
+            <magScaleRel>WC1994</magScaleRel>
+            <ruptAspectRatio>0.5</ruptAspectRatio>
+            <truncGutenbergRichterMFD aValue="-3.5" bValue="1.0"
+                                      minMag="5.0" maxMag="6.5" />
+            <nodalPlaneDist>
+                <nodalPlane probability="0.3" strike="0.0"
+                            dip="90.0" rake="0.0" />
+                <nodalPlane probability="0.7" strike="90.0"
+                            dip="45.0" rake="90.0" />
+            </nodalPlaneDist>
+            <hypoDepthDist>
+                <hypoDepth probability="0.5" depth="4.0" />
+                <hypoDepth probability="0.5" depth="8.0" />
+            </hypoDepthDist>
+        </pointSource>
+'''
+
+
+def point_source_model(n, trts=('Active Shallow Crust',)):
+    """
+    Generate the XML of a source model with ``n`` point sources on a
+    regular grid of 100 columns, cycling over the given tectonic region
+    types.
+    """
+    sources = [_POINT_SOURCE % dict(id=i, trt=trts[i % len(trts)],
+                                    lon=i % 100 * 0.1, lat=i // 100 * 0.1)
+               for i in xrange(n)]
+    return '''<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4">
+    <sourceModel name="Generated Source Model">
+%s    </sourceModel>
+</nrml>
+''' % ''.join(sources)
+
+
+_SITE_MODEL_HEAD = '''<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4">
+    <siteModel>
+'''
+_SITE_MODEL_TAIL = '''    </siteModel>
+</nrml>
+'''
+
+
+def _site_model_lines(n):
+    yield _SITE_MODEL_HEAD
+    for i in xrange(n):
+        yield ('        <site lon="%.4f" lat="%.4f" vs30="%.1f" '
+               'vs30Type="%s" z1pt0="%.1f" z2pt5="%.1f" />\n' % (
+                   i % 100 * 0.1, i // 100 % 900 * 0.1, 760. + i % 7,
+                   'inferred' if i % 3 == 0 else 'measured',
+                   100. + i % 5, 5. + i % 5 * 0.1))
+    yield _SITE_MODEL_TAIL
+
+
+def site_model(n):
+    """
+    Generate the XML of a site model with ``n`` sites on a regular grid of
+    100 columns; one site in three has an inferred vs30.
+    """
+    return ''.join(_site_model_lines(n))
+
+
+class IterFile(object):
+    """
+    A read-only file-like object returning the strings produced by an
+    iterator, to parse huge documents without storing them.
+    """
+    def __init__(self, strings):
+        self._strings = iter(strings)
+        self._buf = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            try:
+                self._buf += self._strings.next()
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def site_model_file(n):
+    """
+    Returns a file-like object generating the same XML as
+    :func:`site_model` on the fly.
+    """
+    return IterFile(_site_model_lines(n))
+
+
+def hazard_curves(n, levels=20):
+    """
+    Generate the XML of a PGA hazard curve file with ``n`` curves of
+    ``levels`` points each on a regular grid of 100 columns.
+    """
+    imls = ' '.join('%.4e' % (0.005 * 1.3 ** i) for i in range(levels))
+    poes = ' '.join('%.4e' % (0.99 ** i) for i in range(levels))
+    curves = ['''\
+        <hazardCurve>
+            <gml:Point>
+                <gml:pos>%.4f %.4f</gml:pos>
+            </gml:Point>
+            <poEs>%s</poEs>
+        </hazardCurve>
+''' % (i % 100 * 0.1, i // 100 % 900 * 0.1, poes) for i in xrange(n)]
+    return '''<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4">
+    <hazardCurves sourceModelTreePath="b1" gsimTreePath="b1"
+                  investigationTime="50.0" IMT="PGA">
+        <IMLs>%s</IMLs>
+%s    </hazardCurves>
+</nrml>
+''' % (imls, ''.join(curves))
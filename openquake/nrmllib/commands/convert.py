@@ -0,0 +1,286 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+`nrml-convert`: convert many NRML files between the XML, binary and
+GeoJSON forms, in parallel.
+
+The form of a file is given by its extension (see :data:`EXTENSIONS`);
+the output form is given with `--to`. The arguments are files or
+directories; the directories are searched recursively for the files which
+can be converted into the output form. Each file is converted by the
+parser/writer pair registered in :data:`CONVERTERS` for its form, in a
+pool of processes, and the output file is written next to it (or in the
+directory given with `--outdir`, with the same path relative to the
+directory argument), with the extension of the output form:
+
+* XML <-> binary, for any NRML document: the XML file is read in a single
+  pass with :func:`openquake.nrmllib.node.node_from_nrml` and the binary
+  file is written with :func:`openquake.nrmllib.node.node_to_binary`,
+  and the other way around with a streaming XML writer
+* XML <-> GeoJSON, for hazard curves: the curves are read with the
+  parsers and written with the writers of :mod:`openquake.nrmllib.hazard`
+
+The throughput of each file is printed as soon as it is converted, in
+completion order, and a report at the end. The files which would have
+the same output file are not converted. The exit status is 1 if any
+file could not be converted::
+
+ $ nrml-convert -j 8 --to bin output/
+ output/curves-1.xml -> output/curves-1.bin: 21.1 MB in 1.52s, 13.9 MB/s
+ ...
+ converted 10000 files (210.9 MB) in 83.2s: 120.2 files/s, 2.5 MB/s, ...
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import collections
+import multiprocessing
+
+from lxml import etree
+
+import openquake.nrmllib
+from openquake.nrmllib import node
+from openquake.nrmllib.commands.validate import iterfiles
+from openquake.nrmllib.hazard import parsers, writers
+
+#: file extension -> form
+FORMS = {'.xml': 'xml', '.bin': 'bin', '.geojson': 'geojson'}
+
+#: form -> file extension of the output files
+EXTENSIONS = dict((form, ext) for ext, form in FORMS.iteritems())
+
+
+def xml_to_bin(src, dst):
+    """
+    Convert a NRML file into a binary Node tree; the GML prefixes are kept.
+    """
+    root = node.node_from_nrml(src, prefixed=True)
+    with open(dst, 'wb') as out:
+        out.write(node.node_to_binary(root))
+
+
+def bin_to_xml(src, dst):
+    """
+    Convert a binary Node tree generated by :func:`xml_to_bin` into a
+    NRML file.
+    """
+    with open(src, 'rb') as f:
+        root = node.node_from_binary(f.read())
+    with open(dst, 'w') as out:
+        node.node_to_xml(root, out)
+
+
+def hazard_curves_to_geojson(src, dst):
+    """
+    Convert a NRML file with hazard curves into GeoJSON.
+    """
+    try:
+        model = parsers.HazardCurveXMLParser(src).parse()
+    except StopIteration:  # no <hazardCurves>, it must not reach the pool
+        raise ValueError('only hazard curves can be converted into GeoJSON')
+    writers.HazardCurveGeoJSONWriter(dst, **model.metadata).serialize(model)
+
+
+def hazard_curves_to_xml(src, dst):
+    """
+    Convert hazard curves in GeoJSON into a NRML file.
+    """
+    model = parsers.HazardCurveGeoJSONParser(src).parse()
+    writers.HazardCurveXMLWriter(dst, **model.metadata).serialize(model)
+
+
+#: (input form, output form) -> function converting a file name into
+#: another
+CONVERTERS = {
+    ('xml', 'bin'): xml_to_bin,
+    ('bin', 'xml'): bin_to_xml,
+    ('xml', 'geojson'): hazard_curves_to_geojson,
+    ('geojson', 'xml'): hazard_curves_to_xml,
+}
+
+
+def output_name(src, form, outdir=None, base=None):
+    """
+    The name of the file converting `src` into the given form: the same
+    name with the extension of the form, in `outdir` if given, with the
+    path relative to the directory `base` (by default, just the name).
+
+    >>> output_name('a/curves.xml', 'bin', 'out')
+    'out/curves.bin'
+    >>> output_name('in/a/curves.xml', 'bin', 'out', 'in')
+    'out/a/curves.bin'
+    """
+    name = os.path.splitext(src)[0] + EXTENSIONS[form]
+    if outdir:
+        name = os.path.join(outdir, os.path.relpath(name, base) if base
+                            else os.path.basename(name))
+    return name
+
+
+def iterpairs(paths, form, outdir=None):
+    """
+    Yields the pairs (input file, output file) for the given files and
+    for the files found in the given directories which can be converted
+    into `form`. In `outdir`, the files found in a directory keep their
+    path relative to it, so that the files with the same name in
+    different subdirectories do not overwrite each other.
+    """
+    exts = tuple(EXTENSIONS[src] for src, dst in CONVERTERS if dst == form)
+    for path in paths:
+        base = path if os.path.isdir(path) else None
+        for fname in iterfiles([path], exts):
+            yield fname, output_name(fname, form, outdir, base)
+
+
+def convert_file(src, dst):
+    """
+    Convert a single file, with the converter registered for the forms
+    given by the extensions of `src` and `dst`. Any error is turned into
+    a message, since the exceptions cannot always be sent back from the
+    worker processes, and a partial output file is removed.
+
+    :returns:
+        a tuple (src, dst, size in bytes of src, seconds, error message
+        or None)
+    """
+    t0 = time.time()
+    converter = CONVERTERS.get(
+        (FORMS.get(os.path.splitext(src)[1]),
+         FORMS.get(os.path.splitext(dst)[1])))
+    try:
+        if converter is None:
+            raise ValueError('cannot convert into %s' % dst)
+        size = os.path.getsize(src)
+        converter(src, dst)
+    except openquake.nrmllib.InvalidFile as e:
+        error = str(e)
+    except (EnvironmentError, ValueError, KeyError,
+            etree.XMLSyntaxError) as e:
+        error = '%s: %s' % (src, e)
+    except Exception as e:  # a bug, but the other files can be converted
+        error = '%s: %s: %s' % (src, e.__class__.__name__, e)
+    else:
+        return src, dst, size, time.time() - t0, None
+    if converter is not None and os.path.exists(dst):
+        os.remove(dst)
+    return src, dst, 0, time.time() - t0, error
+
+
+def _convert_file(args):
+    """
+    :func:`convert_file` with a single argument, for the pool.
+    """
+    return convert_file(*args)
+
+
+def convert_files(pairs, processes=None, chunksize=1):
+    """
+    Convert the given files in a pool of processes.
+
+    :param pairs: an iterable of pairs (input file, output file)
+    :param processes:
+        number of worker processes; by default the number of CPUs. With
+        a single process the files are converted in the current process.
+    :param chunksize: number of files sent to a worker at a time
+    :returns:
+        an iterator over the tuples returned by :func:`convert_file`,
+        in completion order
+    """
+    if processes == 1:
+        openquake.nrmllib.nrml_schema()
+        for result in itertools.imap(_convert_file, pairs):
+            yield result
+        return
+    # the schema is compiled once in each worker process
+    pool = multiprocessing.Pool(processes, openquake.nrmllib.nrml_schema)
+    try:
+        for result in pool.imap_unordered(_convert_file, pairs, chunksize):
+            yield result
+    finally:
+        # all the results have been read, or the caller gave up
+        pool.terminate()
+        pool.join()
+
+
+def main(argv=None, out=None, err=None):
+    """
+    Entry point of `nrml-convert`; returns the exit status. The
+    throughput of each file is written on `out` and the report on `err`,
+    by default the standard output and error.
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    forms = sorted(EXTENSIONS)
+    parser = argparse.ArgumentParser(
+        description='Convert NRML files between XML, binary and GeoJSON.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='files or directories containing them')
+    parser.add_argument('-t', '--to', required=True, choices=forms,
+                        help='form of the output files')
+    parser.add_argument('-o', '--outdir', default=None,
+                        help='directory of the output files, with the '
+                        'paths relative to the directory arguments '
+                        '(default: the directory of each input file)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: #CPUs)')
+    args = parser.parse_args(argv)
+
+    # the files with the same output file are not converted, since they
+    # would overwrite each other
+    t0 = time.time()
+    nfiles = nbytes = failed = 0
+    pairs = list(iterpairs(args.paths, args.to, args.outdir))
+    outputs = collections.Counter(dst for src, dst in pairs)
+    for src, dst in pairs:
+        if outputs[dst] > 1:
+            nfiles += 1
+            failed += 1
+            out.write('%s: %s is the output of %d files\n' % (
+                src, dst, outputs[dst]))
+    pairs = [(src, dst) for src, dst in pairs if outputs[dst] == 1]
+    if args.outdir:
+        for dirname in set(os.path.dirname(dst) for src, dst in pairs):
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+    for src, dst, size, seconds, error in convert_files(
+            pairs, args.processes):
+        nfiles += 1
+        nbytes += size
+        if error is not None:
+            failed += 1
+            out.write('%s\n' % error)
+        else:
+            out.write('%s -> %s: %.1f MB in %.2fs, %.1f MB/s\n' % (
+                src, dst, size / 1E6, seconds,
+                size / 1E6 / max(seconds, 1E-9)))
+        out.flush()
+    dt = max(time.time() - t0, 1E-9)
+    err.write('converted %d files (%.1f MB) in %.1fs: %.1f files/s, '
+              '%.1f MB/s, %d failed\n' % (
+                  nfiles - failed, nbytes / 1E6, dt, nfiles / dt,
+                  nbytes / 1E6 / dt, failed))
+    return 1 if failed else 0
+
+
+def run():
+    sys.exit(main())
+
+
+if __name__ == '__main__':
+    run()
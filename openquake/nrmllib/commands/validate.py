@@ -0,0 +1,150 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+`nrml-validate`: validate many NRML files against the schema, in parallel.
+
+The arguments are files or directories; the directories are searched
+recursively for `.xml` files. The files are validated in a pool of
+processes, each one compiling the schema once, and the results are
+printed as soon as they are available, in completion order. The exit
+status is 1 if any file is invalid::
+
+ $ nrml-validate -j 8 output/
+ output/hazard/curves-12.xml:Element '{http://...}poEs': ..., line 9
+ validated 10000 files (210.9 MB) in 53.2s: 188.0 files/s, 4.0 MB/s, 1 invalid
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import multiprocessing
+
+import openquake.nrmllib
+
+
+def iterfiles(paths, ext='.xml'):
+    """
+    Yields the given file names and the files with extension `ext` (or
+    with one of the extensions, if it is a tuple) found in the given
+    directories, recursively and in sorted order.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(ext):
+                    yield os.path.join(root, name)
+
+
+def _init_worker():
+    """
+    Compile the schema once in each worker process.
+    """
+    openquake.nrmllib.nrml_schema()
+
+
+def validate_file(fname):
+    """
+    Validate a single file.
+
+    :returns:
+        a triple (fname, size in bytes, error message or None)
+    """
+    try:
+        size = os.path.getsize(fname)
+        openquake.nrmllib.assert_valid(fname)
+    except (openquake.nrmllib.InvalidFile, EnvironmentError) as e:
+        return fname, 0, str(e)
+    return fname, size, None
+
+
+def validate_files(fnames, processes=None, chunksize=4):
+    """
+    Validate the given files in a pool of processes.
+
+    :param fnames: an iterable of file names
+    :param processes:
+        number of worker processes; by default the number of CPUs. With
+        a single process the files are validated in the current process.
+    :param chunksize: number of files sent to a worker at a time
+    :returns:
+        an iterator over the triples returned by :func:`validate_file`,
+        in completion order
+    """
+    if processes == 1:
+        _init_worker()
+        for result in itertools.imap(validate_file, fnames):
+            yield result
+        return
+    pool = multiprocessing.Pool(processes, _init_worker)
+    try:
+        for result in pool.imap_unordered(validate_file, fnames, chunksize):
+            yield result
+    finally:
+        # all the results have been read, or the caller gave up
+        pool.terminate()
+        pool.join()
+
+
+def main(argv=None, out=None, err=None):
+    """
+    Entry point of `nrml-validate`; returns the exit status. The results
+    are written on `out` and the report on `err`, by default the standard
+    output and error.
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    parser = argparse.ArgumentParser(
+        description='Validate NRML files against the schema.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='NRML files or directories containing them')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: #CPUs)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print the valid files too')
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    nfiles = nbytes = invalid = 0
+    for fname, size, error in validate_files(
+            iterfiles(args.paths), args.processes):
+        nfiles += 1
+        nbytes += size
+        if error is not None:
+            invalid += 1
+            out.write('%s\n' % error)
+        elif args.verbose:
+            out.write('%s: OK\n' % fname)
+        out.flush()
+    dt = max(time.time() - t0, 1E-9)
+    err.write('validated %d files (%.1f MB) in %.1fs: %.1f files/s, '
+              '%.1f MB/s, %d invalid\n' % (
+                  nfiles, nbytes / 1E6, dt, nfiles / dt, nbytes / 1E6 / dt,
+                  invalid))
+    return 1 if invalid else 0
+
+
+def run():
+    sys.exit(main())
+
+
+if __name__ == '__main__':
+    run()
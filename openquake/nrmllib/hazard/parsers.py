@@ -21,27 +21,47 @@ See :module:`openquake.nrmllib.models`.
 """
 
 import decimal
+import itertools
 import json
+import mmap
+import multiprocessing
+import re
+import threading
 import warnings
+from cStringIO import StringIO
 from collections import OrderedDict
 
+import numpy
+from lxml import etree
+
 import openquake.nrmllib
 
+from openquake.nrmllib import index
 from openquake.nrmllib import models
 from openquake.nrmllib import utils
 
 
+# compiled XPath objects, keyed by expression
+_XPATHS = {}
+
+
 def _xpath(elem, expr):
     """Helper function for executing xpath queries on an XML element. This
     function uses the default mapping of namespaces (which includes NRML and
-    GML).
+    GML). Each expression is compiled only once, the first time it is used,
+    which is several times faster than calling `elem.xpath` on each source.
 
     :param str expr:
         XPath expression.
     :param elem:
         A :class:`lxml.etree._Element` instance.
     """
-    return elem.xpath(expr, namespaces=openquake.nrmllib.PARSE_NS_MAP)
+    try:
+        xpath = _XPATHS[expr]
+    except KeyError:
+        xpath = _XPATHS[expr] = etree.XPath(
+            expr, namespaces=openquake.nrmllib.PARSE_NS_MAP)
+    return xpath(elem)
 
 
 class FaultGeometryParserMixin(object):
@@ -150,6 +170,81 @@ class FaultGeometryParserMixin(object):
         return pt
 
 
+class SourceFilter(object):
+    """
+    Predicate on the raw source elements of a source model, used by
+    :class:`SourceModelParser` to discard sources before decoding them.
+    Each condition is optional; a source is accepted if it satisfies all
+    the given conditions.
+
+    :param ids:
+        Collection of source IDs to keep.
+    :param trts:
+        Collection of tectonic region types to keep.
+    :param source_types:
+        Collection of source tags to keep, i.e. `pointSource`, `areaSource`,
+        `simpleFaultSource`, `complexFaultSource` or
+        `characteristicFaultSource`.
+    :param bbox:
+        A tuple (min_lon, min_lat, max_lon, max_lat): only the sources
+        whose extent intersects the bounding box are kept. Bounding boxes
+        crossing the International Date Line are not supported.
+    """
+
+    _NRML = '{%s}' % openquake.nrmllib.NAMESPACE
+    _GML = '{%s}' % openquake.nrmllib.GML_NAMESPACE
+    _COMPLEX_GEOM_TAG = _NRML + 'complexFaultGeometry'
+    _CORNER_TAGS = [_NRML + corner for corner in
+                    ('topLeft', 'topRight', 'bottomLeft', 'bottomRight')]
+
+    def __init__(self, ids=None, trts=None, source_types=None, bbox=None):
+        self.ids = None if ids is None else set(ids)
+        self.trts = None if trts is None else set(trts)
+        self.tags = None if source_types is None else set(
+            self._NRML + source_type for source_type in source_types)
+        self.bbox = bbox
+
+    def __call__(self, src_elem):
+        """
+        :param src_elem:
+            :class:`lxml.etree._Element` instance representing a source.
+        :returns:
+            True if the source must be kept, False otherwise.
+        """
+        if self.tags is not None and src_elem.tag not in self.tags:
+            return False
+        if self.ids is not None and src_elem.get('id') not in self.ids:
+            return False
+        if (self.trts is not None and
+                src_elem.get('tectonicRegion') not in self.trts):
+            return False
+        if self.bbox is not None:
+            lons, lats = self._lons_lats(src_elem)
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            return (lons.min() <= max_lon and lons.max() >= min_lon and
+                    lats.min() <= max_lat and lats.max() >= min_lat)
+        return True
+
+    def _lons_lats(self, src_elem):
+        """
+        Extract the longitudes and latitudes of all the points in the
+        geometry of a source element, without decoding the source.
+        """
+        lons, lats = [], []
+        for elem in src_elem.iter(self._GML + 'pos', self._GML + 'posList'):
+            # only the edges of complex fault geometries have depths
+            # (posList -> LineString -> edge -> complexFaultGeometry)
+            edge = elem.getparent().getparent()
+            dims = 3 if edge.getparent().tag == self._COMPLEX_GEOM_TAG else 2
+            coords = numpy.fromstring(elem.text, sep=' ').reshape(-1, dims)
+            lons.extend(coords[:, 0])
+            lats.extend(coords[:, 1])
+        for elem in src_elem.iter(*self._CORNER_TAGS):
+            lons.append(float(elem.get('lon')))
+            lats.append(float(elem.get('lat')))
+        return numpy.array(lons), numpy.array(lats)
+
+
 class SourceModelParser(FaultGeometryParserMixin):
     """NRML source model parser. Reads point sources, area sources, simple
     fault sources, characteristic fault sources, and complex fault sources
@@ -157,6 +252,14 @@ class SourceModelParser(FaultGeometryParserMixin):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param ids, trts, source_types, bbox:
+        Optional filters on the sources, see :class:`SourceFilter`. They are
+        applied on the XML elements, so the sources discarded are never
+        decoded.
+    :param validate:
+        Validation mode, True, False or 'once'; by default
+        :data:`openquake.nrmllib.VALIDATE`, see
+        :func:`openquake.nrmllib.check_validation`.
     """
 
     _SM_TAG = '{%s}sourceModel' % openquake.nrmllib.NAMESPACE
@@ -166,8 +269,11 @@ class SourceModelParser(FaultGeometryParserMixin):
     _COMPLEX_TAG = '{%s}complexFaultSource' % openquake.nrmllib.NAMESPACE
     _CHAR_TAG = '{%s}characteristicFaultSource' % openquake.nrmllib.NAMESPACE
 
-    def __init__(self, source):
+    def __init__(self, source, ids=None, trts=None, source_types=None,
+                 bbox=None, validate=None):
         self.source = source
+        self.validate = validate
+        self.source_filter = SourceFilter(ids, trts, source_types, bbox)
         self._parse_fn_map = {
             self._PT_TAG: self._parse_point_source,
             self._AREA_TAG: self._parse_area,
@@ -176,25 +282,6 @@ class SourceModelParser(FaultGeometryParserMixin):
             self._CHAR_TAG: self._parse_characteristic,
         }
 
-    def _source_gen(self, tree):
-        """Returns a generator which yields source model objects."""
-        for event, element in tree:
-            # We only want to parse data from the 'end' tag, otherwise there is
-            # no guarantee the data will actually be present. We've run into
-            # this issue in the past. See http://bit.ly/lxmlendevent for a
-            # detailed description of the issue.
-            if event == 'end':
-                parse_fn = self._parse_fn_map.get(element.tag, None)
-                if parse_fn is not None:
-                    yield parse_fn(element)
-                    element.clear()
-                    while element.getprevious() is not None:
-                        # Delete previous sibling elements.
-                        # We need to loop here in case there are comments in
-                        # the input file which are considered siblings to
-                        # source elements.
-                        del element.getparent()[0]
-
     @classmethod
     def _set_common_attrs(cls, model, src_elem):
         """Given a source object and a source XML element, set common
@@ -428,22 +515,211 @@ class SourceModelParser(FaultGeometryParserMixin):
         """
         src_model = models.SourceModel()
 
-        tree = openquake.nrmllib.iterparse_tree(self.source)
-
-        for event, element in tree:
-            # Find the <sourceModel> element and get the 'name' attr.
-            if event == 'start':
-                if element.tag == self._SM_TAG:
-                    src_model.name = element.get('name')
-                    break
-            else:
-                # If we get to here, we didn't find the <sourceModel> element.
-                raise ValueError('<sourceModel> element not found.')
+        # The elements come at their end event, so the name is read from
+        # the parent of the first source, or from the <sourceModel> itself
+        # if it has no sources.
+        def source_model(element):
+            src_model.name = element.get('name')
+
+        def source(element):
+            if src_model.name is None:
+                src_model.name = element.getparent().get('name')
+            if self.source_filter(element):
+                return self._parse_fn_map[element.tag](element)
+
+        handlers = dict.fromkeys(self._parse_fn_map, source)
+        handlers[self._SM_TAG] = source_model
+        sources = openquake.nrmllib.iterhandle(
+            self.source, handlers, self.validate)
+        first = list(itertools.islice(sources, 1))
+        if src_model.name is None:
+            # If we get to here, we didn't find the <sourceModel> element.
+            raise ValueError('<sourceModel> element not found.')
+
+        src_model.sources = itertools.chain(first, sources)
 
-        src_model.sources = self._source_gen(tree)
+        return src_model
 
+    def parse_parallel(self, processes=None, chunksize=1000, ordered=True):
+        """Parse the source XML content and generate a source model in object
+        form, by decoding the sources in a pool of worker processes.
+
+        The text of the file is split on the boundaries of the source
+        elements, without parsing it; each worker receives a chunk of
+        sources wrapped in a NRML document, which is parsed, validated and
+        decoded. Only the sources are validated, so the elements of the
+        <sourceModel> which are not sources are silently ignored; for the
+        same reason, in 'once' mode the file is not recorded as validated.
+
+        :param int processes:
+            Number of worker processes (default: the number of CPUs).
+        :param int chunksize:
+            Number of source elements sent to a worker in a single task.
+        :param bool ordered:
+            If True (the default) the sources are generated in the same
+            order as in the file, otherwise as soon as they are decoded.
+        :returns:
+            :class:`openquake.nrmllib.models.SourceModel` instance.
+        """
+        if isinstance(self.source, basestring):
+            with open(self.source, 'rb') as fh:
+                data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = self.source.read()
+
+        match = _SM_START_RE.search(data)
+        if match is None:
+            raise ValueError('<sourceModel> element not found.')
+        header = data[:match.end()]
+        root = _ROOT_START_RE.search(header)
+        footer = '</%ssourceModel></%s>' % (match.group(1) or '',
+                                           root.group(1))
+        src_model = models.SourceModel()
+        src_model.name = etree.fromstring(header + footer)[0].get('name')
+        validate, _ = openquake.nrmllib.check_validation(
+            self.source, self.validate)
+        src_model.sources = _parallel_source_gen(
+            data, match.end(), header, footer, self.source_filter, validate,
+            processes, chunksize, ordered)
         return src_model
 
+    def get_source(self, source_id):
+        """Decode a single source, without parsing the rest of the file.
+
+        The byte offsets of the sources are stored in a sidecar index file
+        (see :class:`openquake.nrmllib.index.NRMLIndex`), built on the first
+        call and reused until the source model file changes.
+
+        :param str source_id:
+            The ID of the source.
+        :returns:
+            A source object from :mod:`openquake.nrmllib.models`.
+        :raises KeyError:
+            If there is no source with the given ID.
+        """
+        if not isinstance(self.source, basestring):
+            raise TypeError('Random access requires a file name, got %r'
+                            % self.source)
+        idx = index.NRMLIndex.get(self.source, index.SOURCE_TAGS)
+        parser = etree.XMLParser(
+            schema=openquake.nrmllib.nrml_schema()
+            if _validate_fragments(self.validate) else None)
+        # the header may end with comments, the source is the last child
+        element = etree.fromstring(idx.document(source_id), parser)[0][-1]
+        return self._parse_fn_map[element.tag](element)
+
+
+_ROOT_START_RE = re.compile(r'<([\w.:-]+)[\s>/]')
+_SM_START_RE = re.compile(r'<([\w.-]+:)?sourceModel(?:\s[^>]*)?>')
+
+
+def _validate_fragments(validate):
+    """
+    Returns True if the fragments of a file read by random access must be
+    validated, according to the validation mode of the parser; in 'once'
+    mode they are, since validating a small document is cheap.
+    """
+    if validate is None:
+        validate = openquake.nrmllib.VALIDATE
+    return bool(validate)
+
+
+def _source_chunks(data, pos, chunksize):
+    """
+    Split the text of a source model in lists of at most `chunksize`
+    source elements, starting from the position `pos`.
+    """
+    chunk = []
+    for start, end in index.scan_items(data, index.SOURCE_TAGS, pos):
+        chunk.append(data[start:end])
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_chunk(header, chunk, footer, source_filter, validate):
+    """
+    Parse, validate (if `validate` is true) and decode a chunk of source
+    elements into source model objects. This runs in the worker processes
+    of :meth:`SourceModelParser.parse_parallel`.
+
+    :returns:
+        a pair (sources, error); lxml errors cannot be pickled, so in case
+        of invalid XML the arguments to rebuild the error are returned.
+    """
+    parser = etree.XMLParser(
+        schema=openquake.nrmllib.nrml_schema() if validate else None)
+    try:
+        root = etree.fromstring(header + ''.join(chunk) + footer, parser)
+    except etree.XMLSyntaxError as exc:
+        return None, (exc.msg, exc.code) + exc.position
+    parse_fn_map = SourceModelParser(None)._parse_fn_map
+    return [parse_fn_map[element.tag](element) for element in root[0]
+            if element.tag in parse_fn_map and source_filter(element)], None
+
+
+def _parse_chunk_star(args):
+    """
+    :func:`_parse_chunk` with a single argument, for the pool.
+    """
+    return _parse_chunk(*args)
+
+
+def _bounded(iterable, semaphore, stop):
+    """
+    Yield the items of `iterable`, acquiring `semaphore` before each one,
+    so that the consumer can bound the number of items in the air by
+    releasing it; stops when the event `stop` is set.
+    """
+    for item in iterable:
+        semaphore.acquire()
+        if stop.is_set():
+            return
+        yield item
+
+
+def _parallel_source_gen(data, pos, header, footer, source_filter, validate,
+                         processes, chunksize, ordered):
+    """
+    Returns a generator which yields source model objects decoded by a
+    pool of worker processes.
+    """
+    pool = multiprocessing.Pool(processes)
+    # bound the number of chunks in the air, to keep memory in check: the
+    # pool reads the chunks in its task thread, which blocks on the
+    # semaphore until a result is consumed here
+    semaphore = threading.Semaphore(
+        2 * (processes or multiprocessing.cpu_count()))
+    stop = threading.Event()
+    chunks = _bounded(_source_chunks(data, pos, chunksize), semaphore, stop)
+    imap = pool.imap if ordered else pool.imap_unordered
+    args = ((header, chunk, footer, source_filter, validate)
+            for chunk in chunks)
+    try:
+        for sources, error in imap(_parse_chunk_star, args):
+            semaphore.release()
+            if error is not None:
+                raise etree.XMLSyntaxError(*error)
+            for src in sources:
+                yield src
+        pool.close()
+    finally:
+        # unblock the task thread, so that the pool can be terminated
+        stop.set()
+        semaphore.release()
+        pool.terminate()
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+#: dtype of the site model arrays returned by SiteModelParser.parse_arrays
+SITE_MODEL_DT = numpy.dtype([
+    ('lon', numpy.float64), ('lat', numpy.float64), ('vs30', numpy.float64),
+    ('vs30_measured', numpy.bool_), ('z1pt0', numpy.float64),
+    ('z2pt5', numpy.float64)])
+
 
 class SiteModelParser(object):
     """NRML site model parser. Reads site-specific parameters from a given
@@ -451,10 +727,17 @@ class SiteModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param spatial_index:
+        Optional :class:`openquake.nrmllib.spatial.SpatialIndex`; the
+        parsed sites are added to it.
+    :param validate:
+        Validation mode, see :class:`SourceModelParser`.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, spatial_index=None, validate=None):
         self.source = source
+        self.spatial_index = spatial_index
+        self.validate = validate
 
     def parse(self):
         """Parse the site model XML content and generate
@@ -463,29 +746,78 @@ class SiteModelParser(object):
         :returns:
             A iterable of :class:`openquake.nrmllib.model.SiteModel` objects.
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source,
-                                                events=('start', ))
-
-        for _, element in tree:
-            if element.tag == '{%s}site' % openquake.nrmllib.NAMESPACE:
-                site = models.SiteModel()
-                site.vs30 = float(element.get('vs30'))
-                site.vs30_type = element.get('vs30Type').strip()
-                site.z1pt0 = float(element.get('z1pt0'))
-                site.z2pt5 = float(element.get('z2pt5'))
-                lonlat = dict(lon=element.get('lon').strip(),
-                              lat=element.get('lat').strip())
-                site.wkt = 'POINT(%(lon)s %(lat)s)' % lonlat
+        return openquake.nrmllib.iterhandle(
+            self.source, {'site': self._parse_site}, self.validate)
 
-                yield site
+    def _parse_site(self, element):
+        """
+        Convert a <site> element into a :class:`openquake.nrmllib.SiteModel`.
+        """
+        site = models.SiteModel()
+        site.vs30 = float(element.get('vs30'))
+        site.vs30_type = element.get('vs30Type').strip()
+        site.z1pt0 = float(element.get('z1pt0'))
+        site.z2pt5 = float(element.get('z2pt5'))
+        lonlat = dict(lon=element.get('lon').strip(),
+                      lat=element.get('lat').strip())
+        site.wkt = 'POINT(%(lon)s %(lat)s)' % lonlat
+        if self.spatial_index is not None:
+            self.spatial_index.add(lonlat['lon'], lonlat['lat'], site)
+        return site
+
+    def parse_arrays(self, block_size=65536):
+        """Parse the site model XML content in a single streaming pass and
+        return it in columnar form, without building a
+        :class:`openquake.nrmllib.models.SiteModel` object and a WKT
+        string per site. The vs30 type is stored as a boolean, True for
+        'measured' and False for 'inferred'. If a spatial index was
+        given, the sites are added to it as row numbers.
+
+        The attributes are collected as strings and converted to numbers
+        by numpy in blocks of `block_size` sites.
 
-                # Now do some clean up to free memory.
-                while element.getprevious() is not None:
-                    # Delete previous sibling elements.
-                    # We need to loop here in case there are comments in
-                    # the input file which are considered siblings to
-                    # source elements.
-                    del element.getparent()[0]
+        :returns:
+            A numpy structured array with dtype :data:`SITE_MODEL_DT`.
+        """
+        elements = openquake.nrmllib.iterelements(
+            self.source, ['site'], self.validate)
+        blocks = []
+        block = [[] for _ in SITE_MODEL_DT.names]
+        lon, lat, vs30, vs30_type, z1pt0, z2pt5 = [
+            col.append for col in block]
+        for i, element in enumerate(elements, 1):
+            attrib = element.attrib
+            lon(attrib['lon'])
+            lat(attrib['lat'])
+            vs30(attrib['vs30'])
+            vs30_type(attrib['vs30Type'])
+            z1pt0(attrib['z1pt0'])
+            z2pt5(attrib['z2pt5'])
+            if i % block_size == 0:
+                blocks.append(_site_block(block))
+                for col in block:
+                    del col[:]
+        if block[0] or not blocks:
+            blocks.append(_site_block(block))
+        sites = numpy.concatenate(blocks)
+        if self.spatial_index is not None:
+            for i, (lon, lat) in enumerate(zip(sites['lon'], sites['lat'])):
+                self.spatial_index.add(lon, lat, i)
+        return sites
+
+
+def _site_block(columns):
+    """
+    Convert the attribute strings of a block of sites into an array with
+    dtype :data:`SITE_MODEL_DT`.
+    """
+    block = numpy.zeros(len(columns[0]), SITE_MODEL_DT)
+    for name, col in zip(SITE_MODEL_DT.names, columns):
+        if name == 'vs30_measured':
+            block[name] = [v.strip() == 'measured' for v in col]
+        elif col:
+            block[name] = numpy.fromstring(' '.join(col), sep=' ')
+    return block
 
 
 # notice that there must be at most one rupture per file because of the
@@ -495,8 +827,9 @@ class RuptureModelParser(FaultGeometryParserMixin):
     _SIMPLE_RUPT_TAG = '{%s}simpleFaultRupture' % openquake.nrmllib.NAMESPACE
     _COMPLEX_RUPT_TAG = '{%s}complexFaultRupture' % openquake.nrmllib.NAMESPACE
 
-    def __init__(self, source):
+    def __init__(self, source, validate=None):
         self.source = source
+        self.validate = validate
         self._parse_fn_map = {
             self._SIMPLE_RUPT_TAG: self._parse_simple_rupture,
             self._COMPLEX_RUPT_TAG: self._parse_complex_rupture,
@@ -549,11 +882,9 @@ class RuptureModelParser(FaultGeometryParserMixin):
             instance or
             :class:`openquake.nrmllib.models.ComplexFaultRuptureModel` instance
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source)
-        for _, element in tree:
-            parse_fn = self._parse_fn_map.get(element.tag)
-            if parse_fn:
-                return parse_fn(element)
+        for rupture in openquake.nrmllib.iterhandle(
+                self.source, self._parse_fn_map, self.validate):
+            return rupture
         # If we get to here, we didn't find the right element.
         raise ValueError('<%s> or <%s> element not found.'
                          % (self._SIMPLE_RUPT_TAG,
@@ -565,8 +896,9 @@ class GMFScenarioParser(object):
     _GMF_TAG = '{%s}gmf' % openquake.nrmllib.NAMESPACE
     _NODE_TAG = '{%s}node' % openquake.nrmllib.NAMESPACE
 
-    def __init__(self, source):
+    def __init__(self, source, validate=None):
         self.source = source
+        self.validate = validate
 
     def parse(self):
         """
@@ -574,38 +906,63 @@ class GMFScenarioParser(object):
         :returns:
             an iterable over triples (imt, gmvs, location)
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source, events=('end',))
+        handlers = {self._NODE_TAG: self._parse_node,
+                    self._GMF_TAG: self._parse_imt}
         gmf = OrderedDict()  # (imt, location) -> gmvs
         point_value_list = []
-        for _, element in tree:
-            a = element.attrib
-            if element.tag == self._NODE_TAG:
-                point_value_list.append(
-                    ['POINT(%(lon)s %(lat)s)' % a, a['gmv']])
-            elif element.tag == self._GMF_TAG:
-                imt = a['IMT']
-                try:
-                    imt += '(%s)' % a['saPeriod']
-                except KeyError:
-                    pass
+        for result in openquake.nrmllib.iterhandle(
+                self.source, handlers, self.validate):
+            if isinstance(result, tuple):  # a node
+                point_value_list.append(result)
+            else:  # the end of a <gmf>, all of its nodes have been read
                 for point, value in point_value_list:
                     try:
-                        values = gmf[point, imt]
+                        values = gmf[point, result]
                     except KeyError:
-                        gmf[point, imt] = [value]
+                        gmf[point, result] = [value]
                     else:
                         values.append(value)
                 point_value_list = []
         for (location, imt), gmvs in gmf.iteritems():
             yield imt, '{%s}' % ','.join(gmvs), location
 
+    @staticmethod
+    def _parse_node(element):
+        """Returns the pair (point WKT, gmv) of a <node> element"""
+        a = element.attrib
+        return 'POINT(%(lon)s %(lat)s)' % a, a['gmv']
+
+    @staticmethod
+    def _parse_imt(element):
+        """Returns the IMT of a <gmf> element, with the period for SA"""
+        a = element.attrib
+        imt = a['IMT']
+        try:
+            imt += '(%s)' % a['saPeriod']
+        except KeyError:
+            pass
+        return imt
+
 
 class HazardCurveXMLParser(object):
+    """
+    NRML hazard curve parser.
+
+    :param source:
+        Filename or file-like object containing the XML data.
+    :param spatial_index:
+        Optional :class:`openquake.nrmllib.spatial.SpatialIndex`; the
+        parsed curves are added to it.
+    :param validate:
+        Validation mode, see :class:`SourceModelParser`.
+    """
     _CURVES_TAG = '{%s}hazardCurves' % openquake.nrmllib.NAMESPACE
     _CURVE_TAG = '{%s}hazardCurve' % openquake.nrmllib.NAMESPACE
 
-    def __init__(self, source):
+    def __init__(self, source, spatial_index=None, validate=None):
         self.source = source
+        self.spatial_index = spatial_index
+        self.validate = validate
 
     def parse(self):
         """
@@ -613,16 +970,49 @@ class HazardCurveXMLParser(object):
         :returns:
             Populated :class:`openquake.nrmllib.models.HazardCurveModel` object
         """
-        tree = openquake.nrmllib.iterparse_tree(self.source)
-        hc_iter = self._parse(tree)
+        elements = openquake.nrmllib.iterelements(
+            self.source, [self._CURVES_TAG, self._CURVE_TAG], self.validate)
+        hc_iter = self._parse(elements)
         header = hc_iter.next()
         return models.HazardCurveModel(data_iter=hc_iter, **header)
 
-    def _parse(self, tree):
-        header = OrderedDict()
-        for event, element in tree:
-            if element.tag == self._CURVES_TAG and event == 'start':
-                a = element.attrib
+    def get_curve(self, lon, lat):
+        """
+        Decode a single hazard curve, without parsing the rest of the file.
+
+        The byte offsets of the curves are stored in a sidecar index file
+        (see :class:`openquake.nrmllib.index.NRMLIndex`), built on the first
+        call and reused until the hazard curve file changes.
+
+        :param float lon, lat:
+            The location of the curve, exactly as in the file.
+        :returns:
+            A :class:`openquake.nrmllib.models.HazardCurveData` object.
+        :raises KeyError:
+            If there is no curve at the given location.
+        """
+        if not isinstance(self.source, basestring):
+            raise TypeError('Random access requires a file name, got %r'
+                            % self.source)
+        idx = index.NRMLIndex.get(self.source, ['hazardCurve'], 'pos')
+        doc = idx.document((float(lon), float(lat)))
+        parser = HazardCurveXMLParser(
+            StringIO(doc), validate=_validate_fragments(self.validate))
+        return iter(parser.parse()).next()
+
+    def _parse(self, elements):
+        header = None
+        for element in elements:
+            if header is None:
+                # the elements come at their end event, so the header is
+                # read from the parent of the first curve, or from the
+                # <hazardCurves> itself if there are no curves
+                if element.tag == self._CURVES_TAG:
+                    curves = element
+                else:
+                    curves = element.getparent()
+                a = curves.attrib
+                header = OrderedDict()
                 header['statistics'] = a.get('statistics')
                 header['quantile_value'] = a.get('quantileValue')
                 header['smlt_path'] = a.get('sourceModelTreePath')
@@ -631,14 +1021,17 @@ class HazardCurveXMLParser(object):
                 header['investigation_time'] = a['investigationTime']
                 header['sa_period'] = a.get('saPeriod')
                 header['sa_damping'] = a.get('saDamping')
-                header['imls'] = map(float, element[0].text.split())
+                header['imls'] = map(float, curves[0].text.split())
                 yield header
-            elif element.tag == self._CURVE_TAG and event == 'end':
+            if element.tag == self._CURVE_TAG:
                 point, poes = element
                 x, y = [float(v) for v in point[0].text.split()]
                 location = models.Location(x, y)
                 poes_array = map(float, poes.text.split())
-                yield models.HazardCurveData(location, poes_array)
+                curve = models.HazardCurveData(location, poes_array)
+                if self.spatial_index is not None:
+                    self.spatial_index.add(x, y, curve)
+                yield curve
 
 
 def HazardCurveParser(*args, **kwargs):
@@ -19,8 +19,6 @@ Classes for serializing various NRML XML artifacts.
 
 import json
 import numpy
-import StringIO
-import tokenize
 
 from lxml import etree
 from collections import OrderedDict
@@ -28,7 +26,7 @@ from itertools import izip
 
 import openquake.nrmllib
 from openquake.nrmllib import NRMLFile
-from openquake.nrmllib import models, node
+from openquake.nrmllib import models, node, utils
 
 
 SM_TREE_PATH = 'sourceModelTreePath'
@@ -968,46 +966,13 @@ class SourceModelXMLWriter(object):
     @staticmethod
     def _coords_from_geom(wkt):
         """
-        Get the coordinates points from a LINESTRING or POLYGON ``wkt`` string
-        as a 2D list.
+        Get the coordinates points from a POINT, LINESTRING or POLYGON
+        ``wkt`` string as a 2D list.
 
-        The WKT parsing method was heavily inspired by GeoMet
-        (https://github.com/larsbutler/geomet).
-
-        This only works for simple shapes, and does not work for polygons with
-        holes, etc.. Example:
-
-        POLYGON ((35 10, 10 20, 15 40, 45 45, 35 10),
-        (20 30, 35 35, 30 20, 20 30))
+        This only works for simple shapes: the holes of a polygon are
+        ignored. See :func:`openquake.nrmllib.utils.wkt_to_coords`.
         """
-        sio = StringIO.StringIO(wkt)
-
-        tokens = (x[1] for x in tokenize.generate_tokens(sio.readline))
-        geom_type = tokens.next()
-        assert geom_type in ('POINT', 'LINESTRING', 'POLYGON')
-
-        coords = []
-        pt = []
-        negative = False
-
-        for t in tokens:
-            if t == '(':
-                continue
-            elif t == ')':
-                coords.append(pt)
-                break
-            elif t == ',':
-                coords.append(pt)
-                pt = []
-            elif t == '-':
-                negative = True
-            else:
-                if negative:
-                    t = '-' + t
-                pt.append(float(t))
-                negative = False
-
-        return coords
+        return utils.wkt_to_coords(wkt).tolist()
 
     def _append_mfd(self, elem, src):
         """
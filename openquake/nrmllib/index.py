@@ -0,0 +1,259 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Random access to the items of large NRML files.
+
+A :class:`NRMLIndex` stores the byte offsets of the top-level items of a
+file (sources, assets, hazard curves) by key. The index is built by
+scanning the text of the file with regular expressions, without parsing
+it, and it is persisted in a sidecar file (`<fname>.idx`) so that it can
+be reused until the NRML file changes. An indexed item is decoded by
+reading its bytes and wrapping them in the header and footer of the
+original document, which gives a small but complete NRML document::
+
+ >> idx = NRMLIndex.get('exposure.xml', ['asset'], 'id')
+ >> print idx.document('asset_01')
+"""
+
+import os
+import re
+import json
+import mmap
+from lxml import etree
+
+SOURCE_TAGS = ['pointSource', 'areaSource', 'simpleFaultSource',
+               'complexFaultSource', 'characteristicFaultSource']
+
+_ID_RE = re.compile(r'''\sid\s*=\s*(["'])(.*?)\1''')
+_POS_RE = re.compile(r'<(?:[\w.-]+:)?pos\s*>([^<]*)<')
+_TAG_END_RE = re.compile(r'/?>')
+
+
+def id_key(data, start, end):
+    """
+    Returns the `id` attribute of the item data[start:end].
+    """
+    tag_end = _TAG_END_RE.search(data, start, end)
+    match = _ID_RE.search(data, start, tag_end.start())
+    if match is None:
+        raise ValueError('Missing id in %r' % data[start:tag_end.end()])
+    return match.group(2)
+
+
+def pos_key(data, start, end):
+    """
+    Returns the first `gml:pos` of the item data[start:end], as a pair of
+    floats (lon, lat).
+    """
+    match = _POS_RE.search(data, start, end)
+    if match is None:
+        raise ValueError('Missing gml:pos in %r' % data[start:end])
+    lon, lat = match.group(1).split()[:2]
+    return float(lon), float(lat)
+
+
+_KEYS = dict(id=id_key, pos=pos_key)
+
+# (abspath, tags, key) -> (stamp, index), see NRMLIndex.get
+_INDICES = {}
+
+
+def scan_items(data, tags, pos=0):
+    """
+    Yields the pairs (start, end) of the elements in `tags` found in the
+    text `data`, starting from the position `pos`. Comments between the
+    elements are skipped; nested elements with the same tags are not
+    supported.
+    """
+    start_re = re.compile(r'<!--.*?-->|<(?:[\w.-]+:)?(%s)[\s/>]'
+                          % '|'.join(tags), re.DOTALL)
+    end_res = dict((tag, re.compile(r'</(?:[\w.-]+:)?%s\s*>' % tag))
+                   for tag in tags)
+    while True:
+        start = start_re.search(data, pos)
+        if start is None:
+            break
+        elif start.group(1) is None:  # comment
+            pos = start.end()
+            continue
+        tag_end = _TAG_END_RE.search(data, start.end() - 1)
+        if tag_end.group() == '/>':  # empty element
+            pos = tag_end.end()
+        else:
+            end = end_res[start.group(1)].search(data, tag_end.end())
+            if end is None:
+                raise ValueError('Unterminated <%s> element' % start.group(1))
+            pos = end.end()
+        yield start.start(), pos
+
+
+def close_tags(header):
+    """
+    Returns the closing tags of the elements left open at the end of the
+    text `header`, i.e. the footer making `header` a complete document.
+
+    >>> close_tags('<nrml xmlns:a="x"><a:b c="1"><d/><e>')
+    '</e></a:b></nrml>'
+    """
+    parser = etree.XMLPullParser(events=('start', 'end'))
+    parser.feed(header)
+    stack = []
+    for event, elem in parser.read_events():
+        if event == 'start':
+            name = etree.QName(elem).localname
+            stack.append('%s:%s' % (elem.prefix, name) if elem.prefix
+                         else name)
+        else:
+            stack.pop()
+    footer = ''.join('</%s>' % name for name in reversed(stack))
+    return footer.encode('utf-8')
+
+
+class NRMLIndex(object):
+    """
+    Byte-offset index of the items of a NRML file.
+
+    :param fname:
+        Path to the NRML file.
+    :param tags:
+        List of the (unqualified) tags of the indexed items.
+    :param key:
+        Name of the function extracting the key of an item: 'id' for the
+        `id` attribute, 'pos' for the (lon, lat) of the first `gml:pos`.
+    :param header:
+        Text of the file preceding the first item.
+    :param footer:
+        Closing tags of the elements open at the end of the header.
+    :param offsets:
+        Dictionary key -> (start, end) byte offsets of the item.
+    """
+    SUFFIX = '.idx'
+
+    def __init__(self, fname, tags, key, header, footer, offsets):
+        self.fname = fname
+        self.tags = list(tags)
+        self.key = key
+        self.header = header
+        self.footer = footer
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, fname, tags, key='id'):
+        """
+        Scan the file `fname` and build the index of the items in `tags`.
+        """
+        keyfunc = _KEYS[key]
+        offsets = {}
+        with open(fname, 'rb') as fh:
+            data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                header = None
+                for start, end in scan_items(data, tags):
+                    if header is None:
+                        header = data[:start]
+                    k = keyfunc(data, start, end)
+                    if k in offsets:
+                        raise ValueError('%s: duplicated key %s' % (fname, k))
+                    offsets[k] = (start, end)
+                if header is None:  # no items
+                    header = data[:]
+            finally:
+                data.close()
+        return cls(fname, tags, key, header, close_tags(header), offsets)
+
+    @classmethod
+    def get(cls, fname, tags, key='id'):
+        """
+        Returns the index of `fname`, reading the sidecar file if it is
+        up to date, or building the index and saving it otherwise. If the
+        sidecar file cannot be written the index is kept in memory only.
+        The indices are cached in the process until the file changes.
+        """
+        cache_key = (os.path.abspath(fname), tuple(tags), key)
+        stamp = _stamp(fname)
+        cached = _INDICES.get(cache_key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            index = cls.load(fname, tags, key)
+        except (IOError, ValueError, KeyError):
+            index = cls.build(fname, tags, key)
+            try:
+                index.save()
+            except IOError:
+                pass
+        _INDICES[cache_key] = stamp, index
+        return index
+
+    @classmethod
+    def load(cls, fname, tags, key='id'):
+        """
+        Read the sidecar file of `fname`. Raises a ValueError if it is
+        outdated or if it indexes different items.
+        """
+        with open(fname + cls.SUFFIX) as fh:
+            dic = json.load(fh)
+        if (dic['stamp'] != _stamp(fname) or dic['tags'] != list(tags)
+                or dic['key'] != key):
+            raise ValueError('%s%s is outdated' % (fname, cls.SUFFIX))
+        if key == 'pos':
+            offsets = dict((tuple(k), tuple(v)) for k, v in dic['offsets'])
+        else:
+            offsets = dict((k, tuple(v)) for k, v in dic['offsets'])
+        return cls(fname, tags, key, dic['header'].encode('utf-8'),
+                   dic['footer'].encode('utf-8'), offsets)
+
+    def save(self):
+        """
+        Write the index in the sidecar file `<fname>.idx`.
+        """
+        dic = dict(stamp=_stamp(self.fname), tags=self.tags, key=self.key,
+                   header=self.header.decode('utf-8'),
+                   footer=self.footer.decode('utf-8'),
+                   offsets=self.offsets.items())
+        with open(self.fname + self.SUFFIX, 'w') as fh:
+            json.dump(dic, fh)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def fragment(self, key):
+        """
+        Returns the text of the item with the given key, read from the
+        file. Raises a KeyError if there is no such item.
+        """
+        start, end = self.offsets[key]
+        with open(self.fname, 'rb') as fh:
+            fh.seek(start)
+            return fh.read(end - start)
+
+    def document(self, key):
+        """
+        Returns a NRML document containing only the item with the given key.
+        """
+        return self.header + self.fragment(key) + self.footer
+
+
+def _stamp(fname):
+    """
+    Returns the size and modification time of a file, used to detect
+    outdated indices.
+    """
+    stat = os.stat(fname)
+    return [stat.st_size, stat.st_mtime]
@@ -21,6 +21,8 @@ serializers.
 from collections import OrderedDict
 from collections import namedtuple
 
+from openquake.nrmllib.node import with_slots
+
 
 class SourceModel(object):
     """Simple container for source objects, plus metadata.
@@ -41,10 +43,12 @@ class SourceModel(object):
         return iter(self.sources)
 
 
+@with_slots
 class SeismicSource(object):
     """
     General base class for seismic sources.
     """
+    __slots__ = ('id', 'name', 'trt')
 
     def __init__(self, id=None, name=None, trt=None):
         self.id = id
@@ -63,6 +67,7 @@ class SeismicSource(object):
         ])
 
 
+@with_slots
 class PointSource(SeismicSource):
     """Basic object representation of a Point Source.
 
@@ -88,6 +93,8 @@ class PointSource(SeismicSource):
         `list` of :class:`HypocentralDepth` instances which make up a
         Hypocentral Depth Distribution.
     """
+    __slots__ = ('geometry', 'mag_scale_rel', 'rupt_aspect_ratio', 'mfd',
+                 'nodal_plane_dist', 'hypo_depth_dist')
 
     def __init__(self, id=None, name=None, trt=None, geometry=None,
                  mag_scale_rel=None, rupt_aspect_ratio=None, mfd=None,
@@ -101,6 +108,7 @@ class PointSource(SeismicSource):
         self.hypo_depth_dist = hypo_depth_dist
 
 
+@with_slots
 class PointGeometry(object):
     """Basic object representation of a geometry for a :class:`PointSource`.
 
@@ -111,6 +119,7 @@ class PointGeometry(object):
     :param float lower_seismo_depth:
         Lower siesmogenic depth.
     """
+    __slots__ = ('wkt', 'upper_seismo_depth', 'lower_seismo_depth')
 
     def __init__(self, wkt=None, upper_seismo_depth=None,
                  lower_seismo_depth=None):
@@ -119,6 +128,7 @@ class PointGeometry(object):
         self.lower_seismo_depth = lower_seismo_depth
 
 
+@with_slots
 class AreaSource(PointSource):
     """Basic object representation of an Area Source.
 
@@ -144,8 +154,10 @@ class AreaSource(PointSource):
         `list` of :class:`HypocentralDepth` instances which make up a
         Hypocentral Depth Distribution.
     """
+    __slots__ = ()
 
 
+@with_slots
 class AreaGeometry(PointGeometry):
     """Basic object representation of a geometry for a :class:`PointSource`.
 
@@ -156,8 +168,10 @@ class AreaGeometry(PointGeometry):
     :param float lower_seismo_depth:
         Lower siesmogenic depth.
     """
+    __slots__ = ()
 
 
+@with_slots
 class SimpleFaultSource(SeismicSource):
     """Basic object representation of a Simple Fault Source.
 
@@ -179,6 +193,8 @@ class SimpleFaultSource(SeismicSource):
     :param float rake:
         Rake angle.
     """
+    __slots__ = ('geometry', 'mag_scale_rel', 'rupt_aspect_ratio', 'mfd',
+                 'rake')
 
     def __init__(self, id=None, name=None, trt=None, geometry=None,
                  mag_scale_rel=None, rupt_aspect_ratio=None, mfd=None,
@@ -191,6 +207,7 @@ class SimpleFaultSource(SeismicSource):
         self.rake = rake
 
 
+@with_slots
 class SimpleFaultGeometry(object):
     """Basic object representation of a geometry for a
     :class:`SimpleFaultSource`.
@@ -202,6 +219,7 @@ class SimpleFaultGeometry(object):
     :param float lower_seismo_depth:
         Lower siesmogenic depth.
     """
+    __slots__ = ('wkt', 'dip', 'upper_seismo_depth', 'lower_seismo_depth')
 
     def __init__(self, id=None, name=None, wkt=None, dip=None,
                  upper_seismo_depth=None, lower_seismo_depth=None):
@@ -217,9 +235,10 @@ wkt=%(wkt)s,
 dip=%(dip)s,
 upper_seismo_depth=%(upper_seismo_depth)s,
 lower_seismo_depth=%(lower_seismo_depth)s)
-''' % vars(self)
+''' % self.__getstate__()
 
 
+@with_slots
 class ComplexFaultSource(SimpleFaultSource):
     """Basic object representation of a Complex Fault Source.
 
@@ -241,8 +260,10 @@ class ComplexFaultSource(SimpleFaultSource):
     :param float rake:
         Rake angle.
     """
+    __slots__ = ()
 
 
+@with_slots
 class ComplexFaultGeometry(object):
     """Basic object representation of a geometry for a
     :class:`ComplexFaultSource`.
@@ -258,6 +279,7 @@ class ComplexFaultGeometry(object):
 
         This parameter is optional.
     """
+    __slots__ = ('top_edge_wkt', 'bottom_edge_wkt', 'int_edges')
 
     def __init__(self, top_edge_wkt=None, bottom_edge_wkt=None,
                  int_edges=None):
@@ -271,9 +293,10 @@ class ComplexFaultGeometry(object):
 top_edge_wkt=%(top_edge_wkt)s,
 bottom_edge_wkt=%(bottom_edge_wkt)s,
 int_edges=%(int_edges)s
-''' % vars(self)
+''' % self.__getstate__()
 
 
+@with_slots
 class IncrementalMFD(object):
     """Basic object representation of an Incremental Magnitude Frequency
     Distribtion.
@@ -285,6 +308,7 @@ class IncrementalMFD(object):
     :param list occur_rates:
         `list` of occurrence rates (`float` values).
     """
+    __slots__ = ('min_mag', 'bin_width', 'occur_rates')
 
     def __init__(self, min_mag=None, bin_width=None, occur_rates=None):
         self.min_mag = min_mag
@@ -302,6 +326,7 @@ class IncrementalMFD(object):
         ])
 
 
+@with_slots
 class TGRMFD(object):
     """Basic object representation of a Truncated Gutenberg-Richter Magnitude
     Frequency Distribution.
@@ -316,6 +341,7 @@ class TGRMFD(object):
     :param float max_mag:
         The highest possible magnitude for this MFD.
     """
+    __slots__ = ('a_val', 'b_val', 'min_mag', 'max_mag')
 
     def __init__(self, a_val=None, b_val=None, min_mag=None, max_mag=None):
         self.a_val = a_val
@@ -336,6 +362,7 @@ class TGRMFD(object):
         ])
 
 
+@with_slots
 class NodalPlane(object):
     """Basic object representation of a single node in a Nodal Plane
     Distribution.
@@ -350,6 +377,7 @@ class NodalPlane(object):
     :param float rake:
         Rake angle.
     """
+    __slots__ = ('probability', 'strike', 'dip', 'rake')
 
     def __init__(self, probability=None, strike=None, dip=None, rake=None):
         self.probability = probability
@@ -370,6 +398,7 @@ class NodalPlane(object):
         ])
 
 
+@with_slots
 class HypocentralDepth(object):
     """Basic object representation of a single node in a Hypocentral Depth
     Distribution.
@@ -380,6 +409,7 @@ class HypocentralDepth(object):
     :param float depth:
         Depth (in km).
     """
+    __slots__ = ('probability', 'depth')
 
     def __init__(self, probability=None, depth=None):
         self.probability = probability
@@ -396,6 +426,7 @@ class HypocentralDepth(object):
         ])
 
 
+@with_slots
 class SiteModel(object):
     """Basic object representation of a single node in a model of site-specific
     parameters.
@@ -412,6 +443,7 @@ class SiteModel(object):
     :param wkt:
         Well-known text (POINT) represeting the location of these parameters.
     """
+    __slots__ = ('vs30', 'vs30_type', 'z1pt0', 'z2pt5', 'wkt')
 
     def __init__(self, vs30=None, vs30_type=None, z1pt0=None, z2pt5=None,
                  wkt=None):
@@ -422,6 +454,7 @@ class SiteModel(object):
         self.wkt = wkt
 
 
+@with_slots
 class SimpleFaultRuptureModel(object):
     """Basic object representation of a Simple Fault Rupture.
 
@@ -436,6 +469,7 @@ class SimpleFaultRuptureModel(object):
     :param geometry:
         :class:`SimpleFaultGeometry` object.
     """
+    __slots__ = ('id', 'magnitude', 'rake', 'hypocenter', 'geometry')
 
     def __init__(self, id=None, magnitude=None, rake=None, hypocenter=None,
                  geometry=None):
@@ -446,6 +480,7 @@ class SimpleFaultRuptureModel(object):
         self.geometry = geometry
 
 
+@with_slots
 class ComplexFaultRuptureModel(SimpleFaultRuptureModel):
     """Basic object representation of a Complex Fault Rupture.
 
@@ -460,8 +495,10 @@ class ComplexFaultRuptureModel(SimpleFaultRuptureModel):
      :param geometry:
          :class:`ComplexFaultGeometry` object.
     """
+    __slots__ = ()
 
 
+@with_slots
 class CharacteristicSource(SeismicSource):
     """
     Basic object representation of a characteristic fault source.
@@ -481,6 +518,8 @@ class CharacteristicSource(SeismicSource):
         A :class:`SimpleFaultGeometry`, :class:`ComplexFaultGeometry`, or a
         list of :class:`PlanarSurface` objects.
     """
+    __slots__ = ('mfd', 'rake', 'surface')
+
     def __init__(self, id=None, name=None, trt=None, mfd=None, rake=None,
                  surface=None):
         super(CharacteristicSource, self).__init__(id=id, name=name, trt=trt)
@@ -489,6 +528,7 @@ class CharacteristicSource(SeismicSource):
         self.surface = surface
 
 
+@with_slots
 class PlanarSurface(object):
     """
     :param strike:
@@ -499,6 +539,9 @@ class PlanarSurface(object):
         Corner points of the planar surface, represented by :class:`Point`
         objects.
     """
+    __slots__ = ('strike', 'dip', 'top_left', 'top_right', 'bottom_left',
+                 'bottom_right')
+
     def __init__(self, strike=None, dip=None, top_left=None, top_right=None,
                  bottom_left=None, bottom_right=None):
         self.strike = strike
@@ -509,6 +552,7 @@ class PlanarSurface(object):
         self.bottom_right = bottom_right
 
 
+@with_slots
 class Point(object):
     """
     A simple representation of longitude, latitude, and depth.
@@ -520,6 +564,7 @@ class Point(object):
     :param depth:
         Depth
     """
+    __slots__ = ('longitude', 'latitude', 'depth')
 
     def __init__(self, longitude=None, latitude=None, depth=None):
         self.longitude = longitude
@@ -549,7 +594,7 @@ class HazardCurveModel(object):
         vars(self).update(metadata)
 
     def __iter__(self):
-        return self._data_iter
+        return iter(self._data_iter)
 
 
 HazardCurveData = namedtuple('HazardCurveData', 'location poes')
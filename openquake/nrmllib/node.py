@@ -137,12 +137,17 @@ From Node objects to NRML files and viceversa
 It is possible to save a Node object into a NRML file by using the
 function ``node_to_nrml(node, output)`` where output is a file
 object. If you want to make sure that the generated file is valid
-according to the NRML schema just open it in 'w+' mode: immediately
-after writing it will be read and validated. It is also possible to
+according to the NRML schema just open it in 'w+' mode, or pass
+``validate=True``: the document will be validated while it is written,
+in a single pass and in constant memory. It is also possible to
 convert a NRML file into a Node object with the routine
 ``node_from_nrml(node, input)`` where input is the path name of the
-NRML file or a file object opened for reading. The file will be
-validated as soon as opened.
+NRML file or a file object opened for reading. The file is validated
+while it is read, in a single pass. With ``node_from_nrml(input,
+lazy=True)`` the subnodes of the large containers (assets, sources, sites,
+hazard curves...) are generated while the file is read, so that files of
+any size can be converted with ``node_to_nrml`` or ``node_to_xml`` in
+constant memory; the caveats about lazy trees apply.
 
 For instance an exposure file like the following::
 
@@ -187,15 +192,27 @@ Then subnodes and attributes can be conveniently accessed:
 '45.16667'
 
 The Node class provides no facility to cast strings into Python types;
-this is a job for a separate library which should be able to
-understand the types defined in the XSD schema.
+that is the job of :mod:`openquake.nrmllib.xsd`, which understands the
+types defined in the XSD schema:
+
+>> from openquake.nrmllib.xsd import converters
+>> converters().cast_node(nrml)
+>> nrml.exposureModel.assets[0].location['lon']
+9.15
 """
 
+import re
 import sys
+import array
+import struct
+import marshal
+import itertools
 import cStringIO
 import ConfigParser
+import numpy
 from openquake import nrmllib
-from openquake.nrmllib.writers import StreamingXMLWriter
+from openquake.nrmllib import xsd
+from openquake.nrmllib.writers import StreamingXMLWriter, totext
 from lxml import etree
 
 
@@ -203,16 +220,46 @@ from lxml import etree
 def with_slots(cls):
     """
     Decorator for a class with __slots__. It automatically defines
-    the methods __eq__, __ne__, assert_equal, __getstate__ and __setstate__
+    the methods __eq__, __ne__, assert_equal, __getstate__ and __setstate__.
+    The slots of the base classes are taken into account too. The private
+    slots (starting with an underscore) are meant for caches: they are
+    ignored by the comparisons, not pickled and set to None on unpickling.
     """
+    def _slots(klass, cache={}):
+        try:
+            return cache[klass]
+        except KeyError:
+            slots = cache[klass] = [
+                slot for base in reversed(klass.__mro__)
+                for slot in base.__dict__.get('__slots__', ())
+                if not slot.startswith('_')]
+            return slots
+
+    def _private_slots(klass, cache={}):
+        try:
+            return cache[klass]
+        except KeyError:
+            slots = cache[klass] = [
+                slot for base in reversed(klass.__mro__)
+                for slot in base.__dict__.get('__slots__', ())
+                if slot.startswith('_')]
+            return slots
+
     def _compare(self, other):
-        for slot in self.__class__.__slots__:
+        for slot in _slots(self.__class__):
             source = getattr(self, slot)
             target = getattr(other, slot)
-            yield slot, source, target, source == target
+            if (isinstance(source, numpy.ndarray) or
+                    isinstance(target, numpy.ndarray)):
+                eq = numpy.array_equal(source, target)
+            else:
+                eq = source == target
+            yield slot, source, target, eq
 
     def __eq__(self, other):
         """True if self and other have the same slots"""
+        if self.__class__ is not other.__class__:
+            return False
         return all(eq for slot, source, target, eq in _compare(self, other))
 
     def __ne__(self, other):
@@ -229,12 +276,14 @@ def with_slots(cls):
     def __getstate__(self):
         """Return a dictionary with the slots"""
         return dict((slot, getattr(self, slot))
-                    for slot in self.__class__.__slots__)
+                    for slot in _slots(self.__class__))
 
     def __setstate__(self, state):
         """Set the slots"""
-        for slot in self.__class__.__slots__:
+        for slot in _slots(self.__class__):
             setattr(self, slot, state[slot])
+        for slot in _private_slots(self.__class__):
+            setattr(self, slot, None)
 
     cls.__slots__  # raise an AttributeError for missing slots
     cls.__eq__ = __eq__
@@ -280,7 +329,10 @@ def _displayattrs(attrib, expandattrs):
 def _display(node, indent, expandattrs, expandvals, output):
     """Core function to display a Node object"""
     attrs = _displayattrs(node.attrib, expandattrs)
-    val = ' %s' % node.text if expandvals and node.text else ''
+    text = node.text
+    if text is not None and not isinstance(text, basestring):
+        text = totext(text)
+    val = ' %s' % text if expandvals and text else ''
     output.write(indent + node.tag + attrs + val + '\n')
     for sub_node in node:
         _display(sub_node, indent + '  ', expandattrs, expandvals, output)
@@ -310,8 +362,16 @@ class Node(object):
     and to ElementTree objects. The advantage over ElementTree objects
     is that subnodes can be lazily generated and that they can be accessed
     with the dot notation.
+
+    The positions of the subnodes are indexed by tag when they are first
+    looked up, so that the dot notation and :meth:`getnodes` do not scan
+    all the subnodes. The index is invalidated by the methods changing
+    the subnodes and rebuilt when `nodes` is replaced or its length
+    changes, or when a subnode found through it has a different tag, as
+    happens after renaming, reordering or replacing the subnodes directly.
+    Lazy subnodes are not indexed.
     """
-    __slots__ = ('tag', 'attrib', 'text', 'nodes')
+    __slots__ = ('tag', 'attrib', 'text', 'nodes', '_index')
 
     def __init__(self, fulltag, attrib=None, text=None, nodes=None):
         """
@@ -324,28 +384,103 @@ class Node(object):
         self.attrib = {} if attrib is None else attrib
         self.text = text
         self.nodes = [] if nodes is None else nodes
+        self._index = None
         if self.nodes and self.text is not None:
             raise ValueError(
                 'A branch node cannot have a value, got %r' % self.text)
 
+    def _get_index(self):
+        """
+        Returns a dictionary tag -> indices of the subnodes with that tag,
+        or None if the subnodes are lazy.
+        """
+        nodes = self.nodes
+        if not isinstance(nodes, list):
+            return None
+        index = self._index
+        if index is None or index[0] is not nodes or index[1] != len(nodes):
+            dic = {}
+            for i, node in enumerate(nodes):
+                try:
+                    dic[node.tag].append(i)
+                except KeyError:
+                    dic[node.tag] = [i]
+            index = self._index = (nodes, len(nodes), dic)
+        return index[2]
+
     def __getattr__(self, name):
-        for node in self.nodes:
-            if node.tag == name:
-                return node
+        if name == '_index':  # unset slot, while unpickling
+            raise AttributeError(name)
+        index = self._index
+        nodes = self.nodes
+        if index is None or index[0] is not nodes or index[1] != len(nodes):
+            index = self._get_index()
+        else:
+            index = index[2]
+        if index is None:  # lazy subnodes
+            for node in nodes:
+                if node.tag == name:
+                    return node
+        elif name in index and nodes[index[name][0]].tag == name:
+            return nodes[index[name][0]]
+        elif not name.startswith('__') and any(
+                node.tag == name for node in nodes):
+            # the index is stale, the subnodes were changed directly
+            self._index = None
+            return nodes[self._get_index()[name][0]]
+        if name.startswith('__'):  # special method
+            raise AttributeError(name)
         raise NameError('No subnode named %r found in %r' %
                         (name, self.tag))
 
+    def _positions(self, name):
+        """
+        Returns the positions of the subnodes named `name`, or None if the
+        subnodes are lazy. The index is rebuilt if one of the subnodes in
+        those positions has a different tag.
+        """
+        index = self._get_index()
+        if index is None:
+            return None
+        nodes = self.nodes
+        positions = index.get(name, ())
+        for i in positions:
+            if nodes[i].tag != name:
+                self._index = None
+                return self._get_index().get(name, ())
+        return positions
+
     def getnodes(self, name):
         "Return the direct subnodes with name 'name'"
-        for node in self.nodes:
-            if node.tag == name:
-                yield node
+        positions = self._positions(name)
+        if positions is None:  # lazy subnodes
+            for node in self.nodes:
+                if node.tag == name:
+                    yield node
+        else:
+            nodes = self.nodes
+            for i in positions:
+                yield nodes[i]
+
+    def select(self, path):
+        """
+        Return an iterator over the subnodes selected by a path expression,
+        see :func:`compile_path`. For instance
+
+        >>> root = Node('root', nodes=[
+        ...     Node('a', {'x': '1'}, nodes=[Node('b', {}, 'B1')]),
+        ...     Node('a', {'x': '2'}, nodes=[Node('b', {}, 'B2')])])
+        >>> [b.text for b in root.select('a[@x="2"]/b')]
+        ['B2']
+        """
+        return compile_path(path)(self)
 
     def append(self, node):
         "Append a new subnode"
         if not isinstance(node, self.__class__):
             raise TypeError('Expected Node instance, got %r' % node)
         self.nodes.append(node)
+        self._index = None
 
     def to_str(self, expandattrs=True, expandvals=True):
         """
@@ -388,6 +523,7 @@ class Node(object):
             self.attrib[i] = value
         else:  # assume an integer or a slice
             self.nodes[i] = value
+            self._index = None
 
     def __delitem__(self, i):
         """
@@ -398,6 +534,7 @@ class Node(object):
             del self.attrib[i]
         else:  # assume an integer or a slice
             del self.nodes[i]
+            self._index = None
 
     def __len__(self):
         """Return the number of subnodes"""
@@ -412,6 +549,193 @@ class Node(object):
         return bool(self.nodes)
 
 
+_NODE_TEXT = Node.text  # the slot descriptor, overridden by ArrayNode
+
+
+class ArrayNode(Node):
+    """
+    A Node storing the text of the leaves containing lists of numbers
+    as numpy arrays of floats; the numeric tags are read from the schema,
+    see :func:`openquake.nrmllib.xsd.numeric_list_tags`. The text is
+    parsed once, when it is set, and converted back into a string only
+    by the writers. It can be used as `nodecls` by the functions building
+    nodes:
+
+    >>> node = ArrayNode('poEs', text='0.1 0.02')
+    >>> node.text.tolist()
+    [0.1, 0.02]
+    >>> print etree.tostring(node_to_elem(node))
+    <poEs>0.1 0.02</poEs>
+    """
+    __slots__ = ()
+
+    def _get_text(self):
+        return _NODE_TEXT.__get__(self, ArrayNode)
+
+    def _set_text(self, text):
+        if (isinstance(text, basestring) and
+                self.tag in xsd.numeric_list_tags()):
+            text = numpy.array(text.split(), float)
+        _NODE_TEXT.__set__(self, text)
+
+    text = property(_get_text, _set_text)
+
+
+######################## path expressions #########################
+
+_PATHS = {}  # path -> compiled path, see compile_path
+_STEP = re.compile(r'(\*|[\w.-]+)((?:\[[^\]]*\])*)$')
+_PREDICATE = re.compile(
+    r'\[\s*(?:@([\w.:-]+)\s*(?:=\s*(?:"([^"]*)"|\'([^\']*)\'))?|(\d+))\s*\]')
+
+
+def compile_path(path):
+    """
+    Compile a path expression into a function returning an iterator over
+    the subnodes of a node selected by the path. The compiled paths are
+    cached, so that each path is parsed only once per process.
+
+    The supported syntax is a subset of XPath: steps separated by `/`,
+    each one being a tag or `*`, optionally followed by predicates in
+    square brackets: `[@name]` (the attribute exists), `[@name="value"]`
+    (the attribute has the given value) and `[n]` (the n-th matching
+    subnode, starting from 1). A double slash `//` selects the descendants
+    instead of the subnodes, as in `exposureModel//location`.
+
+    The paths are evaluated iteratively and lazily, a subnode at the
+    time, so they can be used on lazy trees without generating all the
+    subnodes (which are consumed as usual). The subnodes are looked up
+    with :meth:`Node.getnodes`, i.e. through the tag index.
+
+    :raises ValueError: for invalid paths
+    """
+    try:
+        return _PATHS[path]
+    except KeyError:
+        pass
+    descendants = path.startswith('//')
+    tokens = path[2:].split('/') if descendants else path.split('/')
+    if not tokens[0] or not tokens[-1]:  # /a, //, a/
+        raise ValueError('Invalid path %r' % path)
+    steps = []
+    for token in tokens:
+        if not token:
+            if descendants:  # a///b
+                raise ValueError('Invalid path %r' % path)
+            descendants = True
+            continue
+        steps.append(_compile_step(path, token, descendants))
+        descendants = False
+
+    def select(node):
+        nodes = iter([node])
+        for step in steps:
+            nodes = step(nodes)
+        return nodes
+    _PATHS[path] = select
+    return select
+
+
+def _compile_step(path, token, descendants):
+    """
+    Compile a step of a path into a function from an iterator over the
+    context nodes to an iterator over the selected nodes.
+    """
+    match = _STEP.match(token)
+    if not match:
+        raise ValueError('Invalid step %r in path %r' % (token, path))
+    tag, predicates = match.groups()
+    filters = []
+    position = None
+    for pred in re.findall(r'\[[^\]]*\]', predicates):
+        pmatch = _PREDICATE.match(pred)
+        if not pmatch or pmatch.end() != len(pred):
+            raise ValueError('Invalid predicate %r in path %r' %
+                             (pred, path))
+        name, dquoted, squoted, pos = pmatch.groups()
+        if pos is not None:
+            if descendants or position is not None:
+                raise ValueError(
+                    'Unsupported position %r in path %r' % (pred, path))
+            position = int(pos)
+        elif dquoted is None and squoted is None:
+            filters.append(_has_attribute(name))
+        else:
+            filters.append(_attribute_equals(
+                name, dquoted if squoted is None else squoted))
+
+    if not filters:
+        matches = None
+    elif len(filters) == 1:
+        matches = filters[0]
+    else:
+        matches = lambda node: all(flt(node) for flt in filters)
+
+    if descendants:
+        def step(nodes):
+            seen = set()  # the contexts can be nested
+            for node in nodes:
+                for sub in _descendants(node):
+                    if ((tag == '*' or sub.tag == tag) and
+                            (matches is None or matches(sub)) and
+                            id(sub) not in seen):
+                        seen.add(id(sub))
+                        yield sub
+        return step
+
+    def children(node):
+        if tag == '*':
+            subnodes = node.nodes
+        else:
+            positions = node._positions(tag)
+            if positions is None:  # lazy subnodes
+                subnodes = node.getnodes(tag)
+            else:
+                subnodes = itertools.imap(node.nodes.__getitem__, positions)
+        if matches is not None:
+            subnodes = itertools.ifilter(matches, subnodes)
+        if position is not None:
+            subnodes = itertools.islice(subnodes, position - 1, position)
+        return subnodes
+
+    def step(nodes):
+        return itertools.chain.from_iterable(itertools.imap(children, nodes))
+    return step
+
+
+def _has_attribute(name):
+    """A predicate on nodes checking if an attribute is set"""
+    return lambda node: name in node.attrib
+
+
+def _attribute_equals(name, value):
+    """
+    A predicate on nodes checking the value of an attribute; typed values
+    (see :mod:`openquake.nrmllib.xsd`) are compared in their text form.
+    """
+    def equals(node):
+        attr = node.attrib.get(name)
+        if attr is None or isinstance(attr, basestring):
+            return attr == value
+        return totext(attr) == value
+    return equals
+
+
+def _descendants(node):
+    """
+    Yields the descendants of a node in document order, iteratively;
+    lazy subnodes are generated only when needed.
+    """
+    stack = [iter(node.nodes)]
+    while stack:
+        for sub in stack[-1]:
+            yield sub
+            stack.append(iter(sub.nodes))
+            break
+        else:
+            stack.pop()
+
+
 def node_from_dict(dic, nodecls=Node):
     """
     Convert a (nested) dictionary with attributes tag, attrib, text, nodes
@@ -439,41 +763,246 @@ def node_to_dict(node):
     return dic
 
 
+#: magic string, version and sizes of the sections of the binary format
+BINARY_HEADER = struct.Struct('<8sI5I')
+BINARY_MAGIC = 'NRMLNODE'
+BINARY_VERSION = 1
+
+
+#: the types of the values stored by marshal in the binary format
+_MARSHAL_TYPES = frozenset([str, unicode, int, long, float, bool,
+                            type(None), type(Ellipsis)])
+
+
+def _marshal(values):
+    """
+    Marshal a list of values; the numpy scalars are converted into
+    Python scalars, since marshal would store their buffers as strings.
+    """
+    if not _MARSHAL_TYPES.issuperset(map(type, values)):
+        converted = []
+        for value in values:
+            if isinstance(value, numpy.generic):
+                value = value.item()
+            elif type(value) not in _MARSHAL_TYPES:
+                raise TypeError('Cannot store %r in the binary format'
+                                % value)
+            converted.append(value)
+        values = converted
+    return marshal.dumps(values, 2)
+
+
+def node_to_binary(root):
+    """
+    Convert a Node object into a compact binary string, which can be
+    converted back with :func:`node_from_binary` several times faster
+    than a pickle. The encoding is made of length-prefixed sections:
+
+    1. a table of the tags, of the tuples of attribute names and of the
+       dtypes and shapes of the arrays
+    2. a record of three little-endian 32 bit integers per node, in
+       postorder: the indices of the tag and of the attribute names and
+       the number of subnodes
+    3. the attribute values of all the nodes
+    4. the texts of all the nodes
+    5. the data of the numpy arrays stored as texts, contiguously
+
+    The attribute values and the texts can be strings, numbers, booleans
+    or None (the texts also numpy arrays, as in :class:`ArrayNode`).
+    Lazy subnodes are consumed. The tree is walked iteratively.
+    """
+    tag_ids = {}
+    key_ids = {(): 0}
+    ints, values, texts, arrays = [], [], [], []
+    # preorder visit from right to left, which is postorder reversed
+    stack = [root]
+    pop, extend = stack.pop, stack.extend
+    while stack:
+        node = pop()
+        try:
+            tag_id = tag_ids[node.tag]
+        except KeyError:
+            tag_id = tag_ids[node.tag] = len(tag_ids)
+        attrib = node.attrib
+        keys = tuple(attrib)
+        try:
+            key_id = key_ids[keys]
+        except KeyError:
+            key_id = key_ids[keys] = len(key_ids)
+        values.extend(attrib.itervalues())
+        nodes = node.nodes
+        if not isinstance(nodes, list):
+            nodes = list(nodes)
+        text = node.text
+        if isinstance(text, numpy.ndarray):
+            arrays.append(text)
+            text = Ellipsis  # placeholder
+        ints.extend((len(nodes), key_id, tag_id))
+        texts.append(text)
+        extend(nodes)
+    ints.reverse()
+    texts.reverse()
+    arrays.reverse()
+    tables = (sorted(tag_ids, key=tag_ids.get),
+              sorted(key_ids, key=key_ids.get),
+              [(arr.dtype.str, arr.shape, arr.size) for arr in arrays])
+    ints = array.array('i', ints)
+    if sys.byteorder == 'big':
+        ints.byteswap()
+    sections = [marshal.dumps(tables, 2),
+                ints.tostring(),
+                _marshal(values),
+                _marshal(texts),
+                ''.join(numpy.ascontiguousarray(arr).tostring()
+                        for arr in arrays)]
+    return BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                              *map(len, sections)) + ''.join(sections)
+
+
+def node_from_binary(data, nodecls=Node):
+    """
+    Convert a string generated by :func:`node_to_binary` into a Node
+    object. The nodes are created without calling `nodecls.__init__`, as
+    when unpickling, so `nodecls` must be Node or a subclass of it
+    without additional slots.
+    """
+    if len(data) >= BINARY_HEADER.size:
+        header = BINARY_HEADER.unpack_from(data)
+    if (len(data) < BINARY_HEADER.size or header[0] != BINARY_MAGIC or
+            header[1] != BINARY_VERSION or
+            len(data) != BINARY_HEADER.size + sum(header[2:])):
+        raise ValueError('Not a binary Node tree, version %d' %
+                         BINARY_VERSION)
+    sections = []
+    offset = BINARY_HEADER.size
+    for size in header[2:]:
+        sections.append(buffer(data, offset, size))
+        offset += size
+    tags, keys, specs = marshal.loads(sections[0])
+    ints = array.array('i')
+    ints.fromstring(sections[1])
+    if sys.byteorder == 'big':
+        ints.byteswap()
+    values = marshal.loads(sections[2])
+    texts = marshal.loads(sections[3])
+    if specs:
+        blob = bytearray(sections[4])  # the arrays must be writeable
+        arrays = []
+        offset = 0
+        for dtype, shape, size in specs:
+            dtype = numpy.dtype(dtype)
+            arr = numpy.frombuffer(blob, dtype, size, offset)
+            arrays.append(arr if len(shape) == 1 else arr.reshape(shape))
+            offset += size * dtype.itemsize
+        arrays = iter(arrays)
+        texts = [arrays.next() if text is Ellipsis else text
+                 for text in texts]
+
+    # the values have been stored in reverse postorder: they are
+    # consumed from the end; the subnodes of a node are the last ones
+    # on the stack
+    set_text = _NODE_TEXT.__set__  # skip the parsing in ArrayNode
+    new = object.__new__
+    izip = itertools.izip
+    stack = []
+    append = stack.append
+    end = len(values)
+    for tag_id, key_id, nsub, text in izip(
+            ints[0::3], ints[1::3], ints[2::3], texts):
+        node = new(nodecls)
+        node.tag = tags[tag_id]
+        names = keys[key_id]
+        if names:
+            start = end - len(names)
+            node.attrib = dict(izip(names, values[start:end]))
+            end = start
+        else:
+            node.attrib = {}
+        set_text(node, text)
+        if nsub:
+            node.nodes = stack[-nsub:]
+            del stack[-nsub:]
+        else:
+            node.nodes = []
+        node._index = None
+        append(node)
+    return stack[0]
+
+
 def node_from_elem(elem, nodecls=Node):
     """
-    Convert (recursively) an ElementTree object into a Node object.
+    Convert an ElementTree object into a Node object. The tree is
+    walked iteratively, so there is no limit on its depth; comments and
+    processing instructions are skipped.
     """
-    children = list(elem)
-    if not children:
-        return nodecls(elem.tag, dict(elem.attrib), elem.text)
-    return nodecls(elem.tag, dict(elem.attrib),
-                   nodes=map(node_from_elem, children))
+    if not len(elem):
+        return nodecls(elem.tag, dict(elem.items()), elem.text)
+    tags = {}  # qualified tag -> short tag, shared by the nodes
+    root = nodecls(elem.tag, dict(elem.items()), nodes=[])
+    stack = [(root, elem)]
+    while stack:
+        node, elem = stack.pop()
+        append = node.nodes.append
+        for child in elem:
+            try:
+                tag = tags[child.tag]
+            except KeyError:
+                if not isinstance(child.tag, basestring):  # comment or PI
+                    continue
+                tag = tags[child.tag] = strip_fqtag(child.tag)
+            if len(child):
+                subnode = nodecls(tag, dict(child.items()), nodes=[])
+                stack.append((subnode, child))
+            else:
+                subnode = nodecls(tag, dict(child.items()), child.text)
+            append(subnode)
+    return root
 
 
-# taken from https://gist.github.com/651801, which comes for the effbot
 def node_to_elem(root):
     """
-    Convert (recursively) a Node object into an ElementTree object.
+    Convert a Node object into an lxml element. The tree is walked
+    iteratively, so there is no limit on its depth.
     """
-    def generate_elem(append, node, level):
-        var = "e" + str(level)
-        arg = repr(node.tag)
-        if node.attrib:
-            arg += ", **%r" % node.attrib
-        if level == 1:
-            append("e1 = Element(%s)" % arg)
-        else:
-            append("%s = SubElement(e%d, %s)" % (var, level - 1, arg))
-        if not node.nodes:
-            append("%s.text = %r" % (var, node.text))
-        for x in node:
-            generate_elem(append, x, level + 1)
-    # generate code to create a tree
-    output = []
-    generate_elem(output.append, root, 1)  # print "\n".join(output)
-    namespace = {"Element": etree.Element, "SubElement": etree.SubElement}
-    exec "\n".join(output) in namespace
-    return namespace["e1"]
+    top = _element(root.tag, root.attrib)
+    if not root.nodes:
+        top.text = _elem_text(root.text)
+        return top
+    stack = [(root, top)]
+    subelement = etree.SubElement
+    while stack:
+        node, elem = stack.pop()
+        for subnode in node:
+            try:
+                subelem = subelement(elem, subnode.tag, subnode.attrib)
+            except TypeError:  # typed attributes, see xsd.Converters
+                subelem = subelement(elem, subnode.tag,
+                                     _elem_attrib(subnode.attrib))
+            if subnode.nodes:
+                stack.append((subnode, subelem))
+            else:
+                subelem.text = _elem_text(subnode.text)
+    return top
+
+
+def _element(tag, attrib):
+    """An lxml element with the given tag and attributes"""
+    try:
+        return etree.Element(tag, attrib)
+    except TypeError:  # typed attributes, see xsd.Converters
+        return etree.Element(tag, _elem_attrib(attrib))
+
+
+def _elem_attrib(attrib):
+    """The attributes of a node as accepted by lxml"""
+    return dict((name, totext(value)) for name, value in attrib.iteritems())
+
+
+def _elem_text(text):
+    """The text of a node as accepted by lxml"""
+    if text is None or isinstance(text, basestring):
+        return text
+    return totext(text)
 
 
 def node_from_xml(xmlfile, nodecls=Node, parser=nrmllib.COMPATPARSER):
@@ -500,32 +1029,183 @@ def node_to_xml(node, output=sys.stdout):
         w.serialize(node)
 
 
-def node_from_nrml(xmlfile, nodecls=Node):
+#: Tags of the NRML containers with many subnodes, which are generated
+#: lazily by :func:`node_from_nrml` with `lazy=True`
+LAZY_TAGS = frozenset([
+    'assets', 'sourceModel', 'siteModel', 'hazardCurves', 'hazardMap',
+    'gmf', 'stochasticEventSet', 'lossCurves', 'lossMap', 'bcrMap',
+    'collapseMap', 'dmgDistPerAsset'])
+
+
+def node_from_nrml(xmlfile, nodecls=Node, validate=None, lazy=False,
+                   prefixed=False):
     """
-    Convert a NRML file into a Node object.
+    Convert a NRML file into a Node object, in a single pass: the nodes
+    are built from the iterparse events, while the file is validated,
+    and the lxml elements are discarded as soon as they are converted.
+
+    With `lazy=True` the subnodes of the containers in :data:`LAZY_TAGS`
+    are a generator, which reads the file while it is iterated; the
+    nodes following a lazy container are added to its parent when the
+    container has been read. The tree must then be traversed once, in
+    document order, as :func:`node_to_xml` and :func:`node_to_nrml` do,
+    so that a file of any size can be converted in constant memory::
+
+     >> node_to_xml(node_from_nrml('exposure.xml', lazy=True), output)
 
     :param xmlfile: a file name or file object open for reading
+    :param validate:
+        True, False or 'once', see :func:`openquake.nrmllib.check_validation`;
+        if None, :data:`openquake.nrmllib.VALIDATE` is used
+    :param lazy: if True, generate the subnodes of the large containers
+    :param prefixed:
+        if True, the tags and the attributes in the GML namespace keep
+        their prefix, as in `gml:pos` and `gml:id`, so that the node can
+        be written back as a valid NRML file with :func:`node_to_xml`
+    :raises openquake.nrmllib.InvalidFile:
+        if the file is invalid; in lazy mode, the error can be raised
+        while iterating on the subnodes
     """
-    root = nrmllib.assert_valid(xmlfile).getroot()
-    node = node_from_elem(root, nodecls)
-    for nsname, nsvalue in root.nsmap.iteritems():
-        if nsname is None:
-            node['xmlns'] = nsvalue
+    top = nodecls('top', nodes=[])  # the parent of the root node
+    _build_nodes(_iterparse_nrml(xmlfile, validate), [top], nodecls,
+                 _PrefixedTags() if prefixed else {},
+                 LAZY_TAGS if lazy else ())
+    return top.nodes[0]
+
+
+class _PrefixedTags(dict):
+    """
+    A cache qualified tag -> short tag for :func:`_new_node`, where the
+    namespaces of :data:`openquake.nrmllib.SERIALIZE_NS_MAP` other than
+    the default one are replaced by their prefix.
+    """
+    prefixes = dict((ns, prefix) for prefix, ns in
+                    nrmllib.SERIALIZE_NS_MAP.iteritems() if prefix)
+
+    def __missing__(self, fqtag):
+        tag = strip_fqtag(fqtag)
+        prefix = self.prefixes.get(fqtag[1:-len(tag) - 1])
+        self[fqtag] = tag = '%s:%s' % (prefix, tag) if prefix else tag
+        return tag
+
+
+def _iterparse_nrml(xmlfile, validate):
+    """
+    Generate the start and end events of a NRML file, raising an
+    InvalidFile error if it is invalid and recording its validation
+    in 'once' mode when it has been read.
+    """
+    validate, digest = nrmllib.check_validation(xmlfile, validate)
+    try:
+        for event in nrmllib.iterparse_tree(
+                xmlfile, ('start', 'end'), validate=validate):
+            yield event
+    except etree.XMLSyntaxError as e:
+        fname = xmlfile if isinstance(xmlfile, basestring) else getattr(
+            xmlfile, 'name', '<%s>' % xmlfile.__class__.__name__)
+        raise nrmllib.InvalidFile('%s:%s' % (fname, e))
+    nrmllib.mark_validated(digest)
+
+
+def _new_node(elem, nodecls, tags):
+    """
+    Build a node with the tag and the attributes of an element at its
+    start event; `tags` is a cache of the short tags. With a
+    :class:`_PrefixedTags` cache the qualified attribute names are
+    prefixed too, as in `gml:id`.
+    """
+    try:
+        tag = tags[elem.tag]
+    except KeyError:
+        tag = tags[elem.tag] = strip_fqtag(elem.tag)
+    if tags.__class__ is _PrefixedTags:
+        return nodecls(tag, dict((tags[name], value)
+                                 for name, value in elem.items()), nodes=[])
+    return nodecls(tag, dict(elem.items()), nodes=[])
+
+
+def _end_node(elem, node):
+    """
+    Complete a node at the end event of its element, then discard the
+    element and its previous siblings, which have been converted.
+    """
+    if not node.nodes:  # leaf
+        node.text = elem.text
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _build_nodes(events, stack, nodecls, tags, lazy_tags):
+    """
+    Build the nodes from the start and end events, appending them to the
+    open nodes in `stack`, until the end of the document. If a container
+    with a tag in `lazy_tags` starts, its subnodes become a generator
+    reading the next events and the function returns.
+    """
+    for event, elem in events:
+        if event == 'start':
+            node = _new_node(elem, nodecls, tags)
+            if len(stack) == 1:  # root
+                for nsname, nsvalue in elem.nsmap.iteritems():
+                    if nsname is None:
+                        node['xmlns'] = nsvalue
+                    else:
+                        node['xmlns:%s' % nsname] = nsvalue
+            stack[-1].nodes.append(node)
+            stack.append(node)
+            if node.tag in lazy_tags:
+                node.nodes = _lazy_nodes(events, stack, nodecls, tags,
+                                         lazy_tags)
+                return
         else:
-            node['xmlns:%s' % nsname] = nsvalue
-    return node
+            _end_node(elem, stack.pop())
+
+
+def _lazy_nodes(events, stack, nodecls, tags, lazy_tags):
+    """
+    Generate the subnodes of the lazy container on top of the stack, each
+    one completely built; at the end of the container, build the rest of
+    the document.
+    """
+    depth = len(stack)
+    for event, elem in events:
+        if event == 'start':
+            node = _new_node(elem, nodecls, tags)
+            if len(stack) > depth:
+                stack[-1].nodes.append(node)
+            stack.append(node)
+        elif len(stack) > depth:
+            node = stack.pop()
+            _end_node(elem, node)
+            if len(stack) == depth:
+                yield node
+        else:  # end of the container
+            _end_node(elem, stack.pop())
+            _build_nodes(events, stack, nodecls, tags, lazy_tags)
+            return
 
 
-def node_to_nrml(node, output=sys.stdout, nsmap=None):
+def node_to_nrml(node, output=sys.stdout, nsmap=None, validate=None):
     """
     Convert a node into a NRML file. output must be a file
     object open in write mode. If you want to perform a
-    consistency check, open it in read-write mode, then it will
-    be read after creation and checked against the NRML schema.
+    consistency check, open it in read-write mode or set `validate`:
+    then the document will be checked against the NRML schema while it is
+    written, without reading it back and without keeping it in memory,
+    so that lazy trees can be written and validated in a single pass.
 
     :params node: a Node object
     :params output: a file-like object in write or read-write mode
     :params nsmap: a dictionary with the XML namespaces (default the NRML ones)
+    :params validate:
+        True or False; if None, validate only if output is in read-write
+        mode
+    :raises InvalidFile:
+        if the document is invalid; the error is raised after the whole
+        document has been written
     """
     assert isinstance(node, Node), node  # better safe than sorry
     nsmap = nsmap or nrmllib.SERIALIZE_NS_MAP
@@ -535,10 +1215,84 @@ def node_to_nrml(node, output=sys.stdout, nsmap=None):
             root['xmlns'] = nsvalue
         else:
             root['xmlns:%s' % nsname] = nsvalue
-    node_to_xml(root, output)
-    if hasattr(output, 'mode') and '+' in output.mode:  # read-write mode
-        output.seek(0)
-        nrmllib.assert_valid(output)
+    if validate is None:
+        validate = '+' in getattr(output, 'mode', '')
+    if not validate:
+        node_to_xml(root, output)
+        return
+    stream = _ValidatingStream(output)
+    node_to_xml(root, stream)
+    stream.close()
+
+
+class _ValidatingStream(object):
+    """
+    A write-only file-like object writing the data on `output` and feeding
+    it to a validating pull parser, in chunks of `bufsize` bytes. After
+    each chunk the complete elements are discarded from the parsed tree,
+    so the memory occupation does not depend on the size of the document.
+    The first validation error is kept and raised by :meth:`close`, so the
+    whole document is written anyway, as when it was validated by reading
+    it back.
+    """
+    def __init__(self, output, bufsize=65536):
+        self.output = output
+        self.bufsize = bufsize
+        self.name = getattr(output, 'name', '<%s>' %
+                            output.__class__.__name__)
+        # the only event is the start of the root element
+        self.parser = etree.XMLPullParser(
+            ('start',), tag='{*}nrml', schema=nrmllib.nrml_schema())
+        self.root = None
+        self.chunks = []
+        self.size = 0
+        self.error = None
+
+    def write(self, data):
+        self.output.write(data)
+        if self.error is not None:  # no need to parse the rest
+            return
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.bufsize:
+            self._feed()
+
+    def _feed(self):
+        """Parse the buffered data and discard the complete elements"""
+        try:
+            self.parser.feed(''.join(self.chunks))
+        except etree.XMLSyntaxError as e:
+            self.error = nrmllib.InvalidFile('%s:%s' % (self.name, e))
+        self.chunks = []
+        self.size = 0
+        if self.error is not None:
+            return
+        if self.root is None:
+            for _, self.root in self.parser.read_events():
+                break
+        # only the last child of an element can be incomplete; the
+        # schema is checked by the parser, not on the tree
+        elem = self.root
+        while elem is not None and len(elem):
+            if len(elem) > 1:
+                del elem[:-1]
+            elem = elem[-1]
+
+    def close(self):
+        """
+        Parse the remaining data and complete the validation.
+
+        :raises InvalidFile: if the document is invalid
+        """
+        if self.error is None:
+            self._feed()
+        if self.error is None:
+            try:
+                self.parser.close()
+            except etree.XMLSyntaxError as e:
+                self.error = nrmllib.InvalidFile('%s:%s' % (self.name, e))
+        if self.error is not None:
+            raise self.error
 
 
 def node_from_ini(ini_file, nodecls=Node, root_name='ini'):
@@ -572,7 +1326,93 @@ def node_to_ini(node, output=sys.stdout):
     output.flush()
 
 
-def node_copy(node, nodecls=Node):
-    """Make a deep copy of the node"""
-    return nodecls(node.tag, node.attrib.copy(), node.text,
-                   [node_copy(n, nodecls) for n in node])
+def node_copy(node, nodecls=Node, shared=False):
+    """
+    Make a deep copy of the node; the tree is walked iteratively and the
+    numpy arrays used as texts are copied too. Lazy subnodes are
+    consumed.
+
+    :param nodecls:
+        the class of the copied nodes; the nodes of other classes are
+        converted by calling it, e.g. ArrayNode parses the numeric texts
+    :param shared:
+        if True, copy only the node and its attributes: the copy gets a
+        new list containing the same subnodes, which are shared with the
+        original. Adding, removing or replacing subnodes in the copy does
+        not affect the original, while changing a shared subnode does;
+        see :func:`node_edit` to change the subnodes copy-on-write.
+    """
+    if shared:
+        return nodecls(node.tag, node.attrib.copy(), _copy_text(node.text),
+                       list(node.nodes))
+    root = nodecls(node.tag, node.attrib.copy(), _copy_text(node.text))
+    # the subnodes of class nodecls are created without calling __init__,
+    # as in node_from_binary, since tags and texts are already normalized;
+    # the others are converted by nodecls, e.g. the texts by ArrayNode
+    set_text = _NODE_TEXT.__set__
+    new = object.__new__
+    ndarray = numpy.ndarray
+    stack = [(node, root)]
+    while stack:
+        node, copy = stack.pop()
+        append = copy.nodes.append
+        for subnode in node:
+            text = subnode.text
+            if isinstance(text, ndarray):
+                text = text.copy()
+            if type(subnode) is nodecls:
+                subcopy = new(nodecls)
+                subcopy.tag = subnode.tag
+                subcopy.attrib = subnode.attrib.copy()
+                set_text(subcopy, text)
+                subcopy.nodes = []
+                subcopy._index = None
+            else:
+                subcopy = nodecls(subnode.tag, subnode.attrib.copy(), text)
+            if subnode.nodes:
+                stack.append((subnode, subcopy))
+            append(subcopy)
+    return root
+
+
+def _copy_text(text):
+    """The text of a node, copied if mutable"""
+    if isinstance(text, numpy.ndarray):
+        return text.copy()
+    return text
+
+
+def node_edit(root, paths, nodecls=Node):
+    """
+    Copy-on-write editing of a tree. Returns a copy of `root` and the
+    copies of the nodes at the given paths, which can be modified freely
+    without affecting the original tree. Only the nodes along the paths
+    are copied, with :func:`node_copy` in shared mode: all the other
+    nodes are shared between the copy and the original, so the cost is
+    proportional to the number of paths and to the number of siblings
+    along them, not to the size of the tree.
+
+    >>> root = Node('root', nodes=[Node('a', {'x': '1'}), Node('b')])
+    >>> new, [a] = node_edit(root, [(0,)])
+    >>> a['x'] = '2'
+    >>> root.a['x'], new.a['x'], new.b is root.b
+    ('1', '2', True)
+
+    :param root: a Node object
+    :param paths: a sequence of paths, i.e. sequences of subnode indices
+    :returns: a pair (copy of root, list of copied nodes, one per path)
+    """
+    new_root = node_copy(root, nodecls, shared=True)
+    copies = set([id(new_root)])  # the nodes copied so far
+    targets = []
+    for path in paths:
+        node = new_root
+        for i in path:
+            subnode = node.nodes[i]
+            if id(subnode) not in copies:
+                subnode = node_copy(subnode, nodecls, shared=True)
+                copies.add(id(subnode))
+                node[i] = subnode
+            node = subnode
+        targets.append(node)
+    return new_root, targets
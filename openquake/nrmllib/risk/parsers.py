@@ -18,10 +18,11 @@
 Module containing parsers for risk input artifacts.
 """
 
-from lxml import etree
+from cStringIO import StringIO
 from collections import namedtuple
 
 import openquake.nrmllib
+from openquake.nrmllib import index
 
 NRML = "{%s}" % openquake.nrmllib.NAMESPACE
 GML = "{%s}" % openquake.nrmllib.GML_NAMESPACE
@@ -72,11 +73,19 @@ class ExposureModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param spatial_index:
+        Optional :class:`openquake.nrmllib.spatial.SpatialIndex`; the
+        parsed assets are added to it.
+    :param validate:
+        Validation mode, True, False or 'once'; by default
+        :data:`openquake.nrmllib.VALIDATE`, see
+        :func:`openquake.nrmllib.check_validation`.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, spatial_index=None, validate=None):
         self._source = source
-        openquake.nrmllib.assert_valid(self._source)
+        self.spatial_index = spatial_index
+        openquake.nrmllib.validate_source(self._source, validate)
 
         # contains the data of the node currently parsed.
         self._meta = None
@@ -85,77 +94,107 @@ class ExposureModelParser(object):
         """
         Parse the document iteratively.
         """
+        # the constructor has already validated the document, if needed
+        return openquake.nrmllib.iterhandle(
+            self._source, {'asset': self._parse_asset}, validate=False)
 
-        schema = etree.XMLSchema(etree.parse(
-            openquake.nrmllib.nrml_schema_file()))
+    def _parse_asset(self, element):
+        """
+        Convert an <asset> element into an `AssetData` instance.
+        """
+        # the assets come at their end event, so the exposure metadata
+        # is read from the grandparent <exposureModel> of the first one
+        if self._meta is None:
+            self._meta = _to_exposure_metadata(
+                element.getparent().getparent())
+
+        if element.get('area') is not None:
+            area = float(element.get('area'))
+        else:
+            area = None
+
+        if element.get('number') is not None:
+            number = float(element.get('number'))
+        else:
+            number = None
+
+        point_elem = element.find('%slocation' % NRML)
+
+        site_data = AssetData(
+            exposure_metadata=self._meta,
+            site=Site(float(point_elem.get("lon")),
+                      float(point_elem.get("lat"))),
+            asset_ref=element.get('id'),
+            taxonomy=element.get('taxonomy'),
+            area=area,
+            number=number,
+            costs=_to_costs(element),
+            occupancy=_to_occupancy(element))
+        if self.spatial_index is not None:
+            self.spatial_index.add(
+                site_data.site.longitude, site_data.site.latitude,
+                site_data)
+        return site_data
+
+    @classmethod
+    def get_asset(cls, source, asset_ref):
+        """
+        Decode a single asset, without parsing the rest of the file.
+
+        The byte offsets of the assets are stored in a sidecar index file
+        (see :class:`openquake.nrmllib.index.NRMLIndex`), built on the first
+        call and reused until the exposure file changes. This is a
+        classmethod, since instantiating the parser validates the whole
+        document.
+
+        :param str source:
+            Name of the exposure file.
+        :param str asset_ref:
+            The ID of the asset.
+        :returns:
+            An `AssetData` instance.
+        :raises KeyError:
+            If there is no asset with the given ID.
+        """
+        idx = index.NRMLIndex.get(source, ['asset'])
+        return iter(cls(StringIO(idx.document(asset_ref)))).next()
 
-        for event, element in etree.iterparse(
-                self._source, events=('start', 'end'), schema=schema):
 
-            # exposure metadata
-            if event == 'start' and element.tag == '%sexposureModel' % NRML:
-                desc = element.find('%sdescription' % NRML)
-                if desc is not None:
-                    desc = desc.text
-                else:
-                    desc = ""
-
-                self._meta = ExposureMetadata(
-                    exposure_id=element.get('id'),
-                    description=desc,
-                    taxonomy_source=element.get('taxonomySource'),
-                    asset_category=str(element.get('category')),
-                    conversions=Conversions(
-                        cost_types=[], area_type=None, area_unit=None,
-                        deductible_is_absolute=True,
-                        insurance_limit_is_absolute=True))
-
-            # conversions
-            if event == 'start' and element.tag == "%sarea" % NRML:
-                self._meta.conversions.area_type = element.get('type')
-                self._meta.conversions.area_unit = element.get('unit')
-            elif event == 'start' and element.tag == "%sdeductible" % NRML:
-                self._meta.conversions.deductible_is_absolute = not (
-                    element.get('isAbsolute', "false") == "false")
-            elif event == 'start' and element.tag == "%sinsuranceLimit" % NRML:
-                self._meta.conversions.insurance_limit_is_absolute = not (
-                    element.get('isAbsolute', "false") == "false")
-            elif event == 'start' and element.tag == "%scostType" % NRML:
-                self._meta.conversions.cost_types.append(
+def _to_exposure_metadata(element):
+    """
+    Convert an 'exposureModel' element (without its assets) into an
+    `ExposureMetadata` named tuple.
+    """
+    desc = element.find('%sdescription' % NRML)
+    conversions = Conversions(
+        cost_types=[], area_type=None, area_unit=None,
+        deductible_is_absolute=True, insurance_limit_is_absolute=True)
+    conv = element.find('%sconversions' % NRML)
+    if conv is not None:
+        for elem in conv.iter():
+            if elem.tag == "%sarea" % NRML:
+                conversions.area_type = elem.get('type')
+                conversions.area_unit = elem.get('unit')
+            elif elem.tag == "%sdeductible" % NRML:
+                conversions.deductible_is_absolute = not (
+                    elem.get('isAbsolute', "false") == "false")
+            elif elem.tag == "%sinsuranceLimit" % NRML:
+                conversions.insurance_limit_is_absolute = not (
+                    elem.get('isAbsolute', "false") == "false")
+            elif elem.tag == "%scostType" % NRML:
+                conversions.cost_types.append(
                     CostType(
-                        name=element.get('name'),
-                        conversion_type=element.get('type'),
-                        unit=element.get('unit'),
-                        retrofitted_type=element.get('retrofittedType'),
-                        retrofitted_unit=element.get('retrofittedUnit')))
-
-            # asset data
-            elif event == 'end' and element.tag == '%sasset' % NRML:
-                if element.get('area') is not None:
-                    area = float(element.get('area'))
-                else:
-                    area = None
-
-                if element.get('number') is not None:
-                    number = float(element.get('number'))
-                else:
-                    number = None
-
-                point_elem = element.find('%slocation' % NRML)
-
-                site_data = AssetData(
-                    exposure_metadata=self._meta,
-                    site=Site(float(point_elem.get("lon")),
-                              float(point_elem.get("lat"))),
-                    asset_ref=element.get('id'),
-                    taxonomy=element.get('taxonomy'),
-                    area=area,
-                    number=number,
-                    costs=_to_costs(element),
-                    occupancy=_to_occupancy(element))
-                del element
-
-                yield site_data
+                        name=elem.get('name'),
+                        conversion_type=elem.get('type'),
+                        unit=elem.get('unit'),
+                        retrofitted_type=elem.get('retrofittedType'),
+                        retrofitted_unit=elem.get('retrofittedUnit')))
+    return ExposureMetadata(
+        exposure_id=element.get('id'),
+        description=desc.text if desc is not None else "",
+        taxonomy_source=element.get('taxonomySource'),
+        asset_category=str(element.get('category')),
+        conversions=conversions)
 
 
 def _to_occupancy(element):
@@ -212,45 +251,53 @@ class VulnerabilityModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param validate:
+        Validation mode, see :class:`ExposureModelParser`.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, validate=None):
         self._source = source
-        openquake.nrmllib.assert_valid(self._source)
-
-        self._vulnerability_model = etree.parse(self._source).getroot()
+        openquake.nrmllib.validate_source(self._source, validate)
 
     def __iter__(self):
         """
         Parse the vulnerability model.
         """
+        # the set attributes are read from the parent of the first function
+        # of each set, since the following ones come after the IML element
+        # has been deleted; the sets are told apart by their element, since
+        # nothing forbids two sets with the same ID
+        vset = dict(elem=None, attrs=None)
 
-        for vulnerability_set in self._vulnerability_model.findall(
-                ".//%sdiscreteVulnerabilitySet" % NRML):
+        def vulnerability(vf):
+            parent = vf.getparent()
+            if parent is not vset['elem']:
+                vset['elem'] = parent
+                vset['attrs'] = self._parse_set_attributes(parent)
+            vulnerability_function = dict(vset['attrs'])
 
-            vulnerability_function = self._parse_set_attributes(
-                vulnerability_set)
+            loss_ratios = [float(x) for x in vf.find(
+                "%slossRatio" % NRML).text.strip().split()]
 
-            for vf in vulnerability_set.findall(
-                    ".//%sdiscreteVulnerability" % NRML):
+            coefficients_variation = [float(x) for x in vf.find(
+                "%scoefficientsVariation" % NRML).text.strip().split()]
 
-                loss_ratios = [float(x) for x in vf.find(
-                    "%slossRatio" % NRML).text.strip().split()]
+            vulnerability_function["ID"] = vf.attrib[
+                "vulnerabilityFunctionID"]
 
-                coefficients_variation = [float(x) for x in vf.find(
-                    "%scoefficientsVariation" % NRML).text.strip().split()]
+            vulnerability_function["probabilisticDistribution"] = \
+                vf.attrib["probabilisticDistribution"]
 
-                vulnerability_function["ID"] = vf.attrib[
-                    "vulnerabilityFunctionID"]
+            vulnerability_function["lossRatio"] = loss_ratios
+            vulnerability_function["coefficientsVariation"] = \
+                coefficients_variation
 
-                vulnerability_function["probabilisticDistribution"] = \
-                    vf.attrib["probabilisticDistribution"]
+            return vulnerability_function
 
-                vulnerability_function["lossRatio"] = loss_ratios
-                vulnerability_function["coefficientsVariation"] = \
-                    coefficients_variation
-
-                yield dict(vulnerability_function)
+        # the constructor has already validated the document, if needed
+        return openquake.nrmllib.iterhandle(
+            self._source, {'discreteVulnerability': vulnerability},
+            validate=False)
 
     @staticmethod
     def _parse_set_attributes(vset):
@@ -274,7 +321,7 @@ class VulnerabilityModelParser(object):
 
 def find(tag, elem):
     "Find all the subelements matching the given tag"
-    return elem.findall(NRML + tag, elem)
+    return elem.findall(NRML + tag)
 
 
 def findone(tag, elem, default=None):
@@ -283,7 +330,7 @@ def findone(tag, elem, default=None):
     if there are too many elements and returns the default if there is
     no match.
     """
-    elems = elem.findall(NRML + tag, elem)
+    elems = elem.findall(NRML + tag)
     n = len(elems)
     if n == 0:  # not found
         return default
@@ -303,12 +350,13 @@ class FragilityModelParser(object):
 
     :param source:
         Filename or file-like object containing the XML data.
+    :param validate:
+        Validation mode, see :class:`ExposureModelParser`.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, validate=None):
         self._source = source
-        openquake.nrmllib.assert_valid(self._source)
-        self._fragility_model = etree.parse(self._source).getroot()
+        openquake.nrmllib.validate_source(self._source, validate)
         self.limit_states = None
 
     def __iter__(self):
@@ -317,41 +365,58 @@ class FragilityModelParser(object):
         format and the limit states, then the fragility function
         params
         """
-        fragilityModel = findone('fragilityModel', self._fragility_model)
-        fmt = fragilityModel.attrib['format']
-        self.limit_states = findone('limitStates', fragilityModel).text.split()
-        yield fmt, self.limit_states
-
-        for ffs in find('ffs', fragilityModel):
-            taxonomy = findone('taxonomy', ffs).text
-            iml_element = findone('IML', ffs)
-            iml = dict(IMT=iml_element.attrib['IMT'])
-
-            # in discrete case we expect to find the levels in the text of IML
-            # element.
-            if fmt == 'discrete':
-                iml['imls'] = map(float, iml_element.text.split())
-            else:
-                iml['imls'] = None
-
-            no_damage_limit = ffs.attrib.get('noDamageLimit')
-            if no_damage_limit:
-                no_damage_limit = float(no_damage_limit)
-            if fmt == 'discrete':
-                all_params = [(ffd.attrib['ls'],
-                               map(float, findone('poEs', ffd).text.split()))
-                              for ffd in find('ffd', ffs)]
-            else:  # continuous
-                all_params = [(ffc.attrib['ls'],
-                               (float(findone('params', ffc).attrib['mean']),
-                                float(
-                                    findone('params', ffc).attrib['stddev'])))
-                              for ffc in find('ffc', ffs)]
-            all_params = map(
-                lambda x: x[1],
-                sorted(all_params,
-                       key=lambda x: self.limit_states.index(x[0])))
-            yield taxonomy, iml, all_params, no_damage_limit
+        # the constructor has already validated the document, if needed
+        elements = openquake.nrmllib.iterelements(
+            self._source, ['fragilityModel', 'ffs'], validate=False)
+        fmt = None
+        for element in elements:
+            if fmt is None:
+                # the header is read from the parent of the first ffs,
+                # before its preceding siblings are deleted
+                if element.tag == '%sfragilityModel' % NRML:
+                    fragilityModel = element
+                else:
+                    fragilityModel = element.getparent()
+                fmt = fragilityModel.attrib['format']
+                self.limit_states = findone(
+                    'limitStates', fragilityModel).text.split()
+                yield fmt, self.limit_states
+            if element.tag == '%sffs' % NRML:
+                yield self._parse_ffs(element, fmt)
+
+    def _parse_ffs(self, ffs, fmt):
+        """
+        Returns the tuple (taxonomy, iml, params, no_damage_limit) for a
+        fragility function sequence.
+        """
+        taxonomy = findone('taxonomy', ffs).text
+        iml_element = findone('IML', ffs)
+        iml = dict(IMT=iml_element.attrib['IMT'])
+
+        # in discrete case we expect to find the levels in the text of IML
+        # element.
+        if fmt == 'discrete':
+            iml['imls'] = map(float, iml_element.text.split())
+        else:
+            iml['imls'] = None
+
+        no_damage_limit = ffs.attrib.get('noDamageLimit')
+        if no_damage_limit:
+            no_damage_limit = float(no_damage_limit)
+        if fmt == 'discrete':
+            all_params = [(ffd.attrib['ls'],
+                           map(float, findone('poEs', ffd).text.split()))
+                          for ffd in find('ffd', ffs)]
+        else:  # continuous
+            all_params = [(ffc.attrib['ls'],
+                           (float(findone('params', ffc).attrib['mean']),
+                            float(findone('params', ffc).attrib['stddev'])))
+                          for ffc in find('ffc', ffs)]
+        all_params = map(
+            lambda x: x[1],
+            sorted(all_params,
+                   key=lambda x: self.limit_states.index(x[0])))
+        return taxonomy, iml, all_params, no_damage_limit
 
     def _check_limit_state(self, lsi, ls):
         if ls != self.limit_states[lsi]:
@@ -0,0 +1,170 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spatial index over lon/lat locations, to associate objects parsed from
+different NRML files (for instance assets and hazard sites) by distance.
+
+The parsers of site models, hazard curves and exposures accept an
+optional :class:`SpatialIndex`, which is populated while parsing::
+
+ >> sites = SpatialIndex()
+ >> list(SiteModelParser('site_model.xml', spatial_index=sites).parse())
+ >> for asset in ExposureModelParser('exposure.xml'):
+ ..     dist, site = sites.nearest(*asset.site)
+"""
+
+import math
+from collections import defaultdict
+
+#: mean Earth radius, in km
+EARTH_RADIUS = 6371.0
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """
+    Returns the great circle distance in km between two points, given
+    their longitudes and latitudes in decimal degrees.
+
+    >>> round(haversine(0, 0, 1, 0), 3)
+    111.195
+    """
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (math.sin((lat2 - lat1) / 2.) ** 2 + math.cos(lat1) *
+         math.cos(lat2) * math.sin((lon2 - lon1) / 2.) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1., math.sqrt(a)))
+
+
+class SpatialIndex(object):
+    """
+    A grid hash over lon/lat points: the items are stored in square cells
+    of `cell_size` degrees. :meth:`nearest` looks at rings of cells of
+    increasing size around the query point, so that, for points with a
+    roughly uniform density, associating n points to m indexed points
+    costs O(n + m) instead of O(n * m). Longitudes are not wrapped
+    around the antimeridian.
+
+    :param float cell_size:
+        Size of the cells, in decimal degrees. A good choice is the typical
+        distance between neighbouring points.
+    """
+
+    def __init__(self, cell_size=0.1):
+        self.cell_size = float(cell_size)
+        self._cells = defaultdict(list)
+        self._len = 0
+        # range of the cell indices in use
+        self._imin = self._jmin = self._imax = self._jmax = None
+
+    def _cell(self, lon, lat):
+        return (int(math.floor(lon / self.cell_size)),
+                int(math.floor(lat / self.cell_size)))
+
+    def add(self, lon, lat, item):
+        """
+        Add an item located at the given longitude and latitude.
+        """
+        lon, lat = float(lon), float(lat)
+        i, j = cell = self._cell(lon, lat)
+        self._cells[cell].append((lon, lat, item))
+        if self._len:
+            self._imin = min(self._imin, i)
+            self._imax = max(self._imax, i)
+            self._jmin = min(self._jmin, j)
+            self._jmax = max(self._jmax, j)
+        else:
+            self._imin = self._imax = i
+            self._jmin = self._jmax = j
+        self._len += 1
+
+    def __len__(self):
+        return self._len
+
+    def _ring(self, i, j, r):
+        """
+        Yields the non-empty cells at Chebyshev distance `r` from (i, j).
+        """
+        cells = self._cells
+        if r == 0:
+            candidates = [(i, j)]
+        else:
+            candidates = [(i + di, j + dj) for di in (-r, r)
+                          for dj in xrange(-r, r + 1)]
+            candidates.extend((i + di, j + dj) for dj in (-r, r)
+                              for di in xrange(-r + 1, r))
+        for cell in candidates:
+            if cell in cells:
+                yield cells[cell]
+
+    def _min_distance(self, lat, r):
+        """
+        Lower bound of the distance in km between a point at latitude
+        `lat` and any point outside the ring of radius `r` around its cell.
+        """
+        delta = math.radians(min(r * self.cell_size, 90.))
+        # the closest point on a meridian at angular distance delta from
+        # the point is at asin(cos(lat) * sin(delta)) from it
+        return EARTH_RADIUS * math.asin(
+            math.cos(math.radians(lat)) * math.sin(delta))
+
+    def nearest(self, lon, lat, max_distance=None):
+        """
+        Returns the pair (distance, item) for the item closest to the given
+        location, with the distance in km, or None if the index is empty or
+        there are no items within `max_distance` km.
+        """
+        if not self._len:
+            return None
+        lon, lat = float(lon), float(lat)
+        i, j = self._cell(lon, lat)
+        # the rings beyond max_r do not contain any cell
+        max_r = max(abs(i - self._imin), abs(i - self._imax),
+                    abs(j - self._jmin), abs(j - self._jmax))
+        best = None
+        for r in xrange(max_r + 1):
+            for points in self._ring(i, j, r):
+                for plon, plat, item in points:
+                    dist = haversine(lon, lat, plon, plat)
+                    if best is None or dist < best[0]:
+                        best = (dist, item)
+            bound = self._min_distance(lat, r)
+            if max_distance is not None and bound > max_distance:
+                break
+            if best is not None and best[0] <= bound:
+                break
+        if best is None or (max_distance is not None and
+                            best[0] > max_distance):
+            return None
+        return best
+
+    def within(self, bbox):
+        """
+        Returns the items inside the bounding box
+        (min_lon, min_lat, max_lon, max_lat), boundaries included, in
+        insertion order within each cell.
+        """
+        min_lon, min_lat, max_lon, max_lat = map(float, bbox)
+        imin, jmin = self._cell(min_lon, min_lat)
+        imax, jmax = self._cell(max_lon, max_lat)
+        if (imax - imin + 1) * (jmax - jmin + 1) <= len(self._cells):
+            cells = [self._cells[i, j]
+                     for i in xrange(imin, imax + 1)
+                     for j in xrange(jmin, jmax + 1)
+                     if (i, j) in self._cells]
+        else:  # big box, cheaper to look at all the cells
+            cells = [points for (i, j), points in self._cells.iteritems()
+                     if imin <= i <= imax and jmin <= j <= jmax]
+        return [item for points in cells for lon, lat, item in points
+                if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat]
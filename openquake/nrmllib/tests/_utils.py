@@ -20,6 +20,10 @@ from xml.etree.ElementTree import parse
 
 import openquake.nrmllib
 from openquake.nrmllib.writers import tostring
+# the synthetic documents are shared with the benchmark scripts
+from openquake.nrmllib.benchmark import (
+    rss, deep_getsizeof, point_source_model, _site_model_lines, site_model,
+    IterFile, site_model_file, hazard_curves)
 
 
 def deep_eq(a, b):
@@ -49,6 +53,12 @@ def _deep_eq(a, b):
             'Class mismatch. Expected %s, got %s' % (a.__class__, b.__class__)
         )
         _test_dict(a.__dict__, b.__dict__)
+    elif hasattr(a, '__slots__') and hasattr(a, '__getstate__'):
+        # objects decorated with openquake.nrmllib.node.with_slots
+        assert a.__class__ == b.__class__, (
+            'Class mismatch. Expected %s, got %s' % (a.__class__, b.__class__)
+        )
+        _test_dict(a.__getstate__(), b.__getstate__())
     elif isinstance(a, collections.Iterable) and not isinstance(a, str):
         # If there's a generator or another type of iterable, treat it as a
         # `list`. NOTE: Generators will be exhausted if you do this.
@@ -0,0 +1,162 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import openquake.nrmllib
+from openquake.nrmllib import node as n
+from openquake.nrmllib.commands import convert
+from openquake.nrmllib.hazard import parsers
+from openquake.nrmllib.tests import _utils
+
+
+def _flat(root):
+    """
+    The tags, attributes and texts of a node tree in preorder, with the
+    indentation of the texts removed.
+    """
+    stack = [root]
+    flat = []
+    while stack:
+        node = stack.pop()
+        flat.append((node.tag, node.attrib, (node.text or '').strip()))
+        stack.extend(reversed(node.nodes))
+    return flat
+
+
+class ConvertTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        shutil.copytree('examples/source_model',
+                        os.path.join(self.tmpdir, 'source_model'))
+        for fname in glob.glob('examples/hazard-curves-*.xml'):
+            shutil.copy(fname, self.tmpdir)
+        for i in range(10):
+            with open(os.path.join(self.tmpdir, 'sites-%02d.xml' % i),
+                      'w') as fh:
+                fh.write(_utils.site_model(100 * (i + 1)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir, *names)
+
+    def test_binary_roundtrip(self):
+        fnames = list(convert.iterfiles([self.tmpdir], '.xml'))
+        pairs = [(fname, convert.output_name(fname, 'bin'))
+                 for fname in fnames]
+        serial = list(convert.convert_files(pairs, processes=1))
+        self.assertEqual([None] * len(fnames), [r[-1] for r in serial])
+        self.assertEqual(os.path.getsize(fnames[0]), serial[0][2])
+
+        src = self.path('source_model', 'mixed.xml')
+        back = self.path('mixed.xml')
+        self.assertIsNone(convert.convert_file(
+            self.path('source_model', 'mixed.bin'), back)[-1])
+        # the GML prefixes are kept, so the document is still valid
+        openquake.nrmllib.assert_valid(back)
+        self.assertEqual(_flat(n.node_from_nrml(src, prefixed=True)),
+                         _flat(n.node_from_nrml(back, prefixed=True)))
+
+    def test_geojson(self):
+        src = self.path('hazard-curves-sa.xml')
+        dst = self.path('hazard-curves-sa.geojson')
+        back = self.path('back.xml')
+        self.assertIsNone(convert.convert_file(src, dst)[-1])
+        self.assertIsNone(convert.convert_file(dst, back)[-1])
+        openquake.nrmllib.assert_valid(back)
+        expected = parsers.HazardCurveXMLParser(src).parse()
+        curves = parsers.HazardCurveXMLParser(back).parse()
+        self.assertEqual(expected.metadata, curves.metadata)
+        self.assertEqual(list(expected), list(curves))
+
+        # only hazard curves can be converted, with no partial output
+        src = self.path('sites-00.xml')
+        dst = self.path('sites-00.geojson')
+        error = convert.convert_file(src, dst)[-1]
+        self.assertIn('only hazard curves', error)
+        self.assertFalse(os.path.exists(dst))
+        self.assertIn('cannot convert', convert.convert_file(
+            src, self.path('sites-00.txt'))[-1])
+
+    def test_invalid_parallel(self):
+        # the schema errors of the parsers are reported, not raised in
+        # the worker processes
+        with open('examples/hazard-curves-pga.xml') as f:
+            xml = f.read().replace('<hazardCurve>', '<hazardCurve foo="1">')
+        invalid = self.path('invalid.xml')
+        with open(invalid, 'w') as f:
+            f.write(xml)
+        out, err = StringIO.StringIO(), StringIO.StringIO()
+        status = convert.main(['-j', '2', '--to', 'geojson', invalid,
+                               self.path('hazard-curves-pga.xml')], out, err)
+        self.assertEqual(1, status)
+        self.assertIn("attribute 'foo'", out.getvalue())
+        self.assertIn('converted 1 files', err.getvalue())
+        self.assertFalse(os.path.exists(self.path('invalid.geojson')))
+        self.assertTrue(os.path.exists(self.path('hazard-curves-pga.geojson')))
+
+    def test_outdir(self):
+        # files with the same name in different directories
+        for subdir in ('a', 'b'):
+            os.makedirs(self.path('in', subdir))
+            shutil.copy('examples/hazard-curves-pga.xml',
+                        self.path('in', subdir, 'curves.xml'))
+        outdir = self.path('out')
+        out, err = StringIO.StringIO(), StringIO.StringIO()
+        status = convert.main(['-j', '1', '--to', 'bin', '-o', outdir,
+                               self.path('in')], out, err)
+        self.assertEqual(0, status)
+        self.assertEqual(['curves.bin'], os.listdir(self.path('out', 'a')))
+        self.assertEqual(['curves.bin'], os.listdir(self.path('out', 'b')))
+
+        # as file arguments they would have the same output file
+        out = StringIO.StringIO()
+        status = convert.main(
+            ['-j', '1', '--to', 'bin', '-o', self.path('flat'),
+             self.path('in', 'a', 'curves.xml'),
+             self.path('in', 'b', 'curves.xml')], out, err)
+        self.assertEqual(1, status)
+        self.assertEqual(2, out.getvalue().count('is the output of 2 files'))
+        self.assertFalse(os.path.exists(self.path('flat')))
+
+    def test_main(self):
+        out, err = StringIO.StringIO(), StringIO.StringIO()
+        outdir = self.path('json')
+        missing = self.path('missing.xml')
+        status = convert.main(['-j', '2', '--to', 'geojson', '-o', outdir,
+                               self.tmpdir, missing], out, err)
+        self.assertEqual(1, status)
+        lines = out.getvalue().splitlines()
+        converted = [line for line in lines if ' -> ' in line]
+        self.assertEqual(5, len(converted))
+        self.assertEqual(5, len(list(convert.iterfiles([outdir], ''))))
+        self.assertTrue(converted[0].endswith('MB/s'))
+        # 6 source models, 10 site models and the missing file
+        self.assertEqual(17, len(lines) - len(converted))
+        self.assertIn('converted 5 files', err.getvalue())
+        self.assertIn('17 failed', err.getvalue())
+
+        out = StringIO.StringIO()
+        status = convert.main(['-j', '1', '--to', 'xml', outdir], out, err)
+        self.assertEqual(0, status)
+        self.assertEqual(5, len(out.getvalue().splitlines()))
@@ -0,0 +1,86 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+from openquake.nrmllib.commands import validate
+from openquake.nrmllib.tests import _utils
+
+INVALID = '''\
+<?xml version="1.0" encoding="utf-8"?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+    <siteModel/>
+</nrml>
+'''
+
+
+class ValidateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        shutil.copytree('examples/source_model',
+                        os.path.join(self.tmpdir, 'source_model'))
+        for i in range(20):
+            with open(os.path.join(self.tmpdir, 'sites-%02d.xml' % i),
+                      'w') as fh:
+                fh.write(_utils.site_model(100 * (i + 1)))
+        self.invalid = os.path.join(self.tmpdir, 'source_model', 'bad.xml')
+        with open(self.invalid, 'w') as fh:
+            fh.write(INVALID)
+        # not a NRML file, ignored when walking the directories
+        with open(os.path.join(self.tmpdir, 'README'), 'w') as fh:
+            fh.write('not xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_iterfiles(self):
+        fnames = list(validate.iterfiles([self.tmpdir, 'x.txt']))
+        self.assertEqual(28, len(fnames))
+        self.assertEqual('x.txt', fnames[-1])
+        self.assertEqual(os.path.join(self.tmpdir, 'sites-00.xml'),
+                         fnames[0])
+
+    def test_validate_files(self):
+        fnames = list(validate.iterfiles([self.tmpdir]))
+        serial = list(validate.validate_files(fnames, processes=1))
+        parallel = list(validate.validate_files(fnames, processes=2))
+        parallel.sort(key=lambda result: fnames.index(result[0]))
+        self.assertEqual(serial, parallel)
+        [(fname, size, error)] = [r for r in serial if r[2] is not None]
+        self.assertEqual(self.invalid, fname)
+        self.assertIn('siteModel', error)
+
+    def test_main(self):
+        out, err = StringIO.StringIO(), StringIO.StringIO()
+        missing = os.path.join(self.tmpdir, 'missing.xml')
+        status = validate.main(['-j', '2', self.tmpdir, missing], out, err)
+        self.assertEqual(1, status)
+        errors = sorted(out.getvalue().splitlines())
+        self.assertEqual(2, len(errors))
+        self.assertTrue(errors[0].startswith(self.invalid + ':'))
+        self.assertIn('No such file', errors[1])
+        self.assertIn('validated 28 files', err.getvalue())
+        self.assertIn('2 invalid', err.getvalue())
+
+        out = StringIO.StringIO()
+        sites = os.path.join(self.tmpdir, 'sites-01.xml')
+        status = validate.main(['-v', '-j', '1', sites], out, err)
+        self.assertEqual(0, status)
+        self.assertEqual('%s: OK\n' % sites, out.getvalue())
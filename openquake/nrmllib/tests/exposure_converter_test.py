@@ -0,0 +1,99 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import imp
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+import openquake.nrmllib
+from openquake.nrmllib import node as n
+
+converter = imp.load_source('exposure_converter',
+                            'tools/exposure-converter.py')
+
+
+class ExposureConverterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.old = os.path.join(self.tmpdir, 'old.xml')
+        self.new = os.path.join(self.tmpdir, 'new.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_old(self, n_assets):
+        with open(self.old, 'w') as fh:
+            fh.writelines(converter.legacy_exposure(n_assets))
+
+    def test_convert(self):
+        self.write_old(25)
+        calls = []
+        n_assets = converter.convert(
+            self.old, self.new, lambda *args: calls.append(args), every=10)
+        self.assertEqual(25, n_assets)
+        self.assertEqual([10, 20, 25], [num for num, fraction in calls])
+        self.assertEqual(1., calls[-1][1])
+
+        openquake.nrmllib.assert_valid(self.new)
+        model = n.node_from_nrml(self.new).exposureModel
+        self.assertEqual({'id': 'ep1', 'category': 'buildings',
+                          'taxonomySource': 'Synthetic taxonomy'},
+                         model.attrib)
+        self.assertEqual('Synthetic exposure', model.description.text)
+        self.assertEqual(
+            ['contents', 'structural'],
+            [ct['name'] for ct in model.conversions.costTypes])
+        self.assertEqual('EUR', model.conversions.costTypes[1]
+                         ['retrofittedUnit'])
+        assets = model.assets.nodes
+        self.assertEqual(25, len(assets))
+        asset = assets[11]
+        self.assertEqual({'id': 'asset_11', 'taxonomy': 'RC/DMRF-D/LR',
+                          'area': '111', 'number': '3'}, asset.attrib)
+        self.assertEqual({'lon': '0.01100', 'lat': '0.00000'},
+                         asset.location.attrib)
+        self.assertEqual({'type': 'structural', 'value': '100011',
+                          'retrofitted': '109876', 'deductible': '66',
+                          'insuranceLimit': '1999'}, asset.costs[1].attrib)
+        self.assertEqual(
+            [('11', 'day'), ('11', 'night')],
+            [(occ['occupants'], occ['period']) for occ in asset.occupancies])
+
+    def test_constant_memory(self):
+        # the elements already converted are removed from the input tree
+        events = converter.read_exposure(
+            StringIO.StringIO(''.join(converter.legacy_exposure(1000))))
+        header = next(events)
+        self.assertEqual('buildings', header[
+            converter.namespace() + 'exposureList']['assetCategory'])
+        for i, elem in enumerate(events):
+            if i > 1:  # only the previous asset is kept
+                self.assertEqual(
+                    1, len(list(elem.itersiblings(preceding=True))))
+        self.assertEqual(999, i)
+
+    def test_usage(self):
+        stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        try:
+            self.assertEqual(1, converter.main([self.old]))
+            usage = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue(usage.startswith('usage:'), usage)
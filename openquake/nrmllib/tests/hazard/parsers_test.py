@@ -16,12 +16,15 @@
 
 import StringIO
 import decimal
+import itertools
 import os
 import tempfile
 import unittest
 
+import numpy
 from lxml import etree
 
+import openquake.nrmllib
 from openquake.nrmllib import models
 
 from openquake.nrmllib.tests import _utils
@@ -264,6 +267,80 @@ m?ml version='1.0' encoding='utf-8'?>
 
         self.assertTrue(*_utils.deep_eq(exp_src_model, src_model))
 
+    def test_parse_parallel(self):
+        parser = parsers.SourceModelParser(self.SAMPLE_FILE)
+        src_model = parser.parse_parallel(processes=2, chunksize=2)
+        self.assertTrue(*_utils.deep_eq(self._expected_source_model(),
+                                        src_model))
+
+    def test_parse_parallel_unordered(self):
+        xml = _utils.point_source_model(100)
+        parser = parsers.SourceModelParser(StringIO.StringIO(xml))
+        src_model = parser.parse_parallel(
+            processes=2, chunksize=7, ordered=False)
+        self.assertEqual(src_model.name, 'Generated Source Model')
+        self.assertEqual(sorted(int(src.id) for src in src_model),
+                         range(100))
+
+    def test_parse_parallel_early_exit(self):
+        # many more chunks than the ones in the air: the pool must not
+        # hang when the sources are not all consumed
+        xml = _utils.point_source_model(200)
+        for ordered in (True, False):
+            parser = parsers.SourceModelParser(StringIO.StringIO(xml))
+            sources = iter(parser.parse_parallel(
+                processes=2, chunksize=1, ordered=ordered))
+            first = next(sources)
+            sources.close()
+            self.assertIn(int(first.id), range(200))
+
+    def test_parse_parallel_invalid_schema(self):
+        parser = parsers.SourceModelParser(
+            StringIO.StringIO(self.INVALID_SCHEMA))
+        self.assertRaises(etree.XMLSyntaxError, list,
+                          parser.parse_parallel(processes=2))
+
+    def _filtered_ids(self, **filters):
+        parser = parsers.SourceModelParser(self.SAMPLE_FILE, **filters)
+        return [src.id for src in parser.parse()]
+
+    def test_filter_ids_trts_types(self):
+        self.assertEqual(self._filtered_ids(ids=['2', '4', '42']),
+                         ['2', '4'])
+        self.assertEqual(self._filtered_ids(trts=['Active Shallow Crust']),
+                         ['1', '3'])
+        self.assertEqual(
+            self._filtered_ids(source_types=['characteristicFaultSource']),
+            ['5', '6', '7'])
+        self.assertEqual(
+            self._filtered_ids(trts=['Volcanic'], ids=['1', '5']), ['5'])
+
+    def test_filter_bbox(self):
+        # the area source (-122.5, 37.5, -121.5, 38.5) intersects the bbox,
+        # as well as the point source in (-122, 38) and the simple faults
+        self.assertEqual(self._filtered_ids(bbox=(-122.2, 37.8, -121, 39)),
+                         ['1', '2', '3', '5'])
+        self.assertEqual(self._filtered_ids(bbox=(-122.2, 37.9, -121, 39)),
+                         ['1', '2'])
+        # the complex fault sources, 3D geometries
+        self.assertEqual(self._filtered_ids(bbox=(-126, 41, -125, 42)),
+                         ['4', '6'])
+        # the planar surfaces of the multi surface characteristic source
+        self.assertEqual(self._filtered_ids(bbox=(2.5, -2, 5, 2)), ['7'])
+        self.assertEqual(self._filtered_ids(bbox=(10, 10, 11, 11)), [])
+
+    def test_filter_parse_parallel(self):
+        xml = _utils.point_source_model(
+            300, trts=['Active Shallow Crust', 'Stable Continental Crust'])
+        parser = parsers.SourceModelParser(
+            StringIO.StringIO(xml), trts=['Stable Continental Crust'],
+            bbox=(0, 0, 5, 1))
+        ids = [int(src.id) for src in parser.parse_parallel(processes=2)]
+        # the sources are on a grid with lons 0, 0.1 ... 9.9 and
+        # lats 0, 0.1, 0.2: the bbox keeps the ones with lon <= 5
+        self.assertEqual(ids, [i for i in range(300)
+                               if i % 2 and i % 100 <= 50])
+
     def test_probs_sum_to_1(self):
         # We want to test that distribution probabilities sum to 1.
         # Example source model with an area and a point source.
@@ -351,6 +428,61 @@ m?ml version='1.0' encoding='utf-8'?>
                 1.0, sum([x.probability for x in src.nodal_plane_dist]))
 
 
+class SourceModelParserBenchmarkTestCase(unittest.TestCase):
+    # raise N to 100000 to reproduce the figures for a national model
+    N = 10000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.xml = _utils.point_source_model(cls.N)
+
+    def _parse_all(self):
+        parser = parsers.SourceModelParser(StringIO.StringIO(self.xml))
+        return list(parser.parse())
+
+    def test_compiled_xpath(self):
+        # the same sources as the previous implementation, compiling each
+        # XPath expression for each source
+        compiled_xpath = parsers._xpath
+        parsers._xpath = lambda elem, expr: elem.xpath(
+            expr, namespaces=openquake.nrmllib.PARSE_NS_MAP)
+        try:
+            expected = self._parse_all()
+        finally:
+            parsers._xpath = compiled_xpath
+        self.assertEqual(self.N, len(expected))
+        self.assertEqual(expected, self._parse_all())
+
+    def test_memory(self):
+        # bytes per point source, compared with the same objects holding
+        # their attributes in an instance dictionary, as they did before
+        # the introduction of __slots__
+        parser = parsers.SourceModelParser(StringIO.StringIO(self.xml))
+        sources = list(itertools.islice(parser.parse(), 100))
+        after = _utils.deep_getsizeof(sources) / 100.
+        before = _utils.deep_getsizeof(map(_with_dict, sources)) / 100.
+        self.assertLess(after, 0.75 * before)
+
+
+class _WithDict(object):
+    pass
+
+
+def _with_dict(obj):
+    """
+    Convert (recursively) a slotted model object into an equivalent object
+    storing the attributes in the instance dictionary.
+    """
+    if isinstance(obj, list):
+        return map(_with_dict, obj)
+    elif not hasattr(obj, '__slots__') or isinstance(obj, decimal.Decimal):
+        return obj
+    new = _WithDict()
+    for name, value in obj.__getstate__().iteritems():
+        setattr(new, name, _with_dict(value))
+    return new
+
+
 class SiteModelParserTestCase(unittest.TestCase):
     """Tests for :class:`parsers.SiteModelParser`."""
 
@@ -397,6 +529,53 @@ class SiteModelParserTestCase(unittest.TestCase):
 
         self.assertTrue(*_utils.deep_eq(expected, actual))
 
+    def test_parse_arrays(self):
+        xml = _utils.site_model(250)
+        sites = list(
+            parsers.SiteModelParser(StringIO.StringIO(xml)).parse())
+        # use small blocks, to convert a partial block at the end
+        arrays = parsers.SiteModelParser(
+            StringIO.StringIO(xml)).parse_arrays(block_size=100)
+        self.assertEqual(parsers.SITE_MODEL_DT, arrays.dtype)
+        self.assertEqual(len(sites), len(arrays))
+        for site, row in zip(sites, arrays):
+            self.assertEqual(site.wkt,
+                             'POINT(%.4f %.4f)' % (row['lon'], row['lat']))
+            self.assertEqual(site.vs30, row['vs30'])
+            self.assertEqual(site.vs30_type == 'measured',
+                             row['vs30_measured'])
+            self.assertEqual(site.z1pt0, row['z1pt0'])
+            self.assertEqual(site.z2pt5, row['z2pt5'])
+
+    def test_memory(self):
+        # parse a site model with 100000 sites, generated on the fly,
+        # and make sure the memory occupation does not grow with the number
+        # of sites parsed; tools/memory-benchmark.py runs it on more sites
+        parser = parsers.SiteModelParser(_utils.site_model_file(100000))
+        for i, _site in enumerate(parser.parse()):
+            if i == 10000:
+                rss = _utils.rss()
+        allocated = _utils.rss() - rss
+        self.assertLess(allocated, 5 * 1024 * 1024)  # < 5 MB
+
+    def test_parse_arrays_single_block(self):
+        xml = _utils.site_model(20000)
+        sites = list(
+            parsers.SiteModelParser(StringIO.StringIO(xml)).parse())
+        arrays = parsers.SiteModelParser(
+            StringIO.StringIO(xml)).parse_arrays()
+        self.assertEqual(parsers.SITE_MODEL_DT, arrays.dtype)
+        self.assertEqual(20000, len(arrays))
+        numpy.testing.assert_array_equal(
+            [site.vs30 for site in sites], arrays['vs30'])
+        numpy.testing.assert_array_equal(
+            [site.vs30_type == 'measured' for site in sites],
+            arrays['vs30_measured'])
+        self.assertEqual(sites[-1].wkt, 'POINT(%.4f %.4f)' % (
+            arrays[-1]['lon'], arrays[-1]['lat']))
+        # bytes per site
+        self.assertLess(arrays.nbytes, _utils.deep_getsizeof(sites) / 5)
+
 
 class RuptureModelParserTestCase(unittest.TestCase):
     SAMPLE_FILES = ['examples/simple-fault-rupture.xml',
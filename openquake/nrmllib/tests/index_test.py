@@ -0,0 +1,117 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from openquake.nrmllib import index
+from openquake.nrmllib.hazard import parsers as hazard_parsers
+from openquake.nrmllib.risk import parsers as risk_parsers
+from openquake.nrmllib.tests import _utils
+
+MIXED_SRC_MODEL = 'examples/source_model/mixed.xml'
+EXPOSURE = 'openquake/nrmllib/tests/data/exposure-buildings.xml'
+HAZARD_CURVES = 'examples/hazard-curves-pga.xml'
+
+
+class NRMLIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # the sidecar files are written next to the indexed files
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def copy(self, fname):
+        dest = os.path.join(self.tmpdir, os.path.basename(fname))
+        shutil.copy(fname, dest)
+        return dest
+
+    def test_scan_items(self):
+        data = ('<a><b id="1"><b2/></b><!-- <b> --><c/><b id="2"/>'
+                '<x:b id="3">x</x:b ></a>')
+        items = [data[s:e] for s, e in index.scan_items(data, ['b'])]
+        self.assertEqual(['<b id="1"><b2/></b>', '<b id="2"/>',
+                          '<x:b id="3">x</x:b >'], items)
+
+    def test_build_sources(self):
+        fname = self.copy(MIXED_SRC_MODEL)
+        idx = index.NRMLIndex.build(fname, index.SOURCE_TAGS)
+        self.assertEqual(sorted('1234567'), sorted(idx.offsets))
+        self.assertTrue(
+            idx.fragment('4').startswith('<complexFaultSource id="4"'))
+        root = etree.fromstring(idx.document('4'))
+        [src] = root[0].findall('{*}complexFaultSource')
+        self.assertEqual('4', src.get('id'))
+        self.assertRaises(KeyError, idx.fragment, '8')
+
+    def test_sidecar(self):
+        fname = self.copy(HAZARD_CURVES)
+        idx = index.NRMLIndex.get(fname, ['hazardCurve'], 'pos')
+        self.assertTrue(os.path.exists(fname + '.idx'))
+        loaded = index.NRMLIndex.load(fname, ['hazardCurve'], 'pos')
+        self.assertEqual(idx.offsets, loaded.offsets)
+        self.assertEqual(idx.header, loaded.header)
+        self.assertEqual('</hazardCurves></nrml>', loaded.footer)
+        self.assertIn((-123.5, 37.5), loaded)
+
+        # a different set of tags is not served by the sidecar
+        self.assertRaises(ValueError, index.NRMLIndex.load,
+                          fname, ['hazardCurve'], 'id')
+
+        # a modified file invalidates the sidecar
+        with open(fname, 'a') as fh:
+            fh.write('\n')
+        self.assertRaises(ValueError, index.NRMLIndex.load,
+                          fname, ['hazardCurve'], 'pos')
+        idx = index.NRMLIndex.get(fname, ['hazardCurve'], 'pos')
+        self.assertEqual(2, len(idx))
+
+    def test_duplicated_key(self):
+        fname = os.path.join(self.tmpdir, 'dup.xml')
+        with open(fname, 'w') as fh:
+            fh.write('<a><b id="1"></b><b id="1"></b></a>')
+        self.assertRaises(ValueError, index.NRMLIndex.build, fname, ['b'])
+
+    def test_get_source(self):
+        fname = self.copy(MIXED_SRC_MODEL)
+        expected = list(hazard_parsers.SourceModelParser(fname).parse())
+        parser = hazard_parsers.SourceModelParser(fname)
+        for src in reversed(expected):
+            self.assertTrue(*_utils.deep_eq(src, parser.get_source(src.id)))
+        self.assertRaises(KeyError, parser.get_source, 'unknown')
+
+    def test_get_asset(self):
+        fname = self.copy(EXPOSURE)
+        expected = list(risk_parsers.ExposureModelParser(fname))
+        for asset in expected:
+            got = risk_parsers.ExposureModelParser.get_asset(
+                fname, asset.asset_ref)
+            self.assertEqual(asset, got)
+        self.assertRaises(KeyError, risk_parsers.ExposureModelParser.get_asset,
+                          fname, 'unknown')
+
+    def test_get_curve(self):
+        fname = self.copy(HAZARD_CURVES)
+        parser = hazard_parsers.HazardCurveXMLParser(fname)
+        expected = list(parser.parse())
+        self.assertEqual(expected[1], parser.get_curve(-123.5, 37.5))
+        self.assertEqual(expected[0], parser.get_curve('-122.5', '37.5'))
+        self.assertRaises(KeyError, parser.get_curve, 0, 0)
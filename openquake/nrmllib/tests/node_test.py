@@ -15,9 +15,60 @@
 
 import cStringIO
 import cPickle
+import glob
+import struct
+import tempfile
+import types
 import unittest
 
+import numpy
+from lxml import etree
+
+import openquake.nrmllib
 from openquake.nrmllib import node as n
+from openquake.nrmllib.tests import _utils
+
+
+def _node_from_elem_recursive(elem, nodecls=n.Node):
+    # the former recursive implementation of node_from_elem, kept as a
+    # reference for the benchmarks
+    children = list(elem)
+    if not children:
+        return nodecls(elem.tag, dict(elem.attrib), elem.text)
+    return nodecls(elem.tag, dict(elem.attrib),
+                   nodes=map(_node_from_elem_recursive, children))
+
+
+def _node_to_elem_exec(root):
+    # the former implementation of node_to_elem, generating and executing
+    # Python code, kept as a reference for the tests
+    def generate_elem(append, node, level):
+        var = "e" + str(level)
+        arg = repr(node.tag)
+        if node.attrib:
+            arg += ", **%r" % node.attrib
+        if level == 1:
+            append("e1 = Element(%s)" % arg)
+        else:
+            append("%s = SubElement(e%d, %s)" % (var, level - 1, arg))
+        if not node.nodes:
+            append("%s.text = %r" % (var, node.text))
+        for x in node:
+            generate_elem(append, x, level + 1)
+    output = []
+    generate_elem(output.append, root, 1)
+    namespace = {"Element": etree.Element, "SubElement": etree.SubElement}
+    exec "\n".join(output) in namespace
+    return namespace["e1"]
+
+
+def _node_from_nrml_two_passes(xmlfile):
+    # build and validate the full lxml tree, then convert it
+    root = openquake.nrmllib.assert_valid(xmlfile).getroot()
+    node = _node_from_elem_recursive(root)
+    for nsname, nsvalue in root.nsmap.iteritems():
+        node['xmlns' if nsname is None else 'xmlns:' + nsname] = nsvalue
+    return node
 
 
 class NodeTestCase(unittest.TestCase):
@@ -224,3 +275,621 @@ xmlns:gml="http://www.opengis.net/gml"
     def test_can_pickle(self):
         node = n.Node('tag')
         self.assertEqual(cPickle.loads(cPickle.dumps(node)), node)
+
+
+def _getnodes_linear(node, name):
+    # the former implementation of Node.getnodes, scanning all the subnodes
+    return [subnode for subnode in node.nodes if subnode.tag == name]
+
+
+class NodeIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = n.Node('root', nodes=[
+            n.Node('a', {}, 'A1'), n.Node('b'), n.Node('a', {}, 'A2')])
+
+    def test_lookup(self):
+        self.assertEqual('A1', self.root.a.text)
+        self.assertEqual(['A1', 'A2'],
+                         [a.text for a in self.root.getnodes('a')])
+        self.assertEqual([], list(self.root.getnodes('c')))
+        self.assertRaises(NameError, lambda: self.root.c)
+
+    def test_invalidation(self):
+        root = self.root
+        self.assertEqual('A1', root.a.text)
+        del root[0]
+        self.assertEqual('A2', root.a.text)
+        root[0] = n.Node('a', {}, 'A0')
+        self.assertEqual(['A0', 'A2'], [a.text for a in root.getnodes('a')])
+        root.append(n.Node('c'))
+        self.assertEqual('c', root.c.tag)
+        # direct changes of the list are detected by its length
+        root.nodes.append(n.Node('d'))
+        self.assertEqual('d', root.d.tag)
+        root.nodes = [n.Node('e')]
+        self.assertEqual('e', root.e.tag)
+        self.assertRaises(NameError, lambda: root.a)
+
+    def test_stale(self):
+        # changes of the subnodes not affecting the length of the list
+        root = self.root
+        self.assertEqual('A1', root.a.text)
+        root.nodes.reverse()
+        self.assertEqual('A2', root.a.text)
+        self.assertEqual(['A2', 'A1'], [a.text for a in root.getnodes('a')])
+        root.nodes[0].tag = 'c'
+        self.assertEqual('A1', root.a.text)
+        self.assertEqual(['A1'], [a.text for a in root.getnodes('a')])
+        self.assertEqual('A2', root.c.text)
+        root.nodes[2] = n.Node('d', {}, 'D')
+        self.assertRaises(NameError, lambda: root.a)
+        self.assertEqual([], list(root.getnodes('a')))
+        self.assertEqual('D', root.d.text)
+        root.nodes.sort(key=lambda node: node.tag)
+        self.assertEqual(['b', 'c', 'd'], [node.tag for node in root])
+        self.assertEqual('A2', root.c.text)
+        self.assertEqual(['A2'], [c.text for c in root.select('c')])
+
+    def test_lazy(self):
+        root = n.Node('root', nodes=(n.Node(tag) for tag in 'aba'))
+        self.assertEqual('b', root.b.tag)
+        self.assertEqual(['a'], [node.tag for node in root.getnodes('a')])
+
+    def test_pickle_and_compare(self):
+        self.root.a  # build the index
+        other = cPickle.loads(cPickle.dumps(self.root))
+        self.assertEqual(self.root, other)
+        self.assertNotIn('_index', self.root.__getstate__())
+        self.assertEqual('A1', other.a.text)
+        self.assertEqual(self.root, n.Node('root', nodes=list(self.root)))
+
+    def test_wide(self):
+        # look up all the subnodes of a wide node
+        root = n.Node('root', nodes=[n.Node('tag%d' % (i % 1000))
+                                     for i in range(10000)])
+        self.assertEqual(
+            [_getnodes_linear(root, 'tag%d' % i) for i in range(1000)],
+            [list(root.getnodes('tag%d' % i)) for i in range(1000)])
+
+
+class NodeFromNRMLTestCase(unittest.TestCase):
+
+    def test_examples(self):
+        fnames = glob.glob('examples/*.xml') + glob.glob('examples/*/*.xml')
+        self.assertTrue(fnames)
+        for fname in fnames:
+            expected = _node_from_nrml_two_passes(fname)
+            self.assertEqual(expected, n.node_from_nrml(fname), fname)
+            root = etree.parse(fname, openquake.nrmllib.COMPATPARSER)
+            self.assertEqual(_node_from_elem_recursive(root.getroot()),
+                             n.node_from_elem(root.getroot()), fname)
+
+    def test_prefixed(self):
+        root = n.node_from_nrml('examples/raw-source-model.xml',
+                                prefixed=True)
+        self.assertEqual({'gml:id': 'rsm1'}, root.rawSourceModel.attrib)
+        root = n.node_from_nrml('examples/source_model/mixed.xml',
+                                prefixed=True)
+        point = root.sourceModel.pointSource.pointGeometry.nodes[0]
+        self.assertEqual('gml:Point', point.tag)
+        self.assertEqual('gml:pos', point.nodes[0].tag)
+        # the node is written back as valid NRML
+        out = cStringIO.StringIO()
+        n.node_to_xml(root, out)
+        openquake.nrmllib.assert_valid(cStringIO.StringIO(out.getvalue()))
+
+    def test_node_from_elem_deep(self):
+        # deeper than the recursion limit
+        xml = '<a>' * 5000 + 'x' + '</a>' * 5000
+        node = n.node_from_elem(etree.fromstring(xml, etree.XMLParser(
+            huge_tree=True)))
+        depth = 0
+        while node.nodes:
+            node = node.nodes[0]
+            depth += 1
+        self.assertEqual((4999, 'x'), (depth, node.text))
+
+    def test_invalid(self):
+        xml = _utils.site_model(3).replace('vs30Type="inferred"',
+                                           'vs30Type="other"')
+        self.assertRaises(openquake.nrmllib.InvalidFile, n.node_from_nrml,
+                          cStringIO.StringIO(xml))
+        root = n.node_from_nrml(cStringIO.StringIO(xml), validate=False)
+        self.assertEqual(3, len(root.siteModel))
+
+    def test_lxml_tree_discarded(self):
+        # the elements are deleted as soon as they are converted; only
+        # the ones parsed ahead by lxml are in memory
+        xml = _utils.site_model(5000)
+        sizes = []
+
+        def events():
+            for event, elem in openquake.nrmllib.iterparse_tree(
+                    cStringIO.StringIO(xml)):
+                yield event, elem
+                sizes.append(sum(1 for _ in elem.getroottree().iter()))
+        top = n.Node('top', nodes=[])
+        n._build_nodes(events(), [top], n.Node, {}, ())
+        self.assertEqual(5000, len(top.nrml.siteModel))
+        self.assertLess(max(sizes), 1000)
+
+    def test_large(self):
+        # the iterative and single pass conversions build the same nodes
+        # as the recursive and two passes ones they replaced; the memory
+        # is checked by test_lxml_tree_discarded
+        xml = _utils.site_model(20000)
+        tree = etree.fromstring(xml)
+        self.assertEqual(_node_from_elem_recursive(tree),
+                         n.node_from_elem(tree))
+        root = n.node_from_nrml(cStringIO.StringIO(xml))
+        self.assertEqual(20000, len(root.siteModel))
+        self.assertEqual(_node_from_nrml_two_passes(cStringIO.StringIO(xml)),
+                         root)
+
+
+class NodeToElemTestCase(unittest.TestCase):
+
+    def test_examples(self):
+        for fname in glob.glob('examples/*.xml'):
+            root = n.node_from_xml(fname)
+            self.assertEqual(etree.tostring(_node_to_elem_exec(root)),
+                             etree.tostring(n.node_to_elem(root)), fname)
+
+    def test_leaf(self):
+        elem = n.node_to_elem(n.Node('a', {'x': '1'}, 'text'))
+        self.assertEqual('<a x="1">text</a>', etree.tostring(elem))
+
+    def test_deep(self):
+        root = node = n.Node('a')
+        for _ in range(5000):
+            node.append(n.Node('a'))
+            node = node.a
+        node.text = 'x'
+        elem = n.node_to_elem(root)
+        self.assertEqual(5001, sum(1 for _ in elem.iter()))
+
+    def test_large(self):
+        root = n.node_from_xml(cStringIO.StringIO(_utils.site_model(20000)))
+        self.assertEqual(etree.tostring(_node_to_elem_exec(root)),
+                         etree.tostring(n.node_to_elem(root)))
+
+
+class ArrayNodeTestCase(unittest.TestCase):
+
+    def test_hazard_curves(self):
+        root = n.node_from_nrml('examples/hazard-curves-pga.xml',
+                                n.ArrayNode)
+        curves = root.hazardCurves
+        self.assertEqual([0.005, 0.007, 0.0137], curves.IMLs.text.tolist())
+        self.assertEqual(float, curves.hazardCurve.poEs.text.dtype)
+        self.assertEqual([-122.5, 37.5],
+                         curves.hazardCurve.Point.pos.text.tolist())
+        self.assertIsInstance(curves['IMT'], str)
+        self.assertIn('IMT=PGA', root.to_str())
+
+        # the arrays are converted back into text by the writers
+        out = cStringIO.StringIO()
+        n.node_to_nrml(curves, out)
+        out.seek(0)
+        # the gml prefixes are lost by node_from_nrml, hence the
+        # output is not valid
+        self.assertEqual(root, n.node_from_nrml(out, n.ArrayNode,
+                                                validate=False))
+        elem = n.node_to_elem(curves)
+        self.assertEqual(curves.IMLs.text.tolist(),
+                         map(float, elem[0].text.split()))
+
+    def test_pickle(self):
+        node = n.ArrayNode('poEs', text='0.1 0.2')
+        self.assertEqual(node, cPickle.loads(cPickle.dumps(node)))
+        self.assertNotEqual(node, n.ArrayNode('poEs', text='0.1 0.3'))
+        self.assertNotEqual(node, n.ArrayNode('poEs', text='0.1'))
+        self.assertEqual('x', n.ArrayNode('description', text='x').text)
+
+    def test_many_curves(self):
+        # the consumers read the poEs of the curves as arrays of floats
+        xml = _utils.hazard_curves(2000)
+
+        def curves(nodecls):
+            root = n.node_from_nrml(cStringIO.StringIO(xml), nodecls,
+                                    validate=False)
+            return list(root.hazardCurves.getnodes('hazardCurve'))
+        array_curves = curves(n.ArrayNode)
+        self.assertEqual(2000, len(array_curves))
+        for curve, array_curve in zip(curves(n.Node), array_curves):
+            array = array_curve.poEs.text
+            self.assertEqual(numpy.float64, array.dtype)
+            numpy.testing.assert_equal(
+                numpy.array(curve.poEs.text.split(), float), array)
+
+
+class BinaryTestCase(unittest.TestCase):
+
+    def check_roundtrip(self, node, nodecls=n.Node):
+        data = n.node_to_binary(node)
+        self.assertIsInstance(data, str)
+        copy = n.node_from_binary(data, nodecls)
+        self.assertEqual(node, copy)
+        return copy
+
+    def test_examples(self):
+        for fname in glob.glob('examples/*.xml'):
+            self.check_roundtrip(n.node_from_nrml(fname))
+
+    def test_leaf_and_values(self):
+        self.check_roundtrip(n.Node('a'))
+        node = n.Node('root', {'x': 1.5, 'b': True, 'u': u'\xe8'}, nodes=[
+            n.Node('a', {}, u'unicode \xe8'), n.Node('b', {'n': 7}, 0.1),
+            n.Node('c', {'x': numpy.float64(2.5)}, numpy.eye(2))])
+        copy = self.check_roundtrip(node)
+        self.assertIs(type(copy.c['x']), float)
+        self.assertEqual((2, 2), copy.c.text.shape)
+
+        # the copy has a working index and writeable arrays
+        self.assertEqual([copy.b], list(copy.getnodes('b')))
+        copy.c.text[0, 0] = 2
+        self.assertRaises(TypeError, n.node_to_binary,
+                          n.Node('a', {'x': [1]}))
+
+    def test_invalid(self):
+        data = n.node_to_binary(n.Node('root', nodes=[n.Node('a')]))
+        for invalid in ['', 'NRMLNODE', 'x' * 100, data[:-1], data + 'x']:
+            self.assertRaises(ValueError, n.node_from_binary, invalid)
+
+    def test_byte_order(self):
+        # the records of the nodes are little-endian on any platform
+        data = n.node_to_binary(n.Node('root', nodes=[n.Node('a')]))
+        sizes = n.BINARY_HEADER.unpack_from(data)[2:]
+        offset = n.BINARY_HEADER.size + sizes[0]
+        # the leaf 'a' (tag 1), then the root (tag 0) with one subnode
+        self.assertEqual(struct.pack('<6i', 1, 0, 0, 0, 0, 1),
+                         data[offset:offset + sizes[1]])
+
+    def test_lazy_and_deep(self):
+        node = n.Node('root', nodes=(n.Node('a', {'i': str(i)})
+                                     for i in range(3)))
+        copy = n.node_from_binary(n.node_to_binary(node))
+        self.assertEqual(['0', '1', '2'], [a['i'] for a in copy])
+
+        deep = leaf = n.Node('x', {}, 'leaf')
+        for i in range(5000):  # much deeper than the recursion limit
+            deep = n.Node('x', nodes=[deep])
+        copy = n.node_from_binary(n.node_to_binary(deep))
+        while copy.nodes:
+            copy = copy.nodes[0]
+        self.assertEqual(leaf, copy)
+
+    def test_array_node(self):
+        root = n.node_from_nrml('examples/hazard-curves-pga.xml',
+                                n.ArrayNode)
+        copy = self.check_roundtrip(root, n.ArrayNode)
+        self.assertIsInstance(copy.hazardCurves.IMLs.text, numpy.ndarray)
+
+    def test_large(self):
+        root = n.node_from_nrml(cStringIO.StringIO(
+            _utils.hazard_curves(5000)), validate=False)
+        data = n.node_to_binary(root)
+        self.assertEqual(root, n.node_from_binary(data))
+        # smaller than the pickle of the same tree
+        pickled = cPickle.dumps(root, cPickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(data), len(pickled))
+
+
+def _exposure(n_assets):
+    assets = [n.Node('asset', {'id': 'a%d' % i, 'number': '7',
+                               'taxonomy': 'IT-PV'},
+                     nodes=[n.Node('location', {'lon': '9.15',
+                                                'lat': '45.16'})])
+              for i in range(n_assets)]
+    return n.Node('exposureModel', {'id': 'ep'}, nodes=[
+        n.Node('description', {}, 'a test exposure'),
+        n.Node('assets', nodes=assets)])
+
+
+class NodeCopyTestCase(unittest.TestCase):
+
+    def test_deep_copy(self):
+        root = _exposure(10)
+        copy = n.node_copy(root)
+        self.assertEqual(root, copy)
+        copy.assets[3].location['lon'] = '0'
+        copy.assets.append(n.Node('asset'))
+        self.assertEqual('9.15', root.assets[3].location['lon'])
+        self.assertEqual(10, len(root.assets))
+
+        arrays = n.ArrayNode('a', nodes=[n.ArrayNode('poEs', {}, '0.1')])
+        copy = n.node_copy(arrays, n.ArrayNode)
+        copy.poEs.text[0] = 0.2
+        self.assertEqual([0.1], arrays.poEs.text.tolist())
+
+        # the nodes of other classes are converted by the given class
+        plain = n.node_from_nrml('examples/hazard-curves-pga.xml')
+        copy = n.node_copy(plain, n.ArrayNode)
+        self.assertEqual(
+            n.node_from_nrml('examples/hazard-curves-pga.xml', n.ArrayNode),
+            copy)
+        poes = copy.hazardCurves.hazardCurve.poEs
+        self.assertIs(n.ArrayNode, type(poes))
+        self.assertIsInstance(poes.text, numpy.ndarray)
+
+        deep = n.Node('x', {}, 'leaf')
+        for i in range(5000):  # much deeper than the recursion limit
+            deep = n.Node('x', nodes=[deep])
+        # the comparison of the nodes is recursive, the encoding is not
+        self.assertEqual(n.node_to_binary(deep),
+                         n.node_to_binary(n.node_copy(deep)))
+
+    def test_shared_copy(self):
+        root = _exposure(3)
+        copy = n.node_copy(root, shared=True)
+        self.assertEqual(root, copy)
+        self.assertIs(root.assets, copy.assets)
+        del copy[0]
+        copy['id'] = 'other'
+        self.assertEqual(2, len(root))
+        self.assertEqual('ep', root['id'])
+
+    def test_edit(self):
+        root = _exposure(5)
+        expected = n.node_copy(root)
+        new, targets = n.node_edit(root, [(1, 2), (1, 4, 0), (1, 2, 0)])
+        self.assertIs(targets[0], new.assets[2])
+        self.assertIs(targets[2], new.assets[2].location)
+        for target in targets:
+            target['number'] = '0'
+        self.assertEqual(expected, root)  # unchanged
+        self.assertEqual(
+            ['7', '7', '0', '7', '7'],
+            [asset['number'] for asset in new.assets])
+        self.assertEqual('0', new.assets[4].location['number'])
+        self.assertIs(new.description, root.description)
+        self.assertIs(new.assets[0], root.assets[0])
+        self.assertIsNot(new.assets[4], root.assets[4])
+
+    def test_large(self):
+        # change the taxonomy of 10 assets out of 20000
+        root = _exposure(20000)
+        paths = [(1, i) for i in range(0, 20000, 2000)]
+
+        def copy_and_edit():
+            new = n.node_copy(root)
+            for _, i in paths:
+                new.assets[i]['taxonomy'] = 'IT-CE'
+            return new
+
+        def edit():
+            new, targets = n.node_edit(root, paths)
+            for target in targets:
+                target['taxonomy'] = 'IT-CE'
+            return new
+        new = edit()
+        self.assertEqual(copy_and_edit(), new)
+        # only the edited assets have been copied
+        self.assertEqual(19990, sum(
+            asset is old for asset, old in zip(new.assets, root.assets)))
+
+
+class NullFile(object):
+    """A write-only file discarding the data"""
+    def write(self, data):
+        pass
+
+
+class LazyNodeTestCase(unittest.TestCase):
+
+    def test_examples(self):
+        # the lazy and the eager trees are serialized in the same way
+        for fname in glob.glob('examples/*.xml'):
+            eager, lazy = cStringIO.StringIO(), cStringIO.StringIO()
+            n.node_to_xml(n.node_from_nrml(fname), eager)
+            n.node_to_xml(n.node_from_nrml(fname, lazy=True), lazy)
+            self.assertEqual(eager.getvalue(), lazy.getvalue(), fname)
+
+    def test_lazy(self):
+        nlines = [0]
+
+        def lines():
+            for line in _utils._site_model_lines(100000):
+                nlines[0] += 1
+                yield line
+        root = n.node_from_nrml(_utils.IterFile(lines()), lazy=True)
+        sites = root.siteModel.nodes
+        self.assertIsInstance(sites, types.GeneratorType)
+        self.assertEqual('site', sites.next().tag)
+        # only the beginning of the file has been read
+        self.assertLess(nlines[0], 2000)
+        self.assertEqual(99999, sum(1 for _ in sites))
+        self.assertEqual(100002, nlines[0])  # with header and footer
+
+    def test_following_siblings(self):
+        xml = cStringIO.StringIO('''\
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+<a><assets><x>1</x><x>2</x></assets><b>3</b><assets/><c>4</c></a>
+</nrml>''')
+        root = n.node_from_nrml(xml, validate=False, lazy=True)
+        self.assertEqual(['assets'], [node.tag for node in root.a])
+        self.assertEqual(['1', '2'], [x.text for x in root.a.assets])
+        # the nodes after the first lazy container have been read
+        self.assertEqual(['assets', 'b', 'assets'],
+                         [node.tag for node in root.a])
+        self.assertEqual([], list(root.a[2]))
+        self.assertEqual('4', root.a.c.text)
+
+    def test_invalid(self):
+        xml = _utils.site_model(3).replace('vs30Type="inferred"',
+                                           'vs30Type="other"')
+        root = n.node_from_nrml(cStringIO.StringIO(xml), lazy=True)
+        self.assertRaises(openquake.nrmllib.InvalidFile, list,
+                          root.siteModel)
+
+    def test_memory(self):
+        # convert a large site model into XML, making sure the memory
+        # occupation does not grow with the number of sites;
+        # tools/memory-benchmark.py reads larger ones
+        root = n.node_from_nrml(_utils.site_model_file(50000), lazy=True)
+        sites = root.siteModel.nodes
+        for _ in range(5000):
+            sites.next()
+        rss = _utils.rss()
+        n.node_to_xml(root, NullFile())
+        self.assertLess(_utils.rss() - rss, 5 * 1024 * 1024)
+
+
+def _node_to_nrml_reparse(node, output):
+    """
+    Write and validate a NRML file as node_to_nrml did before the
+    introduction of the inline validation, by reading it back.
+    """
+    n.node_to_nrml(node, output, validate=False)
+    output.seek(0)
+    openquake.nrmllib.assert_valid(output)
+
+
+class NodeToNRMLTestCase(unittest.TestCase):
+
+    def test_validate(self):
+        root = n.node_from_nrml('examples/site_model.xml')
+        out = cStringIO.StringIO()
+        n.node_to_nrml(root.siteModel, out, validate=True)
+        self.assertEqual(root, n.node_from_nrml(
+            cStringIO.StringIO(out.getvalue())))
+
+        root.siteModel[0]['vs30Type'] = 'other'
+        self.assertRaises(openquake.nrmllib.InvalidFile, n.node_to_nrml,
+                          root.siteModel, cStringIO.StringIO(),
+                          validate=True)
+        # no validation by default, unless in read-write mode
+        n.node_to_nrml(root.siteModel, cStringIO.StringIO())
+        with tempfile.TemporaryFile('w+') as output:
+            with self.assertRaises(openquake.nrmllib.InvalidFile) as ctx:
+                n.node_to_nrml(root.siteModel, output)
+        self.assertIn("'other'", str(ctx.exception))
+
+    def check_written(self, node):
+        # the whole document is written, then the error is raised
+        expected, out = cStringIO.StringIO(), cStringIO.StringIO()
+        n.node_to_nrml(node, expected, validate=False)
+        self.assertRaises(openquake.nrmllib.InvalidFile, n.node_to_nrml,
+                          node, out, validate=True)
+        self.assertEqual(expected.getvalue(), out.getvalue())
+
+    def test_invalid_written(self):
+        # errors in the first site of a document much longer than the
+        # validation buffer
+        root = n.node_from_nrml(cStringIO.StringIO(_utils.site_model(5000)))
+        root.siteModel[0]['vs30Type'] = 'other'  # schema error
+        self.check_written(root.siteModel)
+        root.siteModel[0].tag = '1site'  # not well-formed
+        self.check_written(root.siteModel)
+
+    def test_lazy(self):
+        # the elements validated are discarded while writing
+        root = n.node_from_nrml(_utils.IterFile(
+            _utils._site_model_lines(20000)), lazy=True)
+        stream = n._ValidatingStream(NullFile())
+        n.node_to_xml(n.Node('nrml', {'xmlns': openquake.nrmllib.NAMESPACE},
+                             nodes=[root.siteModel]), stream)
+        stream._feed()
+        self.assertLess(len(stream.root[0]), 100)  # siteModel
+        stream.close()
+
+    def test_large(self):
+        # the inline validation writes the same document as the former
+        # validation by reading it back, without building the full lxml
+        # tree (see test_lazy)
+        root = n.node_from_nrml(cStringIO.StringIO(
+            _utils.site_model(20000)))
+        inline, reparse = cStringIO.StringIO(), cStringIO.StringIO()
+        n.node_to_nrml(root.siteModel, inline, validate=True)
+        _node_to_nrml_reparse(root.siteModel, reparse)
+        self.assertEqual(reparse.getvalue(), inline.getvalue())
+
+
+class NodeSelectTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = n.Node('nrml', nodes=[_exposure(6)])
+        for i, asset in enumerate(self.root.exposureModel.assets):
+            asset['taxonomy'] = 'RC' if i % 2 else 'W'
+            asset.location['lon'] = str(i)
+
+    def lons(self, path):
+        return [node['lon'] for node in self.root.select(path)]
+
+    def test_paths(self):
+        self.assertEqual(['1', '3', '5'], self.lons(
+            'exposureModel/assets/asset[@taxonomy="RC"]/location'))
+        self.assertEqual(['0', '2', '4'], self.lons(
+            "exposureModel/assets/asset[@taxonomy='W']/*"))
+        self.assertEqual(['2'], self.lons(
+            'exposureModel/*/asset[@taxonomy="W"][2]/location'))
+        self.assertEqual(['0'], self.lons(
+            'exposureModel//location[@lon="0"]'))
+        self.assertEqual(map(str, range(6)), self.lons('//location'))
+        self.assertEqual(6, len(list(self.root.select(
+            'exposureModel//asset[@id]'))))
+        self.assertEqual([], list(self.root.select('exposureModel/x/y')))
+        self.assertEqual([self.root.exposureModel.description],
+                         list(self.root.select('*/description')))
+
+        # nested contexts do not produce duplicates
+        nested = n.Node('a', nodes=[n.Node('a', nodes=[n.Node('b')])])
+        self.assertEqual(1, len(list(nested.select('//a//b'))))
+
+        # typed attributes are compared in their text form
+        self.root.exposureModel.assets[5].location['lon'] = 5.5
+        self.assertEqual([5.5], self.lons('//location[@lon="5.5"]'))
+
+    def test_compiled(self):
+        path = 'exposureModel/assets/asset'
+        self.assertIs(n.compile_path(path), n.compile_path(path))
+        for path in ['', 'a/', 'a///b', 'a[', 'a[@]', 'a[x]', 'a b',
+                     'a//b[1]', 'a[1][2]']:
+            self.assertRaises(ValueError, n.compile_path, path)
+
+    def test_lazy(self):
+        nlines = [0]
+
+        def lines():
+            for line in _utils._site_model_lines(100000):
+                nlines[0] += 1
+                yield line
+        root = n.node_from_nrml(_utils.IterFile(lines()), lazy=True)
+        sites = root.select('siteModel/site[@vs30Type="measured"][1]')
+        self.assertEqual('measured', next(sites)['vs30Type'])
+        # only the beginning of the file has been read
+        self.assertLess(nlines[0], 2000)
+
+    def test_linear(self):
+        root = n.Node('nrml', nodes=[_exposure(1000)])
+        for asset in root.exposureModel.assets.nodes[::10]:
+            asset['taxonomy'] = 'RC'
+        locations = [
+            location
+            for model in _getnodes_linear(root, 'exposureModel')
+            for assets in _getnodes_linear(model, 'assets')
+            for asset in _getnodes_linear(assets, 'asset')
+            if asset['taxonomy'] == 'RC'
+            for location in _getnodes_linear(asset, 'location')]
+        self.assertEqual(100, len(locations))
+        self.assertEqual(locations, list(root.select(
+            'exposureModel/assets/asset[@taxonomy="RC"]/location')))
+
+    def test_many_nodes(self):
+        # select the few fault sources among many point sources: the
+        # steps use the tag index instead of a scan
+        root = n.node_from_nrml(cStringIO.StringIO(
+            _utils.point_source_model(5000)))
+        for i in range(5):
+            root.sourceModel.append(n.Node('simpleFaultSource', {
+                'id': 'sf%d' % i}, nodes=[n.Node('magScaleRel', {}, 'WC')]))
+        self.assertIsNone(root.sourceModel._index)
+        selected = list(root.select(
+            'sourceModel/simpleFaultSource/magScaleRel'))
+        self.assertIsNotNone(root.sourceModel._index)
+        self.assertEqual(5, len(selected))
+        self.assertEqual(
+            [msr for model in _getnodes_linear(root, 'sourceModel')
+             for src in _getnodes_linear(model, 'simpleFaultSource')
+             for msr in _getnodes_linear(src, 'magScaleRel')], selected)
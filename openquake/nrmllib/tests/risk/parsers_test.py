@@ -217,6 +217,43 @@ class VulnerabilityModelParserTestCase(unittest.TestCase):
         self.assertEqual([0.50, 0.50, 0.50, 0.50],
                          model["AA"]["coefficientsVariation"])
 
+    def test_same_set_id(self):
+        # two sets with the same ID keep their own attributes
+        vulnerability_model = """\
+<?xml version='1.0' encoding='utf-8'?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+  <vulnerabilityModel>
+    <discreteVulnerabilitySet vulnerabilitySetID="PAGER"
+      assetCategory="population" lossCategory="fatalities">
+      <IML IMT="MMI">5.00 5.50</IML>
+      <discreteVulnerability vulnerabilityFunctionID="IR"
+        probabilisticDistribution="LN">
+        <lossRatio>0.18 0.36</lossRatio>
+        <coefficientsVariation>0.30 0.30</coefficientsVariation>
+      </discreteVulnerability>
+    </discreteVulnerabilitySet>
+    <discreteVulnerabilitySet vulnerabilitySetID="PAGER"
+      assetCategory="buildings" lossCategory="economic_loss">
+      <IML IMT="PGA">0.10 0.20</IML>
+      <discreteVulnerability vulnerabilityFunctionID="PK"
+        probabilisticDistribution="LN">
+        <lossRatio>0.06 0.18</lossRatio>
+        <coefficientsVariation>0.50 0.50</coefficientsVariation>
+      </discreteVulnerability>
+    </discreteVulnerabilitySet>
+  </vulnerabilityModel>
+</nrml>
+"""
+        model = self._load_model(StringIO.StringIO(vulnerability_model))
+
+        self.assertEqual("MMI", model["IR"]["IMT"])
+        self.assertEqual([5.00, 5.50], model["IR"]["IML"])
+        self.assertEqual("fatalities", model["IR"]["lossCategory"])
+        self.assertEqual("PGA", model["PK"]["IMT"])
+        self.assertEqual([0.10, 0.20], model["PK"]["IML"])
+        self.assertEqual("economic_loss", model["PK"]["lossCategory"])
+        self.assertEqual("buildings", model["PK"]["assetCategory"])
+
     def _load_model(self, source):
         model = dict()
         parser = parsers.VulnerabilityModelParser(source)
@@ -0,0 +1,101 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import unittest
+
+from openquake.nrmllib import spatial
+from openquake.nrmllib.hazard import parsers as hazard_parsers
+from openquake.nrmllib.risk import parsers as risk_parsers
+
+EXPOSURE = 'openquake/nrmllib/tests/data/exposure-buildings.xml'
+
+
+def _brute_force_nearest(points, lon, lat):
+    return min((spatial.haversine(lon, lat, plon, plat), item)
+               for plon, plat, item in points)
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(42)
+        self.points = [(rnd.uniform(-10, 10), rnd.uniform(60, 80), i)
+                       for i in range(1000)]
+        self.index = spatial.SpatialIndex(cell_size=0.5)
+        for lon, lat, i in self.points:
+            self.index.add(lon, lat, i)
+
+    def test_nearest(self):
+        rnd = random.Random(1)
+        for _ in range(200):
+            # also query points far away from the indexed ones
+            lon, lat = rnd.uniform(-30, 30), rnd.uniform(40, 89)
+            self.assertEqual(_brute_force_nearest(self.points, lon, lat),
+                             self.index.nearest(lon, lat))
+
+    def test_nearest_max_distance(self):
+        lon, lat, i = self.points[0]
+        self.assertEqual((0, i), self.index.nearest(lon, lat, 0))
+        self.assertIsNone(self.index.nearest(-50, 0, max_distance=1000))
+        self.assertIsNone(spatial.SpatialIndex().nearest(0, 0))
+
+    def test_within(self):
+        for bbox in [(-1, 65, 3.5, 66), (-100, -90, 100, 90), (0, 0, 1, 1)]:
+            expected = sorted(
+                i for lon, lat, i in self.points
+                if bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3])
+            self.assertEqual(expected, sorted(self.index.within(bbox)))
+
+    def test_parsers(self):
+        sites = spatial.SpatialIndex()
+        site_model = list(hazard_parsers.SiteModelParser(
+            'examples/site_model.xml', spatial_index=sites).parse())
+        self.assertEqual(5, len(sites))
+        self.assertIs(site_model[2], sites.nearest(-122.71, 37.69)[1])
+
+        curves = spatial.SpatialIndex()
+        model = hazard_parsers.HazardCurveXMLParser(
+            'examples/hazard-curves-pga.xml', spatial_index=curves).parse()
+        expected = list(model)
+        self.assertEqual([expected[1]], curves.within((-124, 37, -123, 38)))
+
+        assets = spatial.SpatialIndex()
+        expected = list(risk_parsers.ExposureModelParser(
+            EXPOSURE, spatial_index=assets))
+        self.assertEqual(len(expected), len(assets))
+        lon, lat = expected[-1].site
+        self.assertEqual(expected[-1].site,
+                         assets.nearest(lon, lat)[1].site)
+
+    def test_many_sites(self):
+        # associate 200 assets to the closest of 2000 hazard sites
+        rnd = random.Random(2)
+        sites = [(rnd.uniform(0, 5), rnd.uniform(40, 45), i)
+                 for i in range(2000)]
+        assets = [(rnd.uniform(0, 5), rnd.uniform(40, 45))
+                  for _ in range(200)]
+
+        def associate_grid():
+            index = spatial.SpatialIndex()
+            for lon, lat, i in sites:
+                index.add(lon, lat, i)
+            return [index.nearest(lon, lat)[1] for lon, lat in assets]
+
+        def associate_brute_force():
+            return [_brute_force_nearest(sites, lon, lat)[1]
+                    for lon, lat in assets]
+
+        self.assertEqual(associate_brute_force(), associate_grid())
@@ -0,0 +1,232 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+from lxml import etree
+
+import openquake.nrmllib
+from openquake.nrmllib.hazard import parsers
+from openquake.nrmllib.risk import parsers as risk_parsers
+from openquake.nrmllib.tests import _utils
+
+INVALID_SITE_MODEL = '''\
+<?xml version="1.0" encoding="utf-8"?>
+<nrml xmlns="http://openquake.org/xmlns/nrml/0.4">
+    <siteModel>
+        <site lon="-122.5" lat="37.5" vs30="800.0" vs30Type="other"
+              z1pt0="100.0" z2pt5="5.0" />
+    </siteModel>
+</nrml>
+'''
+
+
+class StreamingTestCase(unittest.TestCase):
+
+    def test_iterelements_clears(self):
+        xml = StringIO.StringIO(_utils.site_model(100))
+        n = 0
+        for element in openquake.nrmllib.iterelements(xml, ['site']):
+            self.assertEqual('{%s}site' % openquake.nrmllib.NAMESPACE,
+                             element.tag)
+            # the previous site has been cleared, the others deleted
+            previous = element.getprevious()
+            if previous is not None:
+                self.assertEqual({}, dict(previous.attrib))
+                self.assertIsNone(previous.getprevious())
+            n += 1
+        self.assertEqual(100, n)
+        self.assertEqual({}, dict(element.attrib))
+
+    def test_iterhandle(self):
+        xml = StringIO.StringIO(_utils.site_model(10))
+        handlers = {
+            # return None to skip the site
+            'nrml:site': lambda e: e.get('vs30Type')[0] * (e.get(
+                'vs30Type') == 'inferred') or None,
+            'siteModel': lambda e: 'end'}
+        self.assertEqual(['i', 'i', 'i', 'i', 'end'],
+                         list(openquake.nrmllib.iterhandle(xml, handlers)))
+
+    def test_validate(self):
+        handlers = {'site': lambda e: e.get('vs30Type')}
+        stream = openquake.nrmllib.iterhandle(
+            StringIO.StringIO(INVALID_SITE_MODEL), handlers)
+        self.assertRaises(etree.XMLSyntaxError, list, stream)
+        stream = openquake.nrmllib.iterhandle(
+            StringIO.StringIO(INVALID_SITE_MODEL), handlers, validate=False)
+        self.assertEqual(['other'], list(stream))
+
+
+class ValidationModeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.validate = openquake.nrmllib.VALIDATE
+        self.validated = openquake.nrmllib._VALIDATED
+        openquake.nrmllib._VALIDATED = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        openquake.nrmllib._VALIDATED = self.validated
+        openquake.nrmllib.VALIDATE = self.validate
+
+    def write(self, name, content):
+        fname = os.path.join(self.tmpdir, name)
+        with open(fname, 'w') as fh:
+            fh.write(content)
+        return fname
+
+    def test_global_switch(self):
+        openquake.nrmllib.VALIDATE = False
+        sites = list(parsers.SiteModelParser(
+            StringIO.StringIO(INVALID_SITE_MODEL)).parse())
+        self.assertEqual(1, len(sites))
+        # an explicit argument wins over the global switch
+        parser = parsers.SiteModelParser(
+            StringIO.StringIO(INVALID_SITE_MODEL), validate=True)
+        self.assertRaises(etree.XMLSyntaxError, list, parser.parse())
+
+    def test_per_parser_switch(self):
+        parser = parsers.SiteModelParser(
+            StringIO.StringIO(INVALID_SITE_MODEL), validate=False)
+        self.assertEqual(800.0, parser.parse_arrays()['vs30'][0])
+        parser = parsers.SiteModelParser(
+            StringIO.StringIO(INVALID_SITE_MODEL))
+        self.assertRaises(etree.XMLSyntaxError, parser.parse_arrays)
+
+    def test_once(self):
+        fname = self.write('site_model.xml', _utils.site_model(10))
+        self.assertEqual(10, len(list(parsers.SiteModelParser(
+            fname, validate='once').parse())))
+        self.assertEqual(1, len(openquake.nrmllib._VALIDATED))
+
+        # the second time the schema is not needed anymore
+        schema = openquake.nrmllib.nrml_schema
+
+        def fail():
+            raise AssertionError('the file has been validated twice')
+        openquake.nrmllib.nrml_schema = fail
+        try:
+            sites = parsers.SiteModelParser(
+                fname, validate='once').parse_arrays()
+        finally:
+            openquake.nrmllib.nrml_schema = schema
+        self.assertEqual(10, len(sites))
+
+    def test_once_invalid(self):
+        fname = self.write('invalid.xml', INVALID_SITE_MODEL)
+        for _ in range(2):
+            parser = parsers.SiteModelParser(fname, validate='once')
+            self.assertRaises(etree.XMLSyntaxError, list, parser.parse())
+        self.assertEqual(set(), openquake.nrmllib._VALIDATED)
+
+    def test_once_risk(self):
+        fname = self.write('exposure.xml', open(
+            'openquake/nrmllib/tests/data/exposure-buildings.xml').read())
+        expected = list(risk_parsers.ExposureModelParser(fname))
+        risk_parsers.ExposureModelParser(fname, validate='once')
+        self.assertEqual(1, len(openquake.nrmllib._VALIDATED))
+        with open(fname, 'a') as fh:  # a different content
+            fh.write('\n')
+        self.assertEqual(expected, list(risk_parsers.ExposureModelParser(
+            fname, validate='once')))
+        self.assertEqual(2, len(openquake.nrmllib._VALIDATED))
+
+    def test_parse_arrays(self):
+        xml = _utils.site_model(5000)
+
+        def parse(validate):
+            return parsers.SiteModelParser(
+                StringIO.StringIO(xml), validate=validate).parse_arrays()
+        arrays = parse(False)
+        self.assertEqual(5000, len(arrays))
+        self.assertEqual(arrays.tolist(), parse(True).tolist())
+
+
+def _python_filtered(source, tags):
+    """
+    Iterate as :func:`openquake.nrmllib.iterelements` did before the
+    introduction of the tag filter, receiving the events of all the
+    elements and filtering them in Python.
+    """
+    tags = set(openquake.nrmllib.qualify(tag) for tag in tags)
+    for _, element in openquake.nrmllib.iterparse_tree(source, ('end',)):
+        if element.tag in tags:
+            yield element
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+class TagFilterTestCase(unittest.TestCase):
+    N = 5000
+
+    def _events(self, func, *args):
+        """
+        Call func(*args), counting the iterparse events it receives from
+        :func:`openquake.nrmllib.iterparse_tree`; returns the result and
+        the number of events.
+        """
+        iterparse_tree = openquake.nrmllib.iterparse_tree
+        count = [0]
+
+        def counting(*args, **kwargs):
+            for event in iterparse_tree(*args, **kwargs):
+                count[0] += 1
+                yield event
+        openquake.nrmllib.iterparse_tree = counting
+        try:
+            result = func(*args)
+        finally:
+            openquake.nrmllib.iterparse_tree = iterparse_tree
+        return result, count[0]
+
+    def _compare(self, xml, tags):
+        def filtered():
+            return [el.tag for el in openquake.nrmllib.iterelements(
+                StringIO.StringIO(xml), tags)]
+
+        def unfiltered():
+            return [el.tag for el in _python_filtered(
+                StringIO.StringIO(xml), tags)]
+
+        # events reaching Python, with and without the filter in lxml
+        tags_filtered, events_filtered = self._events(filtered)
+        tags_unfiltered, events_unfiltered = self._events(unfiltered)
+        self.assertEqual(tags_unfiltered, tags_filtered)
+        self.assertEqual(len(tags_filtered), events_filtered)
+        self.assertLess(events_filtered * 3, events_unfiltered)
+
+    def test_hazard_curves(self):
+        self._compare(_utils.hazard_curves(self.N), ['hazardCurve'])
+
+    def test_source_model(self):
+        self._compare(_utils.point_source_model(self.N),
+                      parsers.SourceModelParser(None)._parse_fn_map)
+
+    def test_iterparse_tree_tag(self):
+        xml = _utils.hazard_curves(3)
+        events = [(event, element.tag) for event, element in
+                  openquake.nrmllib.iterparse_tree(
+                      StringIO.StringIO(xml), tag='gml:pos')]
+        self.assertEqual(
+            [('start', '{%s}pos' % openquake.nrmllib.GML_NAMESPACE),
+             ('end', '{%s}pos' % openquake.nrmllib.GML_NAMESPACE)] * 3,
+            events)
@@ -13,10 +13,46 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with NRML.  If not, see <http://www.gnu.org/licenses/>.
 
+import StringIO
+import tokenize
 import unittest
+
+import numpy
+
 from openquake.nrmllib import utils
 
 
+def _tokenize_coords(wkt):
+    """
+    The tokenize-based WKT parser used by the SourceModelXMLWriter before
+    the introduction of :func:`openquake.nrmllib.utils.wkt_to_coords`;
+    kept as a reference for the benchmark.
+    """
+    tokens = (x[1] for x in tokenize.generate_tokens(
+        StringIO.StringIO(wkt).readline))
+    tokens.next()  # geometry type
+    coords = []
+    pt = []
+    negative = False
+    for t in tokens:
+        if t == '(':
+            continue
+        elif t == ')':
+            coords.append(pt)
+            break
+        elif t == ',':
+            coords.append(pt)
+            pt = []
+        elif t == '-':
+            negative = True
+        else:
+            if negative:
+                t = '-' + t
+            pt.append(float(t))
+            negative = False
+    return coords
+
+
 class UtilsTestCase(unittest.TestCase):
     """Tests for general NRML util functions."""
 
@@ -57,3 +93,52 @@ class UtilsTestCase(unittest.TestCase):
         actual = utils.coords_to_poly_wkt(coords, 3)
 
         self.assertEqual(expected, actual)
+
+
+class WKTCodecTestCase(unittest.TestCase):
+    """Tests for the WKT codec functions."""
+
+    def test_point(self):
+        self.assertEqual(utils.wkt_to_coords('POINT(-122.0 38.0)').tolist(),
+                         [[-122.0, 38.0]])
+
+    def test_linestring_3d(self):
+        coords = utils.wkt_to_coords(
+            'LINESTRING(-124.704 40.363 0.5493260E+01, -124.977 41.214 5)')
+        self.assertEqual(coords.shape, (2, 3))
+        self.assertEqual(coords.tolist(),
+                         [[-124.704, 40.363, 5.49326],
+                          [-124.977, 41.214, 5.0]])
+
+    def test_polygon_holes_are_ignored(self):
+        coords = utils.wkt_to_coords(
+            'POLYGON ((35 10, 10 20, 15 40, 35 10), (20 30, 35 35, 20 30))')
+        self.assertEqual(coords.tolist(),
+                         [[35, 10], [10, 20], [15, 40], [35, 10]])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, utils.wkt_to_coords, 'MULTIPOINT(1 2)')
+        self.assertRaises(ValueError, utils.wkt_to_coords,
+                          'LINESTRING(1 2, 3)')
+        # a malformed token in the middle does not truncate the result
+        self.assertRaises(ValueError, utils.wkt_to_coords,
+                          'LINESTRING(1 2, 3 4, x 6, 7 8)')
+
+    def test_roundtrip(self):
+        for wkt in ['POINT(1.5 -2.0)',
+                    'LINESTRING(1.0 1.0 2.0, 2.0 3.0 3.0)',
+                    'POLYGON((1.0 1.0, 2.0 2.0, 3.0 3.0, 1.0 1.0))']:
+            geom_type = wkt.split('(')[0]
+            self.assertEqual(utils.coords_to_wkt(
+                geom_type, utils.wkt_to_coords(wkt)), wkt)
+
+    def test_close_polygon(self):
+        self.assertEqual(utils.coords_to_wkt('POLYGON', [[1, 2], [3, 4]]),
+                         'POLYGON((1.0 2.0, 3.0 4.0, 1.0 2.0))')
+
+    def test_long_linestring(self):
+        # a complex fault edge with 5000 vertices
+        coords = numpy.random.uniform(-180, 180, (5000, 3))
+        wkt = utils.coords_to_wkt('LINESTRING', coords)
+        self.assertEqual(utils.wkt_to_coords(wkt).tolist(),
+                         _tokenize_coords(wkt))
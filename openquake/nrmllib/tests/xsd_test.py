@@ -0,0 +1,197 @@
+# Copyright (c) 2010-2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import numpy
+
+import openquake.nrmllib
+from openquake.nrmllib import node as n
+from openquake.nrmllib import xsd
+from openquake.nrmllib.tests import _utils
+
+SCHEMA = '''\
+<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+    <xs:include schemaLocation="common.xsd" />
+    <xs:element name="root">
+        <xs:complexType>
+            <xs:sequence>
+                <xs:element name="item" type="Item" />
+                <xs:element name="flag" type="xs:boolean" />
+                <xs:element name="value" type="xs:int" />
+            </xs:sequence>
+            <xs:attributeGroup ref="Counts" />
+        </xs:complexType>
+    </xs:element>
+    <xs:complexType name="Item">
+        <xs:simpleContent>
+            <xs:extension base="Values">
+                <xs:attribute name="weight">
+                    <xs:simpleType>
+                        <xs:restriction base="xs:double">
+                            <xs:minInclusive value="0" />
+                        </xs:restriction>
+                    </xs:simpleType>
+                </xs:attribute>
+            </xs:extension>
+        </xs:simpleContent>
+    </xs:complexType>
+    <xs:complexType name="Other">
+        <xs:attribute name="weight" type="xs:string" />
+    </xs:complexType>
+    <xs:element name="other" type="Other" />
+    <!-- a second declaration with a different type -->
+    <xs:element name="value" type="xs:string" />
+</xs:schema>
+'''
+
+COMMON = '''\
+<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+    <xs:simpleType name="Values">
+        <xs:annotation><xs:documentation>numbers</xs:documentation>
+        </xs:annotation>
+        <xs:list itemType="PositiveInteger" />
+    </xs:simpleType>
+    <xs:simpleType name="PositiveInteger">
+        <xs:restriction base="xs:integer">
+            <xs:minInclusive value="0" />
+        </xs:restriction>
+    </xs:simpleType>
+    <xs:attributeGroup name="Counts">
+        <xs:attribute name="count" type="PositiveInteger" />
+        <xs:attribute name="name" type="xs:string" />
+    </xs:attributeGroup>
+</xs:schema>
+'''
+
+
+def _uncompiled_cast(schema, node):
+    """
+    Convert a node tree by looking up the declarations of every tag in the
+    schema, as a converter without the precompiled table would do.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for elem in schema.elements:
+            if elem.get('name') == node.tag:
+                defn = schema.definition(elem)
+                break
+        else:
+            defn = None
+        convs = schema.attribute_converters(defn)
+        for name, value in node.attrib.items():
+            if name in convs:
+                node.attrib[name] = convs[name](value)
+        conv = schema.definition_converter(defn)
+        if conv is not None and node.text is not None:
+            node.text = conv(node.text)
+        stack.extend(node.nodes)
+
+
+class ConvertersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, content in [('root.xsd', SCHEMA), ('common.xsd', COMMON)]:
+            with open(os.path.join(self.tmpdir, name), 'w') as fh:
+                fh.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_table(self):
+        conv = xsd.Converters(
+            xsd.SchemaTypes(os.path.join(self.tmpdir, 'root.xsd')))
+        self.assertEqual({'item': xsd.float_array, 'flag': xsd.boolean},
+                         conv.text)
+        self.assertEqual({'root': {'count': int},
+                          'item': {'weight': float}}, conv.attrib)
+        attrib, text = conv.cast('item', {'weight': '0.5'}, '1 2')
+        self.assertEqual({'weight': 0.5}, attrib)
+        self.assertEqual([1., 2.], text.tolist())
+        with self.assertRaises(ValueError) as ctx:
+            conv.cast('root', {'count': 'x'}, None)
+        self.assertIn('root[count]', str(ctx.exception))
+
+    def test_numeric_list_tags(self):
+        self.assertEqual(
+            set(['IML', 'IMLs', 'abscissa', 'coefficientsVariation',
+                 'lossRatio', 'lossRatios', 'losses', 'lowerCorner',
+                 'occurRates', 'ordinate', 'periods', 'poEs', 'pos',
+                 'posList', 'upperCorner']),
+            xsd.numeric_list_tags())
+
+    def test_cast_elem(self):
+        conv = xsd.converters()
+        sites = [conv.cast_elem(elem)[0] for elem in
+                 openquake.nrmllib.iterelements(
+                     'examples/site_model.xml', ['site'])]
+        self.assertEqual(5, len(sites))
+        self.assertEqual({'lon': -122.5, 'lat': 37.5, 'vs30': 800.0,
+                          'vs30Type': 'measured', 'z1pt0': 100.0,
+                          'z2pt5': 5.0}, sites[0])
+
+        xml = _utils.site_model(1).replace('760.0', 'fast')
+        elements = openquake.nrmllib.iterelements(
+            StringIO.StringIO(xml), ['site'], validate=False)
+        with self.assertRaises(ValueError) as ctx:
+            for elem in elements:  # the elements are cleared afterwards
+                conv.cast_elem(elem)
+        self.assertIn('site[vs30]', str(ctx.exception))
+
+    def test_cast_node(self):
+        root = n.node_from_nrml('examples/hazard-curves-pga.xml')
+        self.assertIs(root, xsd.converters().cast_node(root))
+        curves = root.hazardCurves
+        self.assertEqual(50.0, curves['investigationTime'])
+        self.assertEqual('PGA', curves['IMT'])
+        self.assertEqual([0.98728, 0.98266, 0.94957],
+                         curves.hazardCurve.poEs.text.tolist())
+
+        # the typed nodes are serialized back into valid NRML
+        out = StringIO.StringIO()
+        n.node_to_nrml(n.node_from_elem(n.node_to_elem(curves)), out)
+        self.assertIn('investigationTime="50.0"', out.getvalue())
+        self.assertEqual(curves, xsd.converters().cast_node(
+            n.node_from_nrml(StringIO.StringIO(out.getvalue()),
+                             validate=False).hazardCurves))
+
+    def test_cast_lazy_node(self):
+        xml = _utils.site_model(10)
+        root = xsd.converters().cast_node(n.node_from_nrml(
+            StringIO.StringIO(xml), lazy=True))
+        vs30 = [site['vs30'] for site in root.siteModel]
+        self.assertEqual(10, len(vs30))
+        self.assertIsInstance(vs30[0], float)
+
+    def test_compiled(self):
+        xml = _utils.hazard_curves(1000)
+        schema = xsd.SchemaTypes()
+        # two fresh trees, since the trees are cast in place
+        compiled, uncompiled = [
+            n.node_from_nrml(StringIO.StringIO(xml), validate=False)
+            for _ in range(2)]
+        xsd.Converters(schema).cast_node(compiled)
+        _uncompiled_cast(schema, uncompiled)
+        self.assertEqual(compiled, uncompiled)
+        self.assertIsInstance(
+            compiled.hazardCurves.hazardCurve.poEs.text, numpy.ndarray)
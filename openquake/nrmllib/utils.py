@@ -15,6 +15,9 @@
 
 ################### string manipulation routines for NRML ####################
 
+import re
+import numpy
+
 _LINESTRING_FMT = 'LINESTRING(%s)'
 _POLYGON_FMT = 'POLYGON((%s))'
 
@@ -78,3 +81,64 @@ def coords_to_linestr_wkt(coords, dims):
     points = _group_point_coords(coords, dims)
 
     return _make_wkt(_LINESTRING_FMT, points)
+
+
+############################### WKT codec ####################################
+
+_WKT_RE = re.compile(
+    r'^\s*(POINT|LINESTRING|POLYGON)\s*(?:Z\s*)?\((.*)\)\s*$',
+    re.IGNORECASE | re.DOTALL)
+_WKT_FMT = {'POINT': 'POINT(%s)', 'LINESTRING': _LINESTRING_FMT,
+            'POLYGON': _POLYGON_FMT}
+
+
+def wkt_to_coords(wkt):
+    """
+    Parse a POINT, LINESTRING or POLYGON ``wkt`` string (2D or 3D) into a
+    2D array of shape (number of points, number of dimensions). Only the
+    exterior ring of a polygon is returned; interior rings are ignored.
+
+    >>> wkt_to_coords('LINESTRING(1 2 3, -4 5 6.5)').tolist()
+    [[1.0, 2.0, 3.0], [-4.0, 5.0, 6.5]]
+
+    :param str wkt:
+        Well-known text representation of the geometry.
+    :raises:
+        :exc:`ValueError` if the geometry type is not supported or a
+        coordinate is not a number.
+    """
+    match = _WKT_RE.match(wkt)
+    if match is None:
+        raise ValueError('Unsupported or invalid WKT: %r' % wkt[:100])
+    body = match.group(2)
+    if match.group(1).upper() == 'POLYGON':
+        body = body.split(')', 1)[0]  # only the exterior ring
+    body = body.strip(' \t\r\n(')
+    dims = len(body.split(',', 1)[0].split())
+    try:
+        coords = numpy.array(body.replace(',', ' ').split(), float)
+    except ValueError:  # a malformed token
+        coords = ()
+    if dims == 0 or not len(coords) or len(coords) % dims:
+        raise ValueError('Invalid coordinates in WKT: %r' % wkt[:100])
+    return coords.reshape(-1, dims)
+
+
+def coords_to_wkt(geom_type, coords):
+    """
+    Format a 2D array (or a sequence of point pairs or triples) as WKT.
+    POLYGON rings are closed automatically, if needed.
+
+    >>> coords_to_wkt('POLYGON', [[1, 2], [3, 4], [5, 6]])
+    'POLYGON((1.0 2.0, 3.0 4.0, 5.0 6.0, 1.0 2.0))'
+
+    :param str geom_type:
+        One of 'POINT', 'LINESTRING', 'POLYGON'.
+    :param coords:
+        A 2D array-like object of shape (number of points, dimensions).
+    """
+    points = numpy.asarray(coords, dtype=float).tolist()
+    if geom_type == 'POLYGON' and points[0] != points[-1]:
+        points.append(points[0])
+    return _make_wkt(_WKT_FMT[geom_type],
+                     [[repr(x) for x in pt] for pt in points])
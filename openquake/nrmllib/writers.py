@@ -17,6 +17,27 @@ import cStringIO
 from xml.sax.saxutils import escape, quoteattr
 
 
+def totext(value):
+    """
+    Convert the text or an attribute value of a node into a string:
+    numbers are written with repr, to preserve their precision, booleans
+    as in XML Schema and sequences of numbers (such as numpy arrays) as
+    space-separated lists.
+
+    >>> totext(0.1), totext([1, 2.5]), totext(True), totext('x')
+    ('0.1', '1 2.5', 'true', 'x')
+    """
+    if isinstance(value, basestring):
+        return value
+    if hasattr(value, 'tolist'):  # numpy array or scalar
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return ' '.join(map(totext, value))
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
 class StreamingXMLWriter(object):
     """
     A stream-based XML writer. The typical usage is something like this::
@@ -46,7 +67,7 @@ class StreamingXMLWriter(object):
 
     def emptyElement(self, name, attrs):
         """Add an empty element (may have attributes)"""
-        attr = ' '.join('%s=%s' % (n, quoteattr(v))
+        attr = ' '.join('%s=%s' % (n, quoteattr(totext(v)))
                         for n, v in sorted(attrs.iteritems()))
         self._write('<%s %s/>' % (name, attr))
 
@@ -57,7 +78,7 @@ class StreamingXMLWriter(object):
         else:
             self._write('<' + name)
             for (name, value) in sorted(attrs.items()):
-                self._write(' %s=%s' % (name, quoteattr(value)))
+                self._write(' %s=%s' % (name, quoteattr(totext(value))))
             self._write('>')
         self.indentlevel += 1
 
@@ -75,12 +96,15 @@ class StreamingXMLWriter(object):
 
     def serialize(self, node):
         """Serialize a node object (typically an ElementTree object)"""
-        if not node and not node.text:
+        text = node.text
+        if text is not None and not isinstance(text, basestring):
+            text = totext(text)
+        if not node and not text:
             self.emptyElement(node.tag, node.attrib)
             return
         self.start_tag(node.tag, node.attrib)
-        if node.text:
-            self._write(escape(node.text.strip()))
+        if text:
+            self._write(escape(text.strip()))
         for subnode in node:
             self.serialize(subnode)
         self.end_tag(node.tag)
@@ -0,0 +1,393 @@
+# Copyright (c) 2014, GEM Foundation.
+#
+# NRML is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# NRML is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with NRML.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Information about the types of the NRML elements, extracted from the XSD
+files of the schema (`schema/nrml.xsd` and the files it includes or
+imports). The schema files are read once per process, the first time the
+information is needed.
+
+>>> tags = numeric_list_tags()
+>>> 'poEs' in tags, 'IMLs' in tags, 'posList' in tags
+(True, True, True)
+>>> 'description' in tags
+False
+"""
+
+import os
+import itertools
+
+import numpy
+from lxml import etree
+
+from openquake import nrmllib
+
+XS = '{http://www.w3.org/2001/XMLSchema}'
+
+#: The XSD built-in numeric types, the ones derived by restriction
+#: included
+NUMERIC_TYPES = frozenset([
+    'double', 'float', 'decimal', 'integer', 'long', 'int', 'short',
+    'byte', 'nonNegativeInteger', 'nonPositiveInteger', 'positiveInteger',
+    'negativeInteger', 'unsignedLong', 'unsignedInt', 'unsignedShort',
+    'unsignedByte'])
+
+#: The numeric types converted into Python integers
+INTEGER_TYPES = NUMERIC_TYPES - frozenset(['double', 'float', 'decimal'])
+
+_CONVERTERS = None  # defined in converters
+_NUMERIC_LIST_TAGS = None  # defined in numeric_list_tags
+
+
+def _local(name):
+    """
+    Strip the prefix from a qualified name like 'gml:doubleList'.
+    """
+    return name.rsplit(':', 1)[-1]
+
+
+def boolean(text):
+    """
+    Convert the lexical forms of xs:boolean into a Python boolean.
+
+    >>> boolean('true'), boolean(' 0 ')
+    (True, False)
+    """
+    text = text.strip()
+    if text in ('true', '1'):
+        return True
+    elif text in ('false', '0'):
+        return False
+    raise ValueError('Not a boolean: %r' % text)
+
+
+def float_array(text):
+    """
+    Convert a whitespace-separated list of numbers into a numpy array.
+
+    >>> float_array('1 2.5').tolist()
+    [1.0, 2.5]
+    """
+    return numpy.array(text.split(), float)
+
+
+def schema_documents(fname=None):
+    """
+    Yields the root elements of a schema file and of all the files it
+    includes or imports, each one once.
+
+    :param fname: the schema file; by default the NRML schema
+    """
+    todo = [os.path.abspath(fname or nrmllib.nrml_schema_file())]
+    seen = set()
+    while todo:
+        fname = todo.pop()
+        if fname in seen:
+            continue
+        seen.add(fname)
+        root = etree.parse(fname).getroot()
+        yield root
+        for elem in root.iterchildren(XS + 'include', XS + 'import'):
+            location = elem.get('schemaLocation')
+            if location:
+                todo.append(os.path.normpath(
+                    os.path.join(os.path.dirname(fname), location)))
+
+
+class SchemaTypes(object):
+    """
+    The named types and the element declarations of a schema. The type
+    names are stored without prefixes, since there are no clashes
+    between the namespaces used by NRML.
+
+    :param fname: the schema file; by default the NRML schema
+    """
+    def __init__(self, fname=None):
+        self.types = {}  # name -> simpleType or complexType element
+        self.groups = {}  # name -> attributeGroup element
+        self.elements = []  # element declarations, global and local
+        for root in schema_documents(fname):
+            for elem in root.iterchildren(
+                    XS + 'simpleType', XS + 'complexType'):
+                self.types[elem.get('name')] = elem
+            for elem in root.iterchildren(XS + 'attributeGroup'):
+                self.groups[elem.get('name')] = elem
+            self.elements.extend(
+                elem for elem in root.iter(XS + 'element')
+                if elem.get('name'))
+        self._cache = {}
+
+    def definition(self, elem):
+        """
+        Returns the type definition of an element declaration: a named
+        type, an anonymous type, or None for the built-in types.
+        """
+        typename = elem.get('type')
+        if typename is not None:
+            return self.types.get(_local(typename))
+        for child in elem.iterchildren(XS + 'simpleType', XS + 'complexType'):
+            return child
+
+    def converter(self, typename):
+        """
+        Returns the function converting a string into a value of the named
+        type: `int`, `float`, :func:`boolean`, :func:`float_array` or
+        None if the value is kept as a string.
+        """
+        name = _local(typename)
+        if name in INTEGER_TYPES:
+            return int
+        elif name in NUMERIC_TYPES:
+            return float
+        elif name == 'boolean':
+            return boolean
+        return self.definition_converter(self.types.get(name))
+
+    def definition_converter(self, defn):
+        """
+        Returns the function converting the text of a value of the type
+        definition `defn`, as :meth:`converter`. The complex types with a
+        simple content are converted as their content.
+        """
+        if defn is None:
+            return None
+        try:
+            return self._cache[defn]
+        except KeyError:
+            self._cache[defn] = None  # protect against cycles
+        content = defn
+        if defn.tag == XS + 'complexType':
+            content = defn.find(XS + 'simpleContent')
+        derivation = None
+        if content is not None:
+            for derivation in content.iterchildren(
+                    XS + 'list', XS + 'restriction', XS + 'extension'):
+                break
+        result = None
+        if derivation is None:
+            pass
+        elif derivation.tag == XS + 'list':
+            item = derivation.get('itemType')
+            if item is not None:
+                item = self.converter(item)
+            else:  # anonymous item type
+                item = self.definition_converter(
+                    derivation.find(XS + 'simpleType'))
+            if item in (int, float):
+                result = float_array
+        elif derivation.get('base'):  # restriction or extension
+            result = self.converter(derivation.get('base'))
+        else:  # restriction of an anonymous type
+            result = self.definition_converter(
+                derivation.find(XS + 'simpleType'))
+        self._cache[defn] = result
+        return result
+
+    def is_numeric(self, typename):
+        """
+        True if the named type is an atomic numeric type.
+        """
+        return self.converter(typename) in (int, float)
+
+    def is_numeric_list(self, defn):
+        """
+        True if the type definition `defn` is a list of numbers, or a
+        complex type with such a content.
+        """
+        return self.definition_converter(defn) is float_array
+
+    def attribute_converters(self, defn):
+        """
+        Returns a dictionary with the converters of the attributes of a
+        complex type, the inherited ones included; the string attributes
+        are not in the dictionary.
+        """
+        converters = {}
+        if defn is None or defn.tag != XS + 'complexType':
+            return converters
+        for attr in self._attributes(defn, set()):
+            name = attr.get('name')
+            if name is None:  # a reference to a global attribute
+                continue
+            if attr.get('type') is not None:
+                conv = self.converter(attr.get('type'))
+            else:
+                conv = self.definition_converter(attr.find(XS + 'simpleType'))
+            if conv is not None:
+                converters[name] = conv
+        return converters
+
+    def _attributes(self, defn, seen):
+        # yields the attribute declarations of a complex type or of
+        # an attribute group, recursively
+        if defn in seen:
+            return
+        seen.add(defn)
+        for child in defn.iterchildren():
+            if child.tag == XS + 'attribute':
+                yield child
+            elif child.tag == XS + 'attributeGroup':
+                group = self.groups.get(_local(child.get('ref', '')))
+                if group is not None:
+                    for attr in self._attributes(group, seen):
+                        yield attr
+            elif child.tag in (XS + 'simpleContent', XS + 'complexContent'):
+                for derivation in child.iterchildren(
+                        XS + 'extension', XS + 'restriction'):
+                    base = self.types.get(_local(derivation.get('base', '')))
+                    if base is not None and base.tag == XS + 'complexType':
+                        for attr in self._attributes(base, seen):
+                            yield attr
+                    for attr in self._attributes(derivation, seen):
+                        yield attr
+
+
+def _merge(dic, key, conv):
+    # store the converter of a key; the keys declared with different
+    # types are stored with a converter None (i.e. kept as strings)
+    if key in dic and dic[key] is not conv:
+        dic[key] = None
+    else:
+        dic[key] = conv
+
+
+class Converters(object):
+    """
+    The table of the functions converting the text and the attributes of
+    the NRML elements into Python values (`int`, `float`, `bool` or
+    numpy arrays for the lists of numbers), generated from the schema.
+    The elements are identified by their unqualified tag; if a tag has
+    declarations with different types, its values are kept as strings.
+
+    :param schema: a :class:`SchemaTypes` instance; by default the NRML one
+
+    >>> conv = converters()
+    >>> conv.cast('site', {'lon': '1.5', 'vs30Type': 'inferred'}, None)
+    ({'vs30Type': 'inferred', 'lon': 1.5}, None)
+    >>> conv.cast('poEs', {}, '0.1 0.02')[1].tolist()
+    [0.1, 0.02]
+    """
+    def __init__(self, schema=None):
+        schema = schema or SchemaTypes()
+        text, attrib = {}, {}
+        for elem in schema.elements:
+            tag = elem.get('name')
+            defn = schema.definition(elem)
+            if elem.get('type') is not None:
+                conv = schema.converter(elem.get('type'))
+            else:
+                conv = schema.definition_converter(defn)
+            _merge(text, tag, conv)
+            convs = attrib.setdefault(tag, {})
+            for name, conv in schema.attribute_converters(defn).iteritems():
+                _merge(convs, name, conv)
+        #: unqualified tag -> converter of the text
+        self.text = dict((tag, conv) for tag, conv in text.iteritems()
+                         if conv is not None)
+        #: unqualified tag -> {attribute name: converter}
+        self.attrib = {}
+        for tag, convs in attrib.iteritems():
+            convs = dict((name, conv) for name, conv in convs.iteritems()
+                         if conv is not None)
+            if convs:
+                self.attrib[tag] = convs
+        self._qualified = {}  # cache used by cast_elem
+
+    def cast(self, tag, attrib, text):
+        """
+        Convert the attributes and the text of an element with the given
+        unqualified tag. The values which are not strings are left
+        untouched.
+
+        :returns: a pair (a new attribute dictionary, the converted text)
+        """
+        attrib = dict(attrib)
+        name = tag
+        try:
+            convs = self.attrib.get(tag)
+            if convs:
+                for name, conv in convs.iteritems():
+                    value = attrib.get(name)
+                    if isinstance(value, basestring):
+                        attrib[name] = conv(value)
+            name = None
+            conv = self.text.get(tag)
+            if conv is not None and isinstance(text, basestring):
+                text = conv(text)
+        except ValueError as e:
+            raise ValueError('%s%s: %s' % (
+                tag, '' if name is None else '[%s]' % name, e))
+        return attrib, text
+
+    def cast_elem(self, elem):
+        """
+        Convert the attributes and the text of an lxml element, for
+        instance one coming from :func:`openquake.nrmllib.iterelements`.
+
+        :returns: a pair (attribute dictionary, converted text)
+        """
+        tag = elem.tag
+        local = self._qualified.get(tag)
+        if local is None:
+            local = self._qualified[tag] = tag.rsplit('}', 1)[-1]
+        try:
+            return self.cast(local, elem.attrib, elem.text)
+        except ValueError as e:
+            raise ValueError('line %s: %s' % (elem.sourceline, e))
+
+    def cast_node(self, root):
+        """
+        Convert in place the attributes and the texts of a node and of
+        all its subnodes, in a single pass; the tree is walked
+        iteratively. The lazy subnodes are converted when they are
+        generated.
+
+        :returns: the root node
+        """
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.attrib, node.text = self.cast(
+                node.tag, node.attrib, node.text)
+            if isinstance(node.nodes, list):
+                stack.extend(node.nodes)
+            else:
+                node.nodes = itertools.imap(self.cast_node, node.nodes)
+        return root
+
+
+def converters():
+    """
+    Returns the :class:`Converters` of the NRML schema, generated the
+    first time the function is called.
+    """
+    global _CONVERTERS
+    if _CONVERTERS is None:
+        _CONVERTERS = Converters()
+    return _CONVERTERS
+
+
+def numeric_list_tags():
+    """
+    Returns the set of the (unqualified) tags of the elements whose text
+    is a list of numbers in every declaration of the NRML schema, such as
+    `poEs`, `IMLs` or `gml:posList`.
+    """
+    global _NUMERIC_LIST_TAGS
+    if _NUMERIC_LIST_TAGS is None:
+        _NUMERIC_LIST_TAGS = frozenset(
+            tag for tag, conv in converters().text.iteritems()
+            if conv is float_array)
+    return _NUMERIC_LIST_TAGS
@@ -92,6 +92,12 @@ setup(
         'Topic :: Scientific/Engineering',
     ),
     namespace_packages=['openquake'],
+    entry_points={
+        'console_scripts': [
+            'nrml-validate = openquake.nrmllib.commands.validate:run',
+            'nrml-convert = openquake.nrmllib.commands.convert:run',
+        ],
+    },
 
     zip_safe=False,
 
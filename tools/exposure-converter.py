@@ -2,13 +2,39 @@
 """
 This script convert an exposure document from the old 0.4 format to
 the new one (which is always nrml 0.4) where each cost type has its
-proper <cost> tag
+proper <cost> tag.
+
+The conversion is a streaming pipeline: the old document is read with
+iterparse, one asset definition at the time, and the new one is written
+with an lxml `xmlfile`, so that the memory occupation does not depend
+on the number of assets. The progress is reported on stderr::
+
+ $ exposure-converter.py old-exposure.xml new-exposure.xml
+ converted 100000 assets (8% of the input) in 3.1s
+ ...
+
+With --benchmark N a synthetic old exposure with N assets is generated
+in a temporary directory and converted, reporting the speed and the
+peak memory::
+
+ $ exposure-converter.py --benchmark 1000000
 """
 
+import os
 import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+
 from lxml import etree
 from openquake import nrmllib
 
+COST_TYPES = (("coco", "contents"),
+              ("stco", "structural"),
+              ("nonStco", "nonstructural"))
+
 
 def namespace(gml=False):
     if gml:
@@ -42,112 +68,250 @@ def safe_set(element, attr, value):
         element.set(attr, value)
 
 
-def convert(filename, output_filename):
-    exposure = etree.parse(file(filename)).getroot()
-
-    with open(output_filename, "w") as output:
-        root = etree.Element("nrml", nsmap={None: nrmllib.NAMESPACE})
-
-        exposure_model = etree.SubElement(root, "exposureModel")
-        safe_set(exposure_model, 'id', get(
-            find(exposure, "exposureModel"), "id", gml=True))
-
-        safe_set(exposure_model,
-                 'category',
-                 get(find(exposure, "exposureList"), "assetCategory"))
-
-        safe_set(exposure_model,
-                 'taxonomySource',
-                 text(exposure, "taxonomySource"))
-
-        description = etree.SubElement(exposure_model, "description")
-        description.text = find(exposure, "description", True).text
-
-        conversions = etree.SubElement(exposure_model, "conversions")
-        if get(find(exposure, 'exposureList'), "areaUnit"):
-            element = etree.SubElement(conversions, "area")
-            safe_set(element, 'unit',
-                     get(find(exposure, 'exposureList'), "areaUnit"))
-            safe_set(
-                element, 'type',
-                get(find(exposure, 'exposureList'), "areaType"))
-
-        costTypes = {}
-        types_el = etree.SubElement(conversions, "costTypes")
-
-        for el, new_el in (("coco", "contents"),
-                           ("stco", "structural"),
-                           ("nonStco", "nonstructural")):
-            if get(find(exposure, 'exposureList'), "%sUnit" % el):
-                costTypes[el] = etree.SubElement(types_el, "costType")
-                costTypes[el].set('name', new_el)
-                safe_set(costTypes[el], 'unit',
-                         get(find(exposure, 'exposureList'), "%sUnit" % el))
+def read_exposure(source):
+    """
+    Read an old exposure document in streaming mode. Yields first a
+    dictionary with the information needed by the header of the new
+    document, then the <assetDefinition> elements, which are discarded
+    as soon as the next one is read.
+
+    :param source: a filename or a file-like object
+    """
+    asset_tag = namespace() + "assetDefinition"
+    header = {}
+    events = etree.iterparse(
+        source, events=("start", "end"), tag=[
+            namespace() + "exposureModel", namespace() + "exposureList",
+            namespace() + "taxonomySource", namespace(True) + "description",
+            asset_tag])
+    for event, element in events:
+        if element.tag == asset_tag:
+            if event == "start":
+                if header is not None:  # the first asset
+                    yield header
+                    header = None
+                continue
+            yield element
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        elif header is None:  # tags after the first asset are ignored
+            continue
+        elif element.tag in (namespace() + "exposureModel",
+                             namespace() + "exposureList"):
+            if event == "start":
+                header.setdefault(element.tag, dict(element.attrib))
+        elif event == "end":  # taxonomySource or gml:description
+            header.setdefault(element.tag, element.text)
+    if header is not None:  # no assets
+        yield header
+
+
+def convert_header(header):
+    """
+    Build the elements of the new document preceding the assets.
+
+    :param header: the dictionary yielded first by :func:`read_exposure`
+    :returns: the exposureModel attributes and a list of elements
+    """
+    exposure_list = header.get(namespace() + "exposureList", {})
+    exposure_model = etree.Element("exposureModel")
+    safe_set(exposure_model, 'id', header.get(
+        namespace() + "exposureModel", {}).get(namespace(True) + "id"))
+    safe_set(exposure_model, 'category', exposure_list.get("assetCategory"))
+    safe_set(exposure_model, 'taxonomySource',
+             header.get(namespace() + "taxonomySource"))
+
+    description = etree.Element("description")
+    description.text = header[namespace(True) + "description"]
+
+    conversions = etree.Element("conversions")
+    if exposure_list.get("areaUnit"):
+        element = etree.SubElement(conversions, "area")
+        safe_set(element, 'unit', exposure_list.get("areaUnit"))
+        safe_set(element, 'type', exposure_list.get("areaType"))
+
+    costTypes = {}
+    types_el = etree.SubElement(conversions, "costTypes")
+    for el, new_el in COST_TYPES:
+        if exposure_list.get("%sUnit" % el):
+            costTypes[el] = etree.SubElement(types_el, "costType")
+            costTypes[el].set('name', new_el)
+            safe_set(costTypes[el], 'unit', exposure_list.get("%sUnit" % el))
+            safe_set(costTypes[el], 'type', exposure_list.get("%sType" % el))
+
+    reco_unit = exposure_list.get("recoUnit")
+    reco_type = exposure_list.get("recoType")
+    if reco_type is not None:
+        costTypes["stco"].set("retrofittedType", reco_type)
+        costTypes["stco"].set("retrofittedUnit", reco_unit)
+    return exposure_model.attrib, [description, conversions]
+
+
+def convert_asset(asset_element):
+    """
+    Convert an old <assetDefinition> element into a new <asset> element.
+    """
+    element = etree.Element("asset")
+    safe_set(element, "id", get(asset_element, "id", gml=True))
+    safe_set(element, "taxonomy", text(asset_element, "taxonomy"))
+    safe_set(element, "area", text(asset_element, "area"))
+    safe_set(element, "number", text(asset_element, "number"))
+
+    location = etree.SubElement(element, "location")
+    lon, lat = find(asset_element, "pos", True).text.split()
+    safe_set(location, "lon", lon)
+    safe_set(location, "lat", lat)
+
+    costs = etree.SubElement(element, "costs")
+    for el, cost_type in COST_TYPES:
+        if text(asset_element, el) is not None:
+            cost = etree.SubElement(costs, "cost")
+            safe_set(cost, "type", cost_type)
+            safe_set(cost, "value", text(asset_element, el))
+
+            if cost_type == "structural":
+                safe_set(cost, "retrofitted", text(asset_element, "reco"))
+                safe_set(
+                    cost, "deductible", text(asset_element, "deductible"))
                 safe_set(
-                    costTypes[el], 'type',
-                    get(find(exposure, 'exposureList'), "%sType" % el))
-
-        reco_unit = get(find(exposure, 'exposureList'), "recoUnit")
-        reco_type = get(find(exposure, 'exposureList'), "recoType")
-        if reco_type is not None:
-            costTypes["stco"].set("retrofittedType", reco_type)
-            costTypes["stco"].set("retrofittedUnit", reco_unit)
-
-        assets = etree.SubElement(exposure_model, "assets")
-
-        for asset_element in exposure.findall(
-                ".//{%s}assetDefinition" % nrmllib.NAMESPACE):
-            element = etree.SubElement(assets, "asset")
-
-            safe_set(element, "id", get(asset_element, "id", gml=True))
-            safe_set(element, "taxonomy", text(asset_element, "taxonomy"))
-            safe_set(element, "area", text(asset_element, "area"))
-            safe_set(element, "number", text(asset_element, "number"))
-
-            location = etree.SubElement(element, "location")
-            lon, lat = find(asset_element, "pos", True).text.split()
-            safe_set(location, "lon", lon)
-            safe_set(location, "lat", lat)
-
-            costs = etree.SubElement(element, "costs")
-            for el, cost_type in (("coco", "contents"),
-                                  ("stco", "structural"),
-                                  ("nonStco", "nonstructural")):
-                if text(asset_element, el) is not None:
-                    cost = etree.SubElement(costs, "cost")
-                    safe_set(cost, "type", cost_type)
-                    safe_set(cost, "value", text(asset_element, el))
-
-                    if cost_type == "structural":
-                        safe_set(
-                            cost,
-                            "retrofitted", text(asset_element, "reco"))
-                        safe_set(
-                            cost,
-                            "deductible", text(asset_element, "deductible"))
-                        safe_set(
-                            cost,
-                            "insuranceLimit", text(asset_element, "limit"))
-
-            if find(asset_element, "occupants") is not None:
-                occupancies = etree.SubElement(element, "occupancies")
-                for occ in asset_element.findall(
-                        ".//{%s}occupants" % nrmllib.NAMESPACE):
-                    new_occ = etree.SubElement(occupancies, "occupancy")
-                    new_occ.set("occupants", occ.text)
-                    new_occ.set("period", get(occ, "description"))
-
-        output.write(etree.tostring(root,
-                                    pretty_print=True,
-                                    xml_declaration=True,
-                                    encoding="UTF-8"))
+                    cost, "insuranceLimit", text(asset_element, "limit"))
+
+    occupants = asset_element.findall(".//{%s}occupants" % nrmllib.NAMESPACE)
+    if occupants:
+        occupancies = etree.SubElement(element, "occupancies")
+        for occ in occupants:
+            new_occ = etree.SubElement(occupancies, "occupancy")
+            new_occ.set("occupants", occ.text)
+            new_occ.set("period", get(occ, "description"))
+    return element
+
+
+def convert(filename, output_filename, progress=None, every=100000):
+    """
+    Convert an old exposure file into a new one, in constant memory: the
+    assets are read with iterparse and written with an lxml `xmlfile`,
+    one at the time.
+
+    :param progress:
+        a function called every `every` assets, and at the end, with the
+        number of assets converted and the fraction of the input read
+    :returns: the number of assets converted
+    """
+    size = os.path.getsize(filename)
+    n = 0
+    with open(filename) as source, open(output_filename, "w") as output:
+        exposure = read_exposure(source)
+        attrs, elements = convert_header(next(exposure))
+        with etree.xmlfile(output, encoding="UTF-8") as xf:
+            xf.write_declaration()
+            with xf.element("nrml", nsmap={None: nrmllib.NAMESPACE}):
+                xf.write("\n")
+                with xf.element("exposureModel", attrs):
+                    xf.write("\n")
+                    for element in elements:
+                        xf.write(element, pretty_print=True)
+                    with xf.element("assets"):
+                        xf.write("\n")
+                        for asset_element in exposure:
+                            xf.write(convert_asset(asset_element),
+                                     pretty_print=True)
+                            n += 1
+                            if progress and n % every == 0:
+                                progress(n, float(source.tell()) / size)
+    if progress and n % every:
+        progress(n, 1.)
+    return n
+
+
+def legacy_exposure(n):
+    """
+    Generate the lines of a synthetic exposure with `n` assets in the
+    old format, for testing and benchmarking.
+    """
+    yield '''\
+<?xml version="1.0" encoding="UTF-8"?>
+<nrml xmlns:gml="http://www.opengis.net/gml"
+      xmlns="http://openquake.org/xmlns/nrml/0.4" gml:id="n1">
+  <exposureModel gml:id="ep1">
+    <exposureList gml:id="PAV01" assetCategory="buildings"
+                  areaType="per_asset" areaUnit="GBP"
+                  cocoType="per_area" cocoUnit="CHF"
+                  recoType="aggregated" recoUnit="EUR"
+                  stcoType="aggregated" stcoUnit="USD">
+      <gml:description>Synthetic exposure</gml:description>
+      <taxonomySource>Synthetic taxonomy</taxonomySource>
+'''
+    for i in xrange(n):
+        yield '''\
+      <assetDefinition gml:id="asset_%d">
+        <site><gml:Point><gml:pos>%.5f %.5f</gml:pos></gml:Point></site>
+        <area>%d</area>
+        <coco>12.95</coco>
+        <deductible>66</deductible>
+        <limit>1999</limit>
+        <number>%d</number>
+        <reco>109876</reco>
+        <stco>%d</stco>
+        <taxonomy>RC/DMRF-D/LR</taxonomy>
+        <occupants description="day">%d</occupants>
+        <occupants description="night">%d</occupants>
+      </assetDefinition>
+''' % (i, i % 1000 * 0.001, i // 1000 % 1000 * 0.001, 100 + i % 50,
+       1 + i % 9, 100000 + i % 1000, i % 20, i % 30)
+    yield '''\
+    </exposureList>
+  </exposureModel>
+</nrml>
+'''
+
+
+def report(n, fraction, t0):
+    sys.stderr.write("converted %d assets (%d%% of the input) in %.1fs\n"
+                     % (n, fraction * 100, time.time() - t0))
+
+
+def benchmark(n):
+    """
+    Convert a synthetic old exposure with `n` assets and report the
+    speed and the peak memory occupation of the process.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        old = os.path.join(tmpdir, "old-exposure.xml")
+        with open(old, "w") as f:
+            f.writelines(legacy_exposure(n))
+        size = os.path.getsize(old)
+        t0 = time.time()
+        convert(old, os.path.join(tmpdir, "new-exposure.xml"),
+                lambda n, fraction: report(n, fraction, t0))
+        dt = time.time() - t0
+    finally:
+        shutil.rmtree(tmpdir)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "%d assets (%.1f MB) in %.1fs: %.0f assets/s, peak memory %d MB" % (
+        n, size / 1E6, dt, n / dt, maxrss // 1024)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert an exposure from the old 0.4 format.')
+    parser.add_argument('filename', nargs='?', help='file to convert')
+    parser.add_argument('new_filename', nargs='?', help='new file')
+    parser.add_argument('--benchmark', type=int, metavar='N',
+                        help='convert a synthetic exposure with N assets')
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.new_filename:
+        t0 = time.time()
+        convert(args.filename, args.new_filename,
+                lambda n, fraction: report(n, fraction, t0))
+    else:
+        parser.print_usage()
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
-    if len(sys.argv) <= 2:
-        print "Usage: %s <filename to convert> <new filename>" % (
-            sys.argv[0])
-        sys.exit(1)
-
-    convert(sys.argv[1], sys.argv[2])
-    sys.exit(0)
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+"""
+This script checks that the streaming readers of NRML work in constant
+memory on large synthetic documents, generated on the fly, by reporting
+the resident memory of the process after 10% of the items and at the
+end::
+
+ $ memory-benchmark.py site-model 1000000
+ site-model: 1000000 items in 21.5s, 46503 items/s, memory 42.1 MB
+ after 100000 items, 42.1 MB at the end (+0.0 MB)
+
+The readers are:
+
+* site-model: SiteModelParser.parse
+* lazy-nodes: the sites of a site model read with node_from_nrml in lazy
+  mode
+"""
+
+import sys
+import time
+import argparse
+
+from openquake.nrmllib import node
+from openquake.nrmllib.hazard import parsers
+from openquake.nrmllib.benchmark import rss, site_model_file
+
+
+def site_model(n):
+    """Parse a site model with `n` sites, yielding the sites"""
+    return parsers.SiteModelParser(site_model_file(n)).parse()
+
+
+def lazy_nodes(n):
+    """Read a site model with `n` sites lazily, yielding the site nodes"""
+    root = node.node_from_nrml(site_model_file(n), lazy=True)
+    return root.siteModel.nodes
+
+
+#: name -> function generating the items read from a document with
+#: the given number of items
+READERS = {'site-model': site_model, 'lazy-nodes': lazy_nodes}
+
+
+def benchmark(name, n):
+    """
+    Read a document with `n` items with the given reader and report the
+    speed and the growth of the resident memory.
+    """
+    t0 = time.time()
+    start = None
+    for i, _ in enumerate(READERS[name](n), 1):
+        if i == n // 10:
+            start = rss()
+    dt = time.time() - t0
+    end = rss()
+    if start is None:  # less than 10 items
+        start = end
+    print "%s: %d items in %.1fs, %.0f items/s, memory %.1f MB" % (
+        name, n, dt, n / dt, start / 1E6)
+    print "after %d items, %.1f MB at the end (%+.1f MB)" % (
+        n // 10, end / 1E6, (end - start) / 1E6)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the memory occupation of the NRML readers.')
+    parser.add_argument('reader', choices=sorted(READERS),
+                        help='reader to check')
+    parser.add_argument('items', type=int, nargs='?', default=1000000,
+                        help='number of items (default: 1000000)')
+    args = parser.parse_args(argv)
+    benchmark(args.reader, args.items)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+"""
+This script compares the speed and the memory occupation of the two ways
+of reading a site model: as a list of
+:class:`openquake.nrmllib.models.SiteModel` objects, with
+`SiteModelParser.parse`, and as a numpy structured array, with
+`SiteModelParser.parse_arrays`. A synthetic site model with N sites is
+generated in memory::
+
+ $ site-model-benchmark.py 20000
+ objects: 20000 sites in 0.36s, 56290 sites/s, 270 bytes/site
+ arrays: 20000 sites in 0.29s, 69874 sites/s, 41 bytes/site
+
+The timings are the best of a few repetitions.
+"""
+
+import sys
+import timeit
+import argparse
+import StringIO
+
+from openquake.nrmllib.hazard import parsers
+from openquake.nrmllib.benchmark import site_model, deep_getsizeof
+
+
+def parse_objects(xml):
+    return list(parsers.SiteModelParser(StringIO.StringIO(xml)).parse())
+
+
+def parse_arrays(xml):
+    return parsers.SiteModelParser(StringIO.StringIO(xml)).parse_arrays()
+
+
+def benchmark(n, repeat=3):
+    """
+    Parse a synthetic site model with `n` sites in both ways and report
+    the speed and the bytes per site.
+    """
+    xml = site_model(n)
+    for name, parse, getsize in [
+            ('objects', parse_objects, deep_getsizeof),
+            ('arrays', parse_arrays, lambda arrays: arrays.nbytes)]:
+        dt = min(timeit.repeat(lambda: parse(xml), repeat=repeat, number=1))
+        print "%s: %d sites in %.2fs, %.0f sites/s, %d bytes/site" % (
+            name, n, dt, n / dt, getsize(parse(xml)) // n)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the site model parser.')
+    parser.add_argument('sites', type=int, nargs='?', default=20000,
+                        help='number of sites (default: 20000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timings, the best is reported')
+    args = parser.parse_args(argv)
+    benchmark(args.sites, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())